@@ -73,6 +73,7 @@ from formats import getFormat
 from formats import get_device_format_class
 from formats import get_default_filesystem_type
 import devicefactory
+from snapshot import Snapshot
 from devicelibs.dm import name_from_dm_node
 from devicelibs.crypto import generateBackupPassphrase
 from devicelibs.edd import get_edd_dict
@@ -388,7 +389,7 @@ class Blivet(object):
         except Exception as e:
             log.error("failure tearing down device tree: %s" % e)
 
-    def reset(self, cleanupOnly=False):
+    def reset(self, cleanupOnly=False, disks=None):
         """ Reset storage configuration to reflect actual system state.
 
             This will cancel any queued actions and rescan from scratch but not
@@ -396,9 +397,15 @@ class Blivet(object):
 
             :keyword cleanupOnly: prepare the tree only to deactivate devices
             :type cleanupOnly: bool
+            :keyword disks: names of the only disks to rescan, or None for all
+            :type disks: list of str
+
+            With disks, only those disks and the devices on top of them are
+            rescanned and only the actions on them are canceled; the rest of
+            the device tree is kept.
 
             See :meth:`devicetree.Devicetree.populate` for more information
-            about the cleanupOnly keyword argument.
+            about the cleanupOnly and disks keyword arguments.
         """
         log.info("resetting Blivet (version %s) instance %s" % (__version__, self))
         if flags.installer_mode:
@@ -417,16 +424,19 @@ class Blivet(object):
             self.zfcp.startup()
             self.dasd = make_dasd_list(self.dasd, self.devices)
 
-        if self.dasd:
-            # Reset the internal dasd list (823534)
-            self.dasd = []
-
-        self.devicetree.reset(conf=self.config,
-                              passphrase=self.encryptionPassphrase,
-                              luksDict=self.__luksDevs,
-                              iscsi=self.iscsi,
-                              dasd=self.dasd)
-        self.devicetree.populate(cleanupOnly=cleanupOnly)
+        if disks is not None:
+            self.devicetree.populate(cleanupOnly=cleanupOnly, scope=disks)
+        else:
+            if self.dasd:
+                # Reset the internal dasd list (823534)
+                self.dasd = []
+
+            self.devicetree.reset(conf=self.config,
+                                  passphrase=self.encryptionPassphrase,
+                                  luksDict=self.__luksDevs,
+                                  iscsi=self.iscsi,
+                                  dasd=self.dasd)
+            self.devicetree.populate(cleanupOnly=cleanupOnly)
         self.fsset = FSSet(self.devicetree)
         self.eddDict = get_edd_dict(self.partitioned)
         if self.bootloader:
@@ -473,12 +483,32 @@ class Blivet(object):
         _all = set(self.devices)
         return list(_all.difference(used))
 
+    def _getSortedDevices(self, key, getter):
+        """ Return a list of devices sorted by name.
+
+            :param key: a key identifying the list
+            :param getter: a function that returns the unsorted devices
+            :type getter: callable
+            :returns: the sorted devices, computed once per tree generation
+            :rtype: list of :class:`~.devices.StorageDevice`
+        """
+        return self.devicetree._getView(("sorted", key),
+                                        lambda: sorted(getter(),
+                                                       key=lambda d: d.name))
+
+    def _getSortedDevicesByType(self, device_type):
+        getter = lambda: self.devicetree.getDevicesByType(device_type)
+        return self._getSortedDevices(("type", device_type), getter)
+
+    def _getSortedDevicesByFormatType(self, format_type):
+        getter = lambda: self.devicetree.getDevicesByFormatType(format_type)
+        return self._getSortedDevices(("formatType", format_type), getter)
+
     @property
     def devices(self):
         """ A list of all the devices in the device tree. """
-        devices = self.devicetree.devices
-        devices.sort(key=lambda d: d.name)
-        return devices
+        return self._getSortedDevices("devices",
+                                      lambda: self.devicetree.devices)
 
     @property
     def disks(self):
@@ -535,9 +565,8 @@ class Blivet(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        partitions = self.devicetree.getDevicesByInstance(PartitionDevice)
-        partitions.sort(key=lambda d: d.name)
-        return partitions
+        getter = lambda: self.devicetree.getDevicesByInstance(PartitionDevice)
+        return self._getSortedDevices("partitions", getter)
 
     @property
     def vgs(self):
@@ -547,9 +576,7 @@ class Blivet(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        vgs = self.devicetree.getDevicesByType("lvmvg")
-        vgs.sort(key=lambda d: d.name)
-        return vgs
+        return self._getSortedDevicesByType("lvmvg")
 
     @property
     def lvs(self):
@@ -559,9 +586,7 @@ class Blivet(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        lvs = self.devicetree.getDevicesByType("lvmlv")
-        lvs.sort(key=lambda d: d.name)
-        return lvs
+        return self._getSortedDevicesByType("lvmlv")
 
     @property
     def thinlvs(self):
@@ -571,9 +596,7 @@ class Blivet(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        thin = self.devicetree.getDevicesByType("lvmthinlv")
-        thin.sort(key=lambda d: d.name)
-        return thin
+        return self._getSortedDevicesByType("lvmthinlv")
 
     @property
     def thinpools(self):
@@ -583,9 +606,7 @@ class Blivet(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        pools = self.devicetree.getDevicesByType("lvmthinpool")
-        pools.sort(key=lambda d: d.name)
-        return pools
+        return self._getSortedDevicesByType("lvmthinpool")
 
     @property
     def pvs(self):
@@ -595,10 +616,7 @@ class Blivet(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        devices = self.devicetree.devices
-        pvs = [d for d in devices if d.format.type == "lvmpv"]
-        pvs.sort(key=lambda d: d.name)
-        return pvs
+        return self._getSortedDevicesByFormatType("lvmpv")
 
     @property
     def mdarrays(self):
@@ -608,16 +626,12 @@ class Blivet(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        arrays = self.devicetree.getDevicesByType("mdarray")
-        arrays.sort(key=lambda d: d.name)
-        return arrays
+        return self._getSortedDevicesByType("mdarray")
 
     @property
     def mdcontainers(self):
         """ A list of the MD containers in the device tree. """
-        arrays = self.devicetree.getDevicesByType("mdcontainer")
-        arrays.sort(key=lambda d: d.name)
-        return arrays
+        return self._getSortedDevicesByType("mdcontainer")
 
     @property
     def mdmembers(self):
@@ -627,10 +641,7 @@ class Blivet(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        devices = self.devicetree.devices
-        members = [d for d in devices if d.format.type == "mdmember"]
-        members.sort(key=lambda d: d.name)
-        return members
+        return self._getSortedDevicesByFormatType("mdmember")
 
     @property
     def btrfsVolumes(self):
@@ -640,8 +651,7 @@ class Blivet(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        return sorted(self.devicetree.getDevicesByType("btrfs volume"),
-                      key=lambda d: d.name)
+        return self._getSortedDevicesByType("btrfs volume")
 
     @property
     def swaps(self):
@@ -651,10 +661,7 @@ class Blivet(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        devices = self.devicetree.devices
-        swaps = [d for d in devices if d.format.type == "swap"]
-        swaps.sort(key=lambda d: d.name)
-        return swaps
+        return self._getSortedDevicesByFormatType("swap")
 
     def shouldClear(self, device, **kwargs):
         """ Return True if a clearpart settings say a device should be cleared.
@@ -1972,6 +1979,11 @@ class Blivet(object):
         return factory.device
 
     def copy(self):
+        """ Return a deep copy of this instance.
+
+            To be able to undo changes to this instance, :meth:`takeSnapshot`
+            is much cheaper.
+        """
         log.debug("starting Blivet copy")
         new = copy.deepcopy(self)
         # go through and re-get partedPartitions from the disks since they
@@ -2008,6 +2020,16 @@ class Blivet(object):
         log.debug("finished Blivet copy")
         return new
 
+    def takeSnapshot(self):
+        """ Return a snapshot this instance can be returned to later.
+
+            :rtype: :class:`~.snapshot.Snapshot`
+
+            Call the snapshot's restore method to undo the changes made
+            since, or its release method once it is no longer needed.
+        """
+        return Snapshot(self)
+
     def updateKSData(self):
         """ Update ksdata to reflect the settings of this Blivet instance. """
         if not self.ksdata or not self.mountpoints:
@@ -35,6 +35,7 @@ from i18n import _, N_
 import logging
 log = logging.getLogger("blivet")
 
+import bisect
 from contextlib import contextmanager
 
 @contextmanager
@@ -236,11 +237,26 @@ class DeviceAction(util.ObjectID):
         """ Return True if self requires action. """
         return False
 
+    def _requiredActions(self, index):
+        """ Return the actions self requires.
+
+            :param index: an index of the actions to choose from
+            :type index: :class:`ActionIndex`
+            :returns: the actions for which :meth:`requires` is True
+            :rtype: list of :class:`DeviceAction`
+
+            Subclasses that define their own requires method should also
+            define this to find the same actions via the index.
+        """
+        return [a for a in index.actions if self.requires(a)]
+
     def obsoletes(self, action):
         """ Return True is self obsoletes action.
 
             DeviceAction instances obsolete other DeviceAction instances with
             lower id and same device.
+
+            Actions only ever obsolete other actions on the same device.
         """
         return (self.device.id == action.device.id and
                 self.type == action.type and
@@ -294,6 +310,19 @@ class ActionCreateDevice(DeviceAction):
             rc = True
         return rc
 
+    def _requiredActions(self, index):
+        required = index.onDependencies(self.device, "isCreate")
+        if isinstance(self.device, PartitionDevice):
+            selfNum = self.device.partedPartition.number
+            required.extend(a for a in index.onPartitions(self.device.disk,
+                                                          below=selfNum)
+                            if a.isCreate)
+        elif isinstance(self.device, LVMLogicalVolumeDevice) and \
+             not self.device.singlePV:
+            required.extend(a for a in index.onSinglePVLogicalVolumes(self.device.vg)
+                            if a.isCreate and a.isDevice)
+        return required
+
 
 class ActionDestroyDevice(DeviceAction):
     """ An action representing the deletion of an existing device. """
@@ -344,6 +373,17 @@ class ActionDestroyDevice(DeviceAction):
             rc = True
         return rc
 
+    def _requiredActions(self, index):
+        required = index.onDependents(self.device, "isDestroy")
+        if isinstance(self.device, PartitionDevice):
+            selfNum = self.device.partedPartition.number
+            required.extend(a for a in index.onPartitions(self.device.disk,
+                                                          above=selfNum)
+                            if a.isDestroy)
+        required.extend(a for a in index.onDevice(self.device)
+                        if a.isDestroy and a.isFormat)
+        return required
+
     def obsoletes(self, action):
         """ Return True if self obsoletes action.
 
@@ -427,6 +467,14 @@ class ActionResizeDevice(DeviceAction):
 
         return retval
 
+    def _requiredActions(self, index):
+        required = index.onDependencies(self.device, "isGrow")
+        required.extend(index.onDependents(self.device, "isShrink"))
+        if self.isShrink:
+            required.extend(a for a in index.onDevice(self.device)
+                            if a.isShrink and a.isFormat)
+        return required
+
 
 class ActionCreateFormat(DeviceAction):
     """ An action representing creation of a new filesystem. """
@@ -497,6 +545,12 @@ class ActionCreateFormat(DeviceAction):
                 (action.isDevice and (action.isCreate or action.isResize) and
                  self.device.id == action.device.id))
 
+    def _requiredActions(self, index):
+        required = index.onDependencies(self.device, "isCreate")
+        required.extend(a for a in index.onDevice(self.device)
+                        if a.isDevice and (a.isCreate or a.isResize))
+        return required
+
     def obsoletes(self, action):
         """ Return True if this action obsoletes action.
 
@@ -548,6 +602,9 @@ class ActionDestroyFormat(DeviceAction):
         """
         return action.device.dependsOn(self.device) and action.isDestroy
 
+    def _requiredActions(self, index):
+        return index.onDependents(self.device, "isDestroy")
+
     def obsoletes(self, action):
         """ Return True if this action obsoletes action.
 
@@ -624,3 +681,342 @@ class ActionResizeFormat(DeviceAction):
                 retval = True
 
         return retval
+
+    def _requiredActions(self, index):
+        required = index.onDependents(self.device, "isShrink")
+        required.extend(index.onDependencies(self.device, "isGrow"))
+        if self.isGrow:
+            required.extend(a for a in index.onDevice(self.device)
+                            if a.isGrow and a.isDevice)
+        return required
+
+
+class ActionIndex(object):
+    """ An index of a list of actions by the devices they act upon.
+
+        This allows finding the actions another action requires without
+        comparing it to every other action. The actions must all be of the
+        same type, as they are when :meth:`DeviceTree.sortActions` sorts each
+        type of action on its own.
+
+        Only the nearest of the required actions are returned: an action on
+        an lv requires the actions on its vg, but not those on the vg's pvs,
+        since the actions on the vg already require them. The resulting order
+        is the same as if every required action had been returned.
+    """
+    def __init__(self, actions):
+        """
+            :param actions: the actions to index
+            :type actions: list of :class:`DeviceAction`
+        """
+        self.actions = actions
+
+        self._byDevice = {}         # device id -> actions
+        self._partitions = {}       # disk -> partition device actions
+        self._singlePV = {}         # vg -> single-pv lv actions
+        self._extended = {}         # disk -> extended partitions w/ actions
+        self._dependencies = {}     # (device id, attr) -> devices
+        self._dependents = {}       # attr -> (device id -> devices)
+
+        for action in actions:
+            device = action.device
+            if device.id not in self._byDevice:
+                self._byDevice[device.id] = []
+                if isinstance(device, PartitionDevice) and device.isExtended:
+                    self._extended.setdefault(device.disk, []).append(device)
+
+            self._byDevice[device.id].append(action)
+            if isinstance(device, PartitionDevice) and action.isDevice:
+                self._partitions.setdefault(device.disk, []).append(action)
+            elif isinstance(device, LVMLogicalVolumeDevice) and \
+                 device.singlePV:
+                self._singlePV.setdefault(device.vg, []).append(action)
+
+    def _matching(self, device, attr):
+        """ Return the actions on device for which attr is True. """
+        actions = self._byDevice.get(device.id, [])
+        if attr:
+            actions = [a for a in actions if getattr(a, attr)]
+        return actions
+
+    def _stopsAt(self, device, attr):
+        """ Return True if the matching actions on device require the
+            matching actions on the devices device depends on, so there is
+            no need to look any further.
+        """
+        base = DeviceAction._requiredActions.im_func
+        actions = self._matching(device, attr)
+        return bool(actions) and \
+               all(type(a)._requiredActions.im_func is not base
+                   for a in actions)
+
+    def _directDependencies(self, device):
+        """ Return the devices device depends on directly. """
+        dependencies = list(device.parents)
+        if isinstance(device, PartitionDevice):
+            dependencies.extend(e for e in self._extended.get(device.disk, [])
+                                if device._dependsDirectlyOn(e))
+        return dependencies
+
+    def _walk(self, device, attr):
+        """ Yield the devices device depends on, except for those only
+            reached through a device where :meth:`_stopsAt` is True.
+        """
+        queue = [device]
+        seen = set(queue)
+        while queue:
+            for dependency in self._directDependencies(queue.pop()):
+                if dependency in seen:
+                    continue
+
+                seen.add(dependency)
+                yield dependency
+                if not self._stopsAt(dependency, attr):
+                    queue.append(dependency)
+
+    def _getDependencies(self, device, attr):
+        """ Return the nearest devices with matching actions that device
+            depends on.
+        """
+        key = (device.id, attr)
+        if key not in self._dependencies:
+            self._dependencies[key] = [d for d in self._walk(device, attr)
+                                       if self._matching(d, attr)]
+
+        return self._dependencies[key]
+
+    def _getDependents(self, device, attr):
+        """ Return the nearest devices with matching actions that depend on
+            device.
+        """
+        if attr not in self._dependents:
+            dependents = {}
+            for actions in self._byDevice.values():
+                dependent = actions[0].device
+                if not self._matching(dependent, attr):
+                    continue
+
+                for dependency in self._walk(dependent, attr):
+                    if dependency.id in self._byDevice:
+                        dependents.setdefault(dependency.id, []).append(dependent)
+
+            self._dependents[attr] = dependents
+
+        return self._dependents[attr].get(device.id, [])
+
+    def _actionsOn(self, devices, attr):
+        actions = []
+        for device in devices:
+            actions.extend(self._matching(device, attr))
+        return actions
+
+    def onDevice(self, device):
+        """ Return the actions on device. """
+        return self._byDevice.get(device.id, [])[:]
+
+    def onDependencies(self, device, attr=None):
+        """ Return the nearest actions on devices that device depends on.
+
+            :param device: the device whose dependencies to look at
+            :type device: :class:`~.devices.StorageDevice`
+            :keyword attr: only include actions with this attribute set,
+                           eg: "isGrow"
+            :type attr: str
+            :returns: the actions
+            :rtype: list of :class:`DeviceAction`
+        """
+        return self._actionsOn(self._getDependencies(device, attr), attr)
+
+    def onDependents(self, device, attr=None):
+        """ Return the nearest actions on devices that depend on device.
+
+            :param device: the device whose dependents to look at
+            :type device: :class:`~.devices.StorageDevice`
+            :keyword attr: only include actions with this attribute set,
+                           eg: "isShrink"
+            :type attr: str
+            :returns: the actions
+            :rtype: list of :class:`DeviceAction`
+        """
+        return self._actionsOn(self._getDependents(device, attr), attr)
+
+    def onPartitions(self, disk, below=None, above=None):
+        """ Return the device actions on the nearest numbered partitions.
+
+            :param disk: the disk the partitions are on
+            :type disk: :class:`~.devices.StorageDevice`
+            :keyword below: return actions on the highest numbered partitions
+                            below this number
+            :type below: int
+            :keyword above: return actions on the lowest numbered partitions
+                            above this number
+            :type above: int
+            :returns: the actions
+            :rtype: list of :class:`DeviceAction`
+        """
+        if below is not None:
+            candidates = [(a.device.partedPartition.number, a)
+                          for a in self._partitions.get(disk, [])
+                          if a.device.partedPartition.number < below]
+            nearest = max
+        else:
+            candidates = [(a.device.partedPartition.number, a)
+                          for a in self._partitions.get(disk, [])
+                          if a.device.partedPartition.number > above]
+            nearest = min
+
+        if not candidates:
+            return []
+
+        number = nearest(n for (n, a) in candidates)
+        return [a for (n, a) in candidates if n == number]
+
+    def onSinglePVLogicalVolumes(self, vg):
+        """ Return the actions on single-pv lvs in vg. """
+        return self._singlePV.get(vg, [])[:]
+
+
+class ActionList(object):
+    """ An ordered list of actions, indexed by device, type and object.
+
+        Appending, removing and looking up the actions on a device take time
+        proportional to the number of matching actions rather than the
+        length of the list. Iterating over the list yields the actions in
+        the order they were added.
+
+        Each action gets a sequence number when it is appended, and the list
+        is kept in sequence order. A removed action can be put back where it
+        was with :meth:`insert`, given its old :meth:`position`.
+    """
+    def __init__(self, actions=None):
+        """
+            :keyword actions: the initial contents of the list
+            :type actions: list of :class:`DeviceAction`
+        """
+        self._actions = {}              # action id -> action
+        self._byDevice = {}             # device id -> {action id: action}
+        self._byKind = {}               # (type, obj) -> {action id: action}
+        self._positions = {}            # action id -> sequence number
+        self._bySequence = {}           # sequence number -> action
+        self._order = []                # sorted sequence numbers
+        self._sequence = 0
+
+        for action in actions or []:
+            self.append(action)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __reversed__(self):
+        return reversed(self[:])
+
+    def __len__(self):
+        return len(self._actions)
+
+    def __nonzero__(self):
+        return bool(self._actions)
+
+    def __contains__(self, action):
+        return self._actions.get(getattr(action, "id", None)) is action
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._bySequence[seq] for seq in self._order[index]]
+
+        return self._bySequence[self._order[index]]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "ActionList(%r)" % self[:]
+
+    def _add(self, action, position):
+        if action.id in self._actions:
+            raise ValueError("action is already in the list")
+
+        self._actions[action.id] = action
+        self._byDevice.setdefault(action.device.id, {})[action.id] = action
+        self._byKind.setdefault((action.type, action.obj), {})[action.id] = action
+        self._positions[action.id] = position
+        self._bySequence[position] = action
+
+    def append(self, action):
+        """ Add an action to the end of the list. """
+        self._add(action, self._sequence)
+        self._order.append(self._sequence)
+        self._sequence += 1
+
+    def insert(self, action, position):
+        """ Put a removed action back where it was in the list.
+
+            :param action: the action
+            :type action: :class:`DeviceAction`
+            :param position: the action's position before it was removed
+            :type position: int, as returned by :meth:`position`
+        """
+        if position in self._bySequence or position >= self._sequence:
+            raise ValueError("position is not free")
+
+        self._add(action, position)
+        bisect.insort(self._order, position)
+
+    def position(self, action):
+        """ Return an action's position, for use with :meth:`insert`. """
+        if action not in self:
+            raise ValueError("action is not in the list")
+
+        return self._positions[action.id]
+
+    def remove(self, action):
+        """ Remove an action from the list. """
+        if action not in self:
+            raise ValueError("action is not in the list")
+
+        position = self._positions.pop(action.id)
+        del self._order[bisect.bisect_left(self._order, position)]
+        del self._bySequence[position]
+        del self._actions[action.id]
+        for (index, key) in ((self._byDevice, action.device.id),
+                             (self._byKind, (action.type, action.obj))):
+            del index[key][action.id]
+            if not index[key]:
+                del index[key]
+
+    def pop(self, index=-1):
+        """ Remove and return the action at index (default last). """
+        if not self._actions:
+            raise IndexError("pop from empty list")
+
+        action = self[index]
+        self.remove(action)
+        return action
+
+    def find(self, devid=None, type=None, obj=None):
+        """ Return the actions that match all specified parameters.
+
+            :keyword devid: id of the device to match
+            :type devid: int or None
+            :keyword type: action type to match (eg: ACTION_TYPE_CREATE)
+            :type type: int or None
+            :keyword obj: operand type to match (eg: ACTION_OBJECT_DEVICE)
+            :type obj: int or None
+            :returns: the matching actions, in list order
+            :rtype: list of :class:`DeviceAction`
+        """
+        if devid is not None:
+            candidates = self._byDevice.get(devid, {}).values()
+        elif type is not None or obj is not None:
+            candidates = []
+            for ((_type, _obj), actions) in self._byKind.items():
+                if type in (None, _type) and obj in (None, _obj):
+                    candidates.extend(actions.values())
+        else:
+            return self[:]
+
+        candidates.sort(key=lambda a: self._positions[a.id])
+        return [a for a in candidates
+                if type in (None, a.type) and obj in (None, a.obj)]
@@ -298,10 +298,8 @@ class DeviceFactory(object):
         self.child_factory = None
         self.parent_factory = None
 
-        # used for error recovery
-        self.__devices = []
-        self.__actions = []
-        self.__names = []
+        # used for error recovery, see _save_devicetree
+        self.__snapshot = None
 
     #
     # methods related to device size and disk space requirements
@@ -741,6 +739,11 @@ class DeviceFactory(object):
                 e = DeviceFactoryError(str(e))
 
             raise(e)
+        finally:
+            # stop journaling even if something like KeyboardInterrupt got
+            # past the handler above
+            if self.parent_factory is None and self.__snapshot is not None:
+                self._release_devicetree()
 
     def _configure(self):
         self._set_container()
@@ -789,17 +792,20 @@ class DeviceFactory(object):
     # methods for error recovery
     #
     def _save_devicetree(self):
-        _blivet_copy = self.storage.copy()
-        self.__devices = _blivet_copy.devicetree._devices
-        self.__actions = _blivet_copy.devicetree._actions
-        self.__names = _blivet_copy.devicetree.names
-        self.__roots = _blivet_copy.roots
+        """ Start journaling changes to the device tree.
+
+            Nothing is copied here; the snapshot records the changes made
+            by _configure so _revert_devicetree can undo them.
+        """
+        self.__snapshot = self.storage.takeSnapshot()
 
     def _revert_devicetree(self):
-        self.storage.devicetree._devices = self.__devices
-        self.storage.devicetree._actions = self.__actions
-        self.storage.devicetree.names = self.__names
-        self.storage.roots = self.__roots
+        self.__snapshot.restore()
+        self.__snapshot = None
+
+    def _release_devicetree(self):
+        self.__snapshot.release()
+        self.__snapshot = None
 
 class PartitionFactory(DeviceFactory):
     """ Factory class for creating a partition. """
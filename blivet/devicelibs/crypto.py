@@ -25,6 +25,7 @@ from pycryptsetup import CryptSetup
 
 from ..errors import *
 from ..size import Size
+from . import dm
 
 LUKS_METADATA_SIZE = Size(spec="2 MiB")
 
@@ -110,13 +111,20 @@ def luks_open(device, name, passphrase=None, key_file=None):
 
     cs = CryptSetup(device=device, yesDialog = askyes, logFunc = dolog, passwordDialog = askpassphrase)
 
-    rc = cs.activate(passphrase = passphrase, name = name)
+    try:
+        rc = cs.activate(passphrase = passphrase, name = name)
+    finally:
+        dm.invalidate()
+
     if rc<0:
         raise CryptoError("luks_open failed for %s (%s) with errno %d" % (device, name, rc))
 
 def luks_close(name):
     cs = CryptSetup(name=name, yesDialog = askyes, logFunc = dolog, passwordDialog = askpassphrase)
-    rc = cs.deactivate()
+    try:
+        rc = cs.deactivate()
+    finally:
+        dm.invalidate()
 
     if rc:
         raise CryptoError("luks_close failed for %s" % name)
@@ -29,8 +29,98 @@ from ..errors import *
 import logging
 log = logging.getLogger("blivet")
 
+# bumped by everything blivet does that can add, remove, suspend or resume
+# device-mapper maps
+_generation = 0
+
+def invalidate():
+    """ Take a new snapshot of the dm maps when one is next needed.
+
+        Anything that changes device-mapper maps other than through this
+        module should call this once the change is complete, so a snapshot
+        taken while the change was in progress is not used afterwards.
+    """
+    global _generation
+    _generation += 1
+
+class DMMapSnapshot(object):
+    """ The status of all device-mapper maps, indexed by map name.
+
+        The snapshot is taken with a single walk of the dm maps and taken
+        again the first time it is used after :func:`invalidate`.
+    """
+    def __init__(self):
+        self._generation = None
+        self._maps = {}     # map name -> active (live table, not suspended)
+
+    def _update(self):
+        generation = _generation
+        if generation == self._generation:
+            return
+
+        maps = {}
+        for map in block.dm.maps():
+            maps[map.name] = bool(map.live_table and not map.suspended)
+
+        self._maps = maps
+        self._generation = generation
+
+    def status(self, map_name):
+        """ Return True if the named map is active. """
+        self._update()
+        return self._maps.get(map_name, False)
+
+_snapshot = DMMapSnapshot()
+
+def _sysfs_map_status(map_name):
+    """ Return the named map's status as sysfs shows it.
+
+        :returns: whether the map is active, or None if sysfs doesn't know
+        :rtype: bool or NoneType
+    """
+    try:
+        dm_node = os.path.basename(os.readlink("/dev/mapper/%s" % map_name))
+    except OSError:
+        return None
+
+    sysfs_dir = "/sys/class/block/%s" % dm_node
+    try:
+        name = open(sysfs_dir + "/dm/name").read().strip()
+        suspended = open(sysfs_dir + "/dm/suspended").read().strip()
+        size = open(sysfs_dir + "/size").read().strip()
+    except IOError:
+        return None
+
+    if name != map_name:
+        return None
+
+    # a map without a live table has no size
+    return suspended == "0" and size != "0"
+
+def dm_map_status(map_name, use_sysfs=True):
+    """ Return True if a device-mapper map has a live table and is running.
+
+        :param map_name: the name of the map
+        :type map_name: str
+        :keyword use_sysfs: look at sysfs before the map snapshot
+        :type use_sysfs: bool
+        :rtype: bool
+    """
+    status = None
+    if use_sysfs:
+        status = _sysfs_map_status(map_name)
+
+    if status is None:
+        status = _snapshot.status(map_name)
+
+    return status
+
 def dm_setup(args):
-    ret = util.run_program(["dmsetup"] + args)
+    try:
+        ret = util.run_program(["dmsetup"] + args)
+    finally:
+        invalidate()
+
     if ret:
         raise DMError("Failed to run dmsetup %s" % " ".join(args))
 
@@ -51,21 +51,85 @@ def get_backing_file(name):
 
     return path
 
+# bumped by every loop device set up or torn down
+_generation = 0
+
+def invalidate():
+    """ Read the loop devices' backing files again when next needed. """
+    global _generation
+    _generation += 1
+
+class LoopIndex(object):
+    """ The backing files of all loop devices, indexed both ways.
+
+        The index is built from sysfs the first time it is used after
+        :func:`invalidate`, so looking up loop devices does not need
+        losetup.
+    """
+    def __init__(self):
+        self._generation = None
+        self._files = {}        # loop name -> backing file
+        self._loops = {}        # backing file -> list of loop names
+
+    def _update(self):
+        generation = _generation
+        if generation == self._generation:
+            return
+
+        files = {}
+        loops = {}
+        try:
+            names = os.listdir("/sys/class/block")
+        except OSError:
+            names = []
+
+        for name in sorted(names):
+            if not name.startswith("loop"):
+                continue
+
+            path = get_backing_file(name)
+            if path:
+                files[name] = path
+                loops.setdefault(path, []).append(name)
+
+        self._files = files
+        self._loops = loops
+        self._generation = generation
+
+    def backing_file(self, name):
+        """ Return the backing file of the named loop device, or "". """
+        self._update()
+        return self._files.get(name, "")
+
+    def loop_names(self, path):
+        """ Return the names of the loop devices backed by a file. """
+        self._update()
+        return self._loops.get(os.path.realpath(path), [])
+
+_index = LoopIndex()
+
 def get_loop_name(path):
-    args = ["-j", path]
-    buf = losetup(args, capture=True)
-    if len(buf.splitlines()) > 1:
+    names = _index.loop_names(path)
+    if len(names) > 1:
         # there should never be more than one loop device listed
         raise LoopError("multiple loops associated with %s" % path)
 
-    name = os.path.basename(buf.split(":")[0])
-    return name
+    return names[0] if names else ""
+
+def is_loop_backed_by(name, path):
+    """ Return True if the named loop device is backed by the given file.
+
+        This reads sysfs directly, so it is always up to date.
+    """
+    backing_file = get_backing_file(name)
+    return bool(backing_file) and backing_file == os.path.realpath(path)
 
 def loop_setup(path):
     args = ["-f", path]
     msg = None
     try:
         msg = losetup(args)
+        invalidate()
     except LoopError as e:
         msg = str(e)
 
@@ -77,6 +141,7 @@ def loop_teardown(path):
     msg = None
     try:
         msg = losetup(args)
+        invalidate()
     except LoopError as e:
         msg = str(e)
 
@@ -23,6 +23,9 @@
 import os
 import math
 import re
+import subprocess
+import threading
+import time
 from decimal import Decimal
 
 import logging
@@ -30,8 +33,11 @@ log = logging.getLogger("blivet")
 
 from ..size import Size
 from .. import util
+from .. import probecache
+from . import dm
 from .. import arch
 from ..errors import *
+from ..flags import flags
 from ..i18n import _
 
 MAX_LV_SLOTS = 256
@@ -209,11 +215,158 @@ def is_valid_thin_pool_chunk_size(size, discard=False):
     else:
         return (size % LVM_THINP_MIN_CHUNK_SIZE == 0)
 
+# bumped by every lvm command that can change lvm metadata
+_generation = 0
+
 def lvm(args):
-    ret = util.run_program(["lvm"] + args)
+    global _generation
+    try:
+        ret = util.run_program(["lvm"] + args)
+    finally:
+        # only once lvm is done, so nothing read while it ran gets reused
+        _generation += 1
+        probecache.invalidate()
+        dm.invalidate()
+
     if ret:
         raise LVMError("running lvm " + " ".join(args) + " failed")
 
+class LVMShell(object):
+    """ A long-running lvm shell to run lvm commands in.
+
+        Starting lvm means parsing its configuration and scanning devices,
+        which is most of the time a simple report command takes. The shell
+        does this once and then runs each command sent to it.
+
+        The shell gives no reliable exit status for its commands, so it is
+        only used for reporting commands. See :func:`_capture_output`.
+    """
+    prompt = "lvm> "
+
+    def __init__(self):
+        self._proc = None
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _start(self):
+        env = os.environ.copy()
+        env.update({"LC_ALL": "C", "LVM_SUPPRESS_FD_WARNINGS": "1"})
+        self._proc = subprocess.Popen(["lvm"],
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT,
+                                      close_fds=True, env=env)
+        log.debug("started lvm shell (pid %d)" % self._proc.pid)
+
+    def stop(self):
+        """ Stop the shell. It gets started again when it is next used. """
+        with self._lock:
+            self._stop()
+
+    def _stop(self):
+        if not self._proc:
+            return
+
+        try:
+            self._proc.stdin.close()
+            self._proc.wait()
+        except (IOError, OSError):
+            pass
+
+        self._proc = None
+
+    @property
+    def pid(self):
+        """ Process id of the running shell, or None. """
+        return getattr(self._proc, "pid", None)
+
+    def run(self, args):
+        """ Run an lvm command in the shell and return its output.
+
+            :param args: the command and its arguments
+            :type args: list of str
+            :returns: the output of the command
+            :rtype: str
+            :raises: :class:`~.errors.LVMError` if the command cannot be run
+                     in the shell
+
+            Each command is followed by a command lvm does not know. The
+            error message about it marks the end of the first command's
+            output. If the shell has exited it is started again.
+        """
+        if any(not arg or len(arg.split()) != 1 for arg in args):
+            raise LVMError("lvm shell cannot take arguments %s" % args)
+
+        command = " ".join(args)
+        with self._lock:
+            if self._proc is None or self._proc.poll() is not None:
+                self._start()
+
+            self._count += 1
+            marker = "__blivet_%d__" % self._count
+            end = "No such command '%s'" % marker
+
+            start = time.time()
+            lines = []
+            try:
+                self._proc.stdin.write("%s\n%s\n" % (command, marker))
+                self._proc.stdin.flush()
+                while True:
+                    line = self._proc.stdout.readline()
+                    if not line:
+                        raise LVMError("lvm shell exited")
+
+                    while line.startswith(self.prompt):
+                        line = line[len(self.prompt):]
+
+                    if end in line:
+                        break
+                    elif line.strip() in (command, marker):
+                        # the shell echoed its input
+                        continue
+
+                    lines.append(line)
+            except (IOError, OSError) as e:
+                self._stop()
+                raise LVMError("lvm shell failed: %s" % e)
+            except LVMError:
+                self._stop()
+                raise
+
+            elapsed = time.time() - start
+
+        out = "".join(lines)
+        with util.program_log_lock:
+            util.program_log.info("Running in lvm shell... lvm %s" % command)
+            for line in lines:
+                util.program_log.info(line.rstrip("\n"))
+            util.program_log.debug("Done (%.3f seconds)" % elapsed)
+
+        return out
+
+_shell = LVMShell()
+
+def _capture_output(args):
+    """ Run an lvm reporting command and return its output.
+
+        If flags.lvm_shell is set the command is run in the lvm shell, or by
+        running lvm if that fails.
+    """
+    if flags.lvm_shell:
+        # the shell splits commands on whitespace, which the --config
+        # strings do not need
+        shell_args = list(args)
+        for i in range(1, len(args)):
+            if args[i - 1] == "--config":
+                shell_args[i] = "".join(args[i].split())
+
+        try:
+            return _shell.run(shell_args)
+        except LVMError as e:
+            log.info("running lvm instead of lvm shell: %s" % e)
+
+    return util.capture_output(["lvm"] + args)
+
 def pvcreate(device):
     # we force dataalignment=1024k since we cannot get lvm to tell us what
     # the pe_start will be in advance
@@ -274,7 +427,7 @@ def pvinfo(device):
             _getConfigArgs(read_only_locking=True) + \
             [device]
 
-    rc = util.capture_output(["lvm"] + args)
+    rc = probecache.captureOutput(args, device, capture=_capture_output)
     _vars = rc.split()
     info = {}
     for var in _vars:
@@ -360,7 +513,7 @@ def vginfo(vg_name):
             _getConfigArgs(read_only_locking=True) + \
             [vg_name]
 
-    buf = util.capture_output(["lvm"] + args)
+    buf = _capture_output(args)
     info = buf.split()
     if len(info) != 7:
         raise LVMError(_("vginfo failed for %s" % vg_name))
@@ -375,7 +528,7 @@ def lvs(vg_name):
             _getConfigArgs(read_only_locking=True) + \
             [vg_name]
 
-    rc = util.capture_output(["lvm"] + args)
+    rc = _capture_output(args)
     _vars = rc.split()
     info = {}
     for var in _vars:
@@ -397,7 +550,7 @@ def lvorigin(vg_name, lv_name):
             _getConfigArgs(read_only_locking=True) + \
             ["%s/%s" % (vg_name, lv_name)]
 
-    buf = util.capture_output(["lvm"] + args)
+    buf = _capture_output(args)
 
     try:
         origin = buf.splitlines()[0].strip()
@@ -496,7 +649,7 @@ def thinlvpoolname(vg_name, lv_name):
             _getConfigArgs(read_only_locking=True) + \
             ["%s/%s" % (vg_name, lv_name)]
 
-    buf = util.capture_output(["lvm"] + args)
+    buf = _capture_output(args)
 
     try:
         pool = buf.splitlines()[0].strip()
@@ -504,3 +657,128 @@ def thinlvpoolname(vg_name, lv_name):
         pool = ''
 
     return pool
+
+def _parseReport(buf):
+    """ Return a list of dicts, one per line of a --nameprefixes report. """
+    rows = []
+    for line in buf.splitlines():
+        row = {}
+        for var in line.split():
+            (name, equals, value) = var.partition("=")
+            if equals:
+                row[name] = value.strip()
+
+        if row:
+            rows.append(row)
+
+    return rows
+
+class LVMReport(object):
+    """ lvm's view of all pvs and lvs, from a single report of each.
+
+        Looking up a pv or the lvs of a vg here gives the same information
+        as :func:`pvinfo`, :func:`lvs`, :func:`lvorigin` and
+        :func:`thinlvpoolname` without running lvm for each of them.
+
+        The report is run again when it is next used after any lvm command
+        that can change lvm metadata, or a change to the lvm filter. Its
+        output goes through the probe cache, keyed on all block devices, so
+        it is only run again once one of them has changed, even by a later
+        run that loaded the saved probe results.
+    """
+    pv_fields = ["pv_name", "pv_uuid", "pe_start", "vg_name", "vg_uuid",
+                 "vg_size", "vg_free", "vg_extent_size", "vg_extent_count",
+                 "vg_free_count", "pv_count"]
+    lv_fields = ["vg_name", "lv_name", "lv_uuid", "lv_size", "lv_attr",
+                 "segtype", "origin", "pool_lv"]
+
+    # the lv fields included in the output of lvs()
+    lvs_fields = ["LVM2_LV_NAME", "LVM2_LV_UUID", "LVM2_LV_SIZE",
+                  "LVM2_LV_ATTR", "LVM2_SEGTYPE"]
+
+    def __init__(self):
+        self._key = None
+        self._pvs = {}      # pv name -> field dict
+        self._lvs = {}      # vg name -> list of field dicts
+
+    def invalidate(self):
+        """ Run the report again when it is next used. """
+        self._key = None
+
+    def _update(self):
+        config_args = _getConfigArgs(read_only_locking=True)
+        key = (_generation, tuple(config_args))
+        if key == self._key:
+            return
+
+        common_args = ["--unit=k", "--nosuffix", "--nameprefixes",
+                       "--unquoted", "--noheadings"]
+        pv_args = ["pvs"] + common_args + \
+                  ["-o" + ",".join(self.pv_fields)] + config_args
+        lv_args = ["lvs", "-a"] + common_args + \
+                  ["-o" + ",".join(self.lv_fields)] + config_args
+
+        devnos = probecache.getBlockDeviceNumbers()
+        pv_report = probecache.captureReport(pv_args, devnos,
+                                             capture=_capture_output)
+        lv_report = probecache.captureReport(lv_args, devnos,
+                                             capture=_capture_output)
+
+        self._pvs = {}
+        for row in _parseReport(pv_report):
+            self._pvs[row.pop("LVM2_PV_NAME", "")] = row
+
+        self._lvs = {}
+        for row in _parseReport(lv_report):
+            self._lvs.setdefault(row.get("LVM2_VG_NAME"), []).append(row)
+
+        self._key = key
+
+    def _getLV(self, vg_name, lv_name):
+        self._update()
+        for row in self._lvs.get(vg_name, []):
+            if row.get("LVM2_LV_NAME") == lv_name:
+                return row
+
+        return None
+
+    def pvinfo(self, device):
+        """ Return the same information as :func:`pvinfo`. """
+        self._update()
+        if device not in self._pvs:
+            # lvm may know the device by another name
+            return pvinfo(device)
+
+        info = {}
+        for (name, value) in self._pvs[device].items():
+            if "," in value:
+                value = value.split(",")
+            info[name] = value
+
+        return info
+
+    def lvs(self, vg_name):
+        """ Return the same information as :func:`lvs`. """
+        self._update()
+        info = {}
+        for row in self._lvs.get(vg_name, []):
+            for name in self.lvs_fields:
+                info.setdefault(name, []).append(row.get(name, ""))
+
+        return info
+
+    def lvorigin(self, vg_name, lv_name):
+        """ Return the same information as :func:`lvorigin`. """
+        row = self._getLV(vg_name, lv_name)
+        if row is None:
+            return lvorigin(vg_name, lv_name)
+
+        return row.get("LVM2_ORIGIN", "")
+
+    def thinlvpoolname(self, vg_name, lv_name):
+        """ Return the same information as :func:`thinlvpoolname`. """
+        row = self._getLV(vg_name, lv_name)
+        if row is None:
+            return thinlvpoolname(vg_name, lv_name)
+
+        return row.get("LVM2_POOL_LV", "")
@@ -23,6 +23,7 @@
 import os
 
 from .. import util
+from .. import probecache
 from ..errors import *
 from ..size import Size
 from . import raid
@@ -105,6 +106,7 @@ def get_raid_superblock_size(size, version=None):
     return headroom
 
 def mdadm(args):
+    probecache.invalidate()
     ret = util.run_program(["mdadm"] + args)
     if ret:
         raise MDRaidError("running mdadm " + " ".join(args) + " failed")
@@ -175,10 +177,12 @@ def mddeactivate(device):
         raise MDRaidError("mddeactivate failed for %s: %s" % (device, msg))
 
 def mdexamine(device):
-    _vars = util.capture_output(["mdadm",
-                                 "--examine", "--export", device]).split()
-    _bvars = util.capture_output(["mdadm",
-                                 "--examine", "--brief", device]).split()
+    _vars = probecache.captureOutput(["mdadm",
+                                      "--examine", "--export", device],
+                                     device).split()
+    _bvars = probecache.captureOutput(["mdadm",
+                                       "--examine", "--brief", device],
+                                      device).split()
 
     info = {}
     if len(_bvars) > 1 and _bvars[1].startswith("/dev/md"):
@@ -203,6 +207,55 @@ def mdexamine(device):
 
     return info
 
+# mdadm --examine --brief field names -> mdadm --examine --export names
+_SCAN_FIELDS = {"UUID": "MD_UUID",
+                "level": "MD_LEVEL",
+                "num-devices": "MD_DEVICES",
+                "metadata": "MD_METADATA",
+                "name": "MD_NAME"}
+
+def mdexamine_scan(devices):
+    """ Examine many md member devices with a single run of mdadm.
+
+        :param devices: paths to md member device nodes
+        :type devices: list of str
+        :returns: a dict of device path -> info like :func:`mdexamine`'s
+        :rtype: dict
+
+        Devices whose array is not fully described by mdadm's brief output,
+        eg: members of imsm containers, are not included.
+    """
+    if not devices:
+        return {}
+
+    buf = util.capture_output(["mdadm", "--examine", "--brief", "--verbose"] +
+                              list(devices))
+
+    info = {}
+    array = None
+    for line in buf.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+
+        if fields[0] == "ARRAY":
+            array = {}
+            if len(fields) > 1 and fields[1].startswith("/dev/md"):
+                array["DEVICE"] = fields[1]
+
+            for var in fields[1:]:
+                (name, equals, value) = var.partition("=")
+                if equals and name in _SCAN_FIELDS:
+                    array[_SCAN_FIELDS[name]] = value
+        elif fields[0].startswith("devices=") and array is not None:
+            if not all(k in array for k in ("MD_UUID", "MD_LEVEL", "MD_DEVICES")):
+                continue
+
+            for member in fields[0].partition("=")[2].split(","):
+                info[member] = array.copy()
+
+    return info
+
 def md_node_from_name(name):
     named_path = "/dev/md/" + name
     try:
@@ -1,11 +1,17 @@
+import re
 
 from .. import util
+from . import dm
 
 import logging
 log = logging.getLogger("blivet")
 
 def flush_mpaths():
-    util.run_program(["multipath", "-F"])
+    try:
+        util.run_program(["multipath", "-F"])
+    finally:
+        dm.invalidate()
+
     check_output = util.capture_output(["multipath", "-ll"]).strip()
     if check_output:
         log.error("multipath: some devices could not be flushed")
@@ -13,6 +19,85 @@ def flush_mpaths():
 def is_multipath_member(path):
     return (util.run_program(["multipath", "-c", path]) == 0)
 
+WWIDS_FILE = "/etc/multipath/wwids"
+
+# a path line of multipath -ll, eg: "| `- 1:0:0:0 sda 8:0 active ready running"
+_PATH_LINE = re.compile(r"\s\d+:\d+:\d+:\d+\s+(\S+)\s+\d+:\d+\s")
+
+def get_map_members():
+    """ Return the names of the paths of all active multipath maps.
+
+        :returns: kernel device names, eg: "sda"
+        :rtype: set of str
+    """
+    members = set()
+    for line in util.capture_output(["multipath", "-ll"]).splitlines():
+        match = _PATH_LINE.search(" " + line + " ")
+        if match:
+            members.add(match.group(1))
+
+    return members
+
+def get_wwids(wwids_file=WWIDS_FILE):
+    """ Return the wwids multipath has recorded as multipath devices.
+
+        :returns: the wwids listed in multipath's wwids file
+        :rtype: set of str
+    """
+    wwids = set()
+    try:
+        with open(wwids_file) as f:
+            lines = f.readlines()
+    except IOError:
+        return wwids
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        wwids.add(line.strip("/"))
+
+    return wwids
+
+class MultipathMembers(object):
+    """ multipath's view of which devices are multipath members.
+
+        A device is a member if it is a path of an active multipath map or
+        its wwid is listed in multipath's wwids file, which is what
+        :func:`is_multipath_member` checks by running multipath once for
+        each device. Both are read once, when first used after being
+        invalidated.
+    """
+    def __init__(self, wwids_file=WWIDS_FILE):
+        self.wwids_file = wwids_file
+        self._members = None
+        self._wwids = None
+
+    def invalidate(self):
+        """ Read multipath's state again when it is next used. """
+        self._members = None
+        self._wwids = None
+
+    def _update(self):
+        if self._members is not None:
+            return
+
+        self._members = get_map_members()
+        self._wwids = get_wwids(self.wwids_file)
+
+    def is_member(self, name, wwid=None):
+        """ Return True if multipath considers a device a multipath member.
+
+            :param name: the device's kernel name, eg: "sda"
+            :type name: str
+            :keyword wwid: the device's wwid as multipath sees it
+            :type wwid: str
+            :rtype: bool
+        """
+        self._update()
+        return name in self._members or (bool(wwid) and wwid in self._wwids)
+
 def set_friendly_names(enabled=True):
     """ Set the state of friendly names in multipathd.
 
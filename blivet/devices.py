@@ -24,6 +24,7 @@ import os
 import copy
 import pprint
 import tempfile
+import weakref
 from decimal import Decimal
 
 # device backend modules
@@ -42,6 +43,7 @@ import util
 import arch
 from flags import flags
 from storage_log import log_method_call
+import snapshot
 from udev import *
 from formats import get_device_format_class, getFormat, DeviceFormat
 from size import Size
@@ -146,6 +148,17 @@ class Device(util.ObjectID):
     _packages = []
     _services = []
 
+    # attributes that feed the device tree's lookup indexes
+    _lookupAttrs = frozenset(["_name", "_type", "parents", "uuid",
+                              "sysfsPath", "_serial", "_format"])
+
+    # other attributes that affect the device tree's view of this device,
+    # eg: through the complete property
+    _treeAttrs = frozenset(["exists"])
+
+    # the tree whose lookup indexes currently include this device
+    _devicetree = None
+
     def __init__(self, name, parents=None):
         """
             :param name: the device name (generally a device node's basename)
@@ -155,15 +168,13 @@ class Device(util.ObjectID):
         """
         util.ObjectID.__init__(self)
         self._name = name
+        self._children = set()
+        self._parents = []
         if parents is None:
             parents = []
         elif not isinstance(parents, list):
             raise ValueError("parents must be a list of Device instances")
         self.parents = parents
-        self.kids = 0
-
-        for parent in self.parents:
-            parent.addChild()
 
     def __deepcopy__(self, memo):
         """ Create a deep copy of a Device instance.
@@ -175,16 +186,46 @@ class Device(util.ObjectID):
         memo[id(self)] = new
         dont_copy_attrs = ('_raidSet', 'node')
         shallow_copy_attrs = ('_partedDevice', '_partedPartition')
+        # write to __dict__ directly so a half-built copy doesn't try to
+        # update the lookup indexes of the copied tree
         for (attr, value) in self.__dict__.items():
             if attr in dont_copy_attrs:
-                setattr(new, attr, value)
+                new.__dict__[attr] = value
             elif attr in shallow_copy_attrs:
-                setattr(new, attr, copy.copy(value))
+                new.__dict__[attr] = copy.copy(value)
             else:
-                setattr(new, attr, copy.deepcopy(value, memo))
+                new.__dict__[attr] = copy.deepcopy(value, memo)
+
+        fmt = new.__dict__.get("_format")
+        if fmt is not None:
+            fmt._owner = weakref.ref(new)
 
         return new
 
+    def __setattr__(self, attr, value):
+        snapshot.preserve(self)
+        super(Device, self).__setattr__(attr, value)
+        if attr in self._lookupAttrs:
+            if attr == "_format" and value is not None:
+                value._owner = weakref.ref(self)
+            self._lookupKeysChanged(attr)
+        elif attr in self._treeAttrs:
+            self._treeChanged()
+
+    def _treeChanged(self):
+        """ Let the device tree know this device changed in some way. """
+        if self._devicetree is not None:
+            self._devicetree._bumpGeneration()
+
+    def _lookupKeysChanged(self, attr):
+        """ Let the device tree know a lookup key of this device changed.
+
+            :param attr: the name of the attribute that changed
+            :type attr: str
+        """
+        if self._devicetree is not None:
+            self._devicetree._updateLookupIndexes(self, attr)
+
     def __repr__(self):
         s = ("%(type)s instance (%(id)s) --\n"
              "  name = %(name)s  status = %(status)s"
@@ -206,15 +247,62 @@ class Device(util.ObjectID):
               "parents": [p.name for p in self.parents]}
         return d
 
-    def removeChild(self):
-        """ Decrement the child counter for this device. """
-        log_method_call(self, name=self.name, kids=self.kids)
-        self.kids -= 1
+    def removeChild(self, child):
+        """ Remove a device from this device's set of children.
 
-    def addChild(self):
-        """ Increment the child counter for this device. """
-        log_method_call(self, name=self.name, kids=self.kids)
-        self.kids += 1
+            :param child: the child device
+            :type child: :class:`Device`
+        """
+        log_method_call(self, name=self.name, kids=self.kids,
+                        child=child.name)
+        snapshot.preserve(self)
+        self._children.discard(child)
+        self._treeChanged()
+        child._treeChanged()
+
+    def addChild(self, child):
+        """ Add a device to this device's set of children.
+
+            :param child: the child device
+            :type child: :class:`Device`
+        """
+        log_method_call(self, name=self.name, kids=self.kids,
+                        child=child.name)
+        snapshot.preserve(self)
+        self._children.add(child)
+        self._treeChanged()
+        child._treeChanged()
+
+    @property
+    def children(self):
+        """ List of devices that have this device as a parent. """
+        return sorted(self._children, key=lambda d: d.id)
+
+    @property
+    def kids(self):
+        """ The number of devices that have this device as a parent. """
+        return len(self._children)
+
+    def _getParents(self):
+        return self._parents
+
+    def _setParents(self, parents):
+        """ Set this device's parents, updating the parents' children.
+
+            :param parents: the new list of parent devices
+            :type parents: list of :class:`Device` instances
+        """
+        for parent in self._parents:
+            if parent not in parents:
+                parent.removeChild(self)
+
+        self._parents = parents
+        for parent in parents:
+            parent.addChild(self)
+
+    parents = property(lambda d: d._getParents(),
+                       lambda d,p: d._setParents(p),
+                       doc="list of this device's parent devices")
 
     def setup(self):
         """ Open, or set up, a device. """
@@ -264,15 +352,33 @@ class Device(util.ObjectID):
             :rtype: bool
         """
         # XXX does a device depend on itself?
-        if dep in self.parents:
-            return True
-
-        for parent in self.parents:
-            if parent.dependsOn(dep):
+        seen = set([self])
+        ancestors = [self]
+        while ancestors:
+            device = ancestors.pop()
+            if device._dependsDirectlyOn(dep):
                 return True
 
+            for parent in device.parents:
+                if parent not in seen:
+                    seen.add(parent)
+                    ancestors.append(parent)
+
         return False
 
+    def _dependsDirectlyOn(self, dep):
+        """ Return True if dep is one of this device's direct dependencies. """
+        return dep in self.parents
+
+    @property
+    def dependents(self):
+        """ List of devices that depend directly on this device.
+
+            This is usually just the children, but some devices are depended
+            upon by devices that are not their children.
+        """
+        return self.children
+
     def dracutSetupArgs(self):
         return set()
 
@@ -1139,8 +1245,6 @@ class PartitionDevice(StorageDevice):
         if not exists:
             # this is a request, not a partition -- it has no parents
             self.req_disks = self.parents[:]
-            for dev in self.parents:
-                dev.removeChild()
             self.parents = []
 
         # FIXME: Validate partType, but only if this is a new partition
@@ -1248,6 +1352,7 @@ class PartitionDevice(StorageDevice):
             # change this partition's geometry in-memory so that other
             # partitioning operations can complete (e.g., autopart)
             super(PartitionDevice, self)._setTargetSize(newsize)
+            snapshot.preserve(self.disk.format)
             disk = self.disk.format.partedDisk
 
             # resize the partition's geometry in memory
@@ -1385,13 +1490,26 @@ class PartitionDevice(StorageDevice):
             self._name = \
                 devicePathToName(self.partedPartition.getDeviceNodeName())
 
-    def dependsOn(self, dep):
-        """ Return True if this device depends on dep. """
+    def _dependsDirectlyOn(self, dep):
+        """ Return True if dep is one of this device's direct dependencies. """
         if isinstance(dep, PartitionDevice) and dep.isExtended and \
            self.isLogical and self.disk == dep.disk:
             return True
 
-        return Device.dependsOn(self, dep)
+        return Device._dependsDirectlyOn(self, dep)
+
+    @property
+    def dependents(self):
+        """ List of devices that depend directly on this device.
+
+            Logical partitions depend on the extended partition.
+        """
+        dependents = self.children
+        if self.isExtended and self.disk:
+            dependents.extend(p for p in self.disk.children
+                              if isinstance(p, PartitionDevice) and
+                              p.isLogical)
+        return dependents
 
     @property
     def isleaf(self):
@@ -1504,21 +1622,21 @@ class PartitionDevice(StorageDevice):
         finally:
             # If a udev device is created with the watch option, then
             # a change uevent is synthesized and we need to wait for
-            # things to settle.
-            udev_settle()
+            # things to settle. A deferred commit settles when it is done.
+            if not self.disk.format.commitsDeferred:
+                udev_settle()
 
     def _create(self):
         """ Create the device. """
         log_method_call(self, self.name, status=self.status)
         self.disk.format.addPartition(self.partedPartition)
 
-        self._wipe()
-        try:
-            self.disk.format.commit()
-        except DiskLabelCommitError:
+        def undo():
             part = self.disk.format.partedDisk.getPartitionByPath(self.path)
             self.disk.format.removePartition(part)
-            raise
+
+        self._wipe()
+        self.disk.format.commit(undo=undo)
 
     def _postCreate(self):
         if self.isExtended:
@@ -1549,7 +1667,8 @@ class PartitionDevice(StorageDevice):
         except Exception as e:
             raise DeviceCreateError(str(e), self.name)
         else:
-            self._postCreate()
+            # the new partition's device node only shows up after the commit
+            self.disk.format.afterCommit(self._postCreate)
 
     def _computeResize(self, partition):
         log_method_call(self, self.name, status=self.status)
@@ -1600,12 +1719,12 @@ class PartitionDevice(StorageDevice):
         # we should have already set self.partedPartition to point to the
         # partition on the original disklabel
         self.disk.originalFormat.removePartition(self.partedPartition)
-        try:
-            self.disk.originalFormat.commit()
-        except DiskLabelCommitError:
+
+        def undo():
             self.disk.originalFormat.addPartition(self.partedPartition)
             self.partedPartition = self.disk.originalFormat.partedDisk.getPartitionByPath(self.path)
-            raise
+
+        self.disk.originalFormat.commit(undo=undo)
 
         if self.disk.format.exists and \
            self.disk.format.partedDisk != self.disk.originalFormat.partedDisk:
@@ -1615,6 +1734,13 @@ class PartitionDevice(StorageDevice):
             self.disk.format.removePartition(part)
             self.disk.format.commit()
 
+    def destroy(self):
+        """ Destroy the device. """
+        log_method_call(self, self.name, status=self.status)
+        self._preDestroy()
+        self._destroy()
+        self.disk.originalFormat.afterCommit(self._postDestroy)
+
     def deactivate(self):
         """
         This is never called. For instructional purposes only.
@@ -1628,6 +1754,8 @@ class PartitionDevice(StorageDevice):
                     block.removeDeviceMap(devmap)
                 except Exception as e:
                     raise DeviceTeardownError("failed to tear down device-mapper partition %s: %s" % (self.name, e))
+                finally:
+                    dm.invalidate()
             udev_settle()
 
     def _getSize(self):
@@ -1684,12 +1812,8 @@ class PartitionDevice(StorageDevice):
         """
         log_method_call(self, self.name, old=getattr(self.disk, "name", None),
                         new=getattr(disk, "name", None))
-        if self.disk:
-            self.disk.removeChild()
-
         if disk:
             self.parents = [disk]
-            disk.addChild()
         else:
             self.parents = []
 
@@ -1821,13 +1945,7 @@ class DMDevice(StorageDevice):
 
     @property
     def status(self):
-        _status = False
-        for map in block.dm.maps():
-            if map.name == self.mapName:
-                _status = map.live_table and not map.suspended
-                break
-
-        return _status
+        return dm.dm_map_status(self.mapName)
 
     def updateSysfsPath(self):
         """ Update this device's sysfs path. """
@@ -1855,14 +1973,20 @@ class DMDevice(StorageDevice):
 
     def setupPartitions(self):
         log_method_call(self, name=self.name, kids=self.kids)
-        rc = util.run_program(["kpartx", "-a", "-s", self.path])
+        try:
+            rc = util.run_program(["kpartx", "-a", "-s", self.path])
+        finally:
+            dm.invalidate()
         if rc:
             raise DMError("partition activation failed for '%s'" % self.name)
         udev_settle()
 
     def teardownPartitions(self):
         log_method_call(self, name=self.name, kids=self.kids)
-        rc = util.run_program(["kpartx", "-d", "-s", self.path])
+        try:
+            rc = util.run_program(["kpartx", "-d", "-s", self.path])
+        finally:
+            dm.invalidate()
         if rc:
             raise DMError("partition deactivation failed for '%s'" % self.name)
         udev_settle()
@@ -2038,6 +2162,7 @@ class LVMVolumeGroupDevice(DMDevice):
     """
     _type = "lvmvg"
     _packages = ["lvm2"]
+    _treeAttrs = DMDevice._treeAttrs | frozenset(["pvCount", "hasDuplicate"])
 
     def __init__(self, name, parents=None, size=None, free=None,
                  peSize=None, peCount=None, peFree=None, pvCount=None,
@@ -2223,8 +2348,9 @@ class LVMVolumeGroupDevice(DMDevice):
         if device in self.pvs:
             raise ValueError("device is already a member of this VG")
 
+        snapshot.preserve(self)
         self.parents.append(device)
-        device.addChild()
+        device.addChild(self)
 
         # now see if the VG can be activated
         if self.complete and flags.installer_mode:
@@ -2239,12 +2365,13 @@ class LVMVolumeGroupDevice(DMDevice):
                         self.name,
                         device=device.name,
                         status=self.status)
+        snapshot.preserve(self)
         try:
             self.parents.remove(device)
         except ValueError:
             raise ValueError("cannot remove non-member PV device from VG")
 
-        device.removeChild()
+        device.removeChild(self)
 
     def _preSetup(self, orig=False):
         if self.exists and not self.complete:
@@ -2307,6 +2434,7 @@ class LVMVolumeGroupDevice(DMDevice):
             raise DeviceError("new lv is too large to fit in free space", self.name)
 
         log.debug("Adding %s/%s to %s" % (lv.name, lv.size, self.name))
+        snapshot.preserve(self)
         self._lvs.append(lv)
 
     def _removeLogVol(self, lv):
@@ -2314,6 +2442,7 @@ class LVMVolumeGroupDevice(DMDevice):
         if lv not in self.lvs:
             raise ValueError("specified lv is not part of this vg")
 
+        snapshot.preserve(self)
         self._lvs.remove(lv)
 
         if self.poolMetaData and not self.thinpools:
@@ -2328,8 +2457,9 @@ class LVMVolumeGroupDevice(DMDevice):
         if self.exists:
             raise DeviceError("cannot add pv to existing vg", self.name)
 
+        snapshot.preserve(self)
         self.parents.append(pv)
-        pv.addChild()
+        pv.addChild(self)
 
         # and update our pv count
         self.pvCount = len(self.parents)
@@ -2346,8 +2476,9 @@ class LVMVolumeGroupDevice(DMDevice):
         if self.exists:
             raise DeviceError("cannot remove pv from existing vg", self.name)
 
+        snapshot.preserve(self)
         self.parents.remove(pv)
-        pv.removeChild()
+        pv.removeChild(self)
 
         # and update our pv count
         self.pvCount = len(self.parents)
@@ -2585,7 +2716,7 @@ class LVMLogicalVolumeDevice(DMDevice):
                               self.vg.pvs)
             if not validpvs:
                 for dev in self.parents:
-                    dev.removeChild()
+                    dev.removeChild(self)
                 raise SinglePhysicalVolumeError(self.singlePVerr)
 
         # here we go with the circular references
@@ -2865,6 +2996,7 @@ class LVMThinPoolDevice(LVMLogicalVolumeDevice):
         # TODO: add some checking to prevent overcommit for preexisting
         self.vg._addLogVol(lv)
         log.debug("Adding %s/%s to %s" % (lv.name, lv.size, self.name))
+        snapshot.preserve(self)
         self._lvs.append(lv)
 
     def _removeLogVol(self, lv):
@@ -2872,6 +3004,7 @@ class LVMThinPoolDevice(LVMLogicalVolumeDevice):
         if lv not in self._lvs:
             raise ValueError("specified lv is not part of this vg")
 
+        snapshot.preserve(self)
         self._lvs.remove(lv)
         self.vg._removeLogVol(lv)
 
@@ -2965,6 +3098,7 @@ class MDRaidArrayDevice(StorageDevice):
     _type = "mdarray"
     _packages = ["mdadm"]
     _devDir = "/dev/md"
+    _treeAttrs = StorageDevice._treeAttrs | frozenset(["_memberDevices"])
 
     def __init__(self, name, level=None, major=None, minor=None, size=None,
                  memberDevices=None, totalDevices=None,
@@ -3004,7 +3138,7 @@ class MDRaidArrayDevice(StorageDevice):
         # For new arrays check if we have enough members
         if (not exists and parents and len(parents) < self.level.min_members):
             for dev in self.parents:
-                dev.removeChild()
+                dev.removeChild(self)
             raise DeviceError, P_("A %(raidLevel)s set requires at least %(minMembers)d member",
                                  "A %(raidLevel)s set requires at least %(minMembers)d members",
                                  self.level.min_members) % \
@@ -3030,7 +3164,7 @@ class MDRaidArrayDevice(StorageDevice):
         self.formatClass = get_device_format_class("mdmember")
         if not self.formatClass:
             for dev in self.parents:
-                dev.removeChild()
+                dev.removeChild(self)
             raise DeviceError("cannot find class for 'mdmember'", self.name)
 
         if self.exists and self.uuid and not flags.testing:
@@ -3250,8 +3384,9 @@ class MDRaidArrayDevice(StorageDevice):
             raise ValueError("device is already a member of this array")
 
         # we added it, so now set up the relations
+        snapshot.preserve(self)
         self.devices.append(device)
-        device.addChild()
+        device.addChild(self)
 
         if flags.installer_mode:
             device.setup()
@@ -3287,8 +3422,9 @@ class MDRaidArrayDevice(StorageDevice):
         if device not in self.devices:
             raise ValueError("cannot remove non-member device from array")
 
+        snapshot.preserve(self)
         self.devices.remove(device)
-        device.removeChild()
+        device.removeChild(self)
 
     def addMember(self, member):
         if member in self.parents:
@@ -3298,8 +3434,9 @@ class MDRaidArrayDevice(StorageDevice):
         if self.exists:
             raise DeviceError("cannot add member to existing array", self.name)
 
+        snapshot.preserve(self)
         self.parents.append(member)
-        member.addChild()
+        member.addChild(self)
         self.memberDevices += 1
 
     def removeMember(self, member):
@@ -3561,8 +3698,9 @@ class DMRaidArrayDevice(DMDevice):
             raise ValueError("device is already a member of this array")
 
         # we added it, so now set up the relations
+        snapshot.preserve(self)
         self.devices.append(device)
-        device.addChild()
+        device.addChild(self)
 
     @property
     def members(self):
@@ -3577,13 +3715,19 @@ class DMRaidArrayDevice(DMDevice):
         """ Deactivate the raid set. """
         log_method_call(self, self.name, status=self.status)
         # This call already checks if the set is not active.
-        self._raidSet.deactivate()
+        try:
+            self._raidSet.deactivate()
+        finally:
+            dm.invalidate()
 
     def activate(self):
         """ Activate the raid set. """
         log_method_call(self, self.name, status=self.status)
         # This call already checks if the set is active.
-        self._raidSet.activate(mknod=True)
+        try:
+            self._raidSet.activate(mknod=True)
+        finally:
+            dm.invalidate()
         udev_settle()
 
     def _setup(self, orig=False):
@@ -3680,6 +3824,7 @@ class MultipathDevice(DMDevice):
     def addParent(self, parent):
         """ Add a parent device to the mpath. """
         log_method_call(self, self.name, status=self.status)
+        snapshot.preserve(self)
         if self.status:
             self.teardown()
             self.parents.append(parent)
@@ -3687,6 +3832,8 @@ class MultipathDevice(DMDevice):
         else:
             self.parents.append(parent)
 
+        parent.addChild(self)
+
     def deactivate(self):
         """ 
         This is never called, included just for documentation.
@@ -3709,13 +3856,18 @@ class MultipathDevice(DMDevice):
             except Exception as e:
                 raise MPathError("failed to tear down multipath device %s: %s"
                                 % (self.name, e))
+            finally:
+                dm.invalidate()
 
     def _setup(self, orig=False):
         """ Open, or set up, a device. """
         log_method_call(self, self.name, orig=orig, status=self.status,
                         controllable=self.controllable)
         udev_settle()
-        rc = util.run_program(["multipath", self.name])
+        try:
+            rc = util.run_program(["multipath", self.name])
+        finally:
+            dm.invalidate()
         if rc:
             raise MPathError("multipath activation failed for '%s'" %
                             self.name, hardware_fault=True)
@@ -3968,7 +4120,7 @@ class LoopDevice(StorageDevice):
     def status(self):
         return (self.slave.status and
                 self.name.startswith("loop") and
-                loop.get_loop_name(self.slave.path) == self.name)
+                loop.is_loop_backed_by(self.name, self.slave.path))
 
     @property
     def size(self):
@@ -4519,8 +4671,9 @@ class BTRFSVolumeDevice(BTRFSDevice):
         if device in self.parents:
             raise ValueError("device is already a member of this volume")
 
+        snapshot.preserve(self)
         self.parents.append(device)
-        device.addChild()
+        device.addChild(self)
 
     def _removeDevice(self, device):
         """ Remove a device from the volume.
@@ -4531,12 +4684,13 @@ class BTRFSVolumeDevice(BTRFSDevice):
                         self.name,
                         device=device.name,
                         status=self.status)
+        snapshot.preserve(self)
         try:
             self.parents.remove(device)
         except ValueError:
             raise ValueError("cannot remove non-member device from volume")
 
-        device.removeChild()
+        device.removeChild(self)
 
     def addMember(self, member):
         if member in self.parents:
@@ -4546,8 +4700,9 @@ class BTRFSVolumeDevice(BTRFSDevice):
         if self.exists:
             raise DeviceError("cannot add member to existing volume", self.name)
 
+        snapshot.preserve(self)
         self.parents.append(member)
-        member.addChild()
+        member.addChild(self)
 
     def removeMember(self, member):
         if member not in self.parents:
@@ -4556,13 +4711,15 @@ class BTRFSVolumeDevice(BTRFSDevice):
         if self.exists:
             raise DeviceError("cannot remove member from an existing volume")
 
+        snapshot.preserve(self)
         self.parents.remove(member)
-        member.removeChild()
+        member.removeChild(self)
 
     def _addSubVolume(self, vol):
         if vol.name in [v.name for v in self.subvolumes]:
             raise ValueError("subvolume %s already exists" % vol.name)
 
+        snapshot.preserve(self)
         self.subvolumes.append(vol)
 
     def _removeSubVolume(self, name):
@@ -4570,6 +4727,7 @@ class BTRFSVolumeDevice(BTRFSDevice):
             raise ValueError("cannot remove non-existent subvolume %s" % name)
 
         names = [v.name for v in self.subvolumes]
+        snapshot.preserve(self)
         self.subvolumes.pop(names.index(name))
 
     def listSubVolumes(self):
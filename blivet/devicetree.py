@@ -25,8 +25,11 @@ import stat
 import block
 import re
 import shutil
-import pprint
 import copy
+import sys
+import heapq
+import threading
+import Queue
 
 from errors import *
 from devices import *
@@ -40,12 +43,14 @@ import devicelibs.lvm
 import devicelibs.mpath
 import devicelibs.loop
 import devicelibs.edd
+import probecache
+import snapshot
 from udev import *
 import util
 from platform import platform
 import tsort
 from flags import flags
-from storage_log import log_method_call, log_method_return
+from storage_log import log_method_call, log_method_return, LazyPFormat
 import parted
 import _ped
 from i18n import _
@@ -75,6 +80,10 @@ class DeviceTree(object):
         for leaf devices, except for resize actions.
     """
 
+    # formats whose devices can be combined with others into a new device
+    _multiDeviceFormats = ["lvmpv", "mdmember", "dmraidmember", "btrfs",
+                           "multipath_member"]
+
     def __init__(self, conf=None, passphrase=None, luksDict=None,
                  iscsi=None, dasd=None):
         """
@@ -90,14 +99,33 @@ class DeviceTree(object):
             :type dasd: :class:`~.dasd.DASD`
 
         """
+        # protects the lookup indexes and generation from actions executing
+        # in worker threads, see _executeActionsInParallel
+        self._lock = threading.RLock()
+
         self.reset(conf, passphrase, luksDict, iscsi, dasd)
 
+    def __deepcopy__(self, memo):
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        for (attr, value) in self.__dict__.items():
+            if attr == "_lock":
+                new.__dict__[attr] = threading.RLock()
+            else:
+                new.__dict__[attr] = copy.deepcopy(value, memo)
+
+        return new
+
     def reset(self, conf=None, passphrase=None, luksDict=None,
               iscsi=None, dasd=None):
         """ Reset the instance to its initial state. """
+        # detach any devices from a previous population
+        for device in getattr(self, "_devices", []) + getattr(self, "_hidden", []):
+            device._devicetree = None
+
         # internal data members
         self._devices = []
-        self._actions = []
+        self._actions = ActionList()
         self._completed_actions = []
 
         # a list of all device names we encounter
@@ -105,6 +133,26 @@ class DeviceTree(object):
 
         self._hidden = []
 
+        # bumped on every change that can affect self.devices
+        self._generation = 0
+        self._views = {}
+        self._viewsGeneration = None
+
+        self._resetLookupIndexes()
+
+        # lvm's view of all pvs and lvs, shared by the lvm handlers
+        self._lvmReport = devicelibs.lvm.LVMReport()
+
+        # (major, minor) -> mdadm's info for all md members, see
+        # _getMDMemberInfo
+        self._mdMemberInfo = None
+
+        # multipath's view of which disks are multipath members
+        self._mpathMembers = devicelibs.mpath.MultipathMembers()
+
+        # the backing files of all loop devices
+        self._loopIndex = devicelibs.loop.LoopIndex()
+
         # indicates whether or not the tree has been fully populated
         self.populated = False
 
@@ -157,60 +205,292 @@ class DeviceTree(object):
         # disk image files are automatically exclusive
         self.exclusiveDisks = self.diskImages.keys()
 
+    #
+    # lookup indexes
+    #
+    # The getDeviceBy* methods are backed by secondary indexes that map a key
+    # (name, path, uuid, &c) to the set of devices, visible or hidden, that
+    # currently have that key. Devices report changes to their keys via
+    # Device._lookupKeysChanged. Each device also gets a sequence number as
+    # it is added to self._devices or self._hidden so the lookups can return
+    # the same device a scan of self._devices + self._hidden would.
+    #
+    # Lists derived from the tree's contents can be cached with _getView,
+    # which recomputes them when the tree's generation changes.
+    #
+    _lookupIndexNames = ("name", "path", "uuid", "sysfsPath", "label",
+                         "serial", "id", "type", "formatType", "class")
+
+    def _resetLookupIndexes(self):
+        """ Drop the contents of the lookup indexes. """
+        self._lookupIndexes = dict((n, {}) for n in self._lookupIndexNames)
+        self._lookupKeys = {}       # device -> dict of index name -> keys
+        self._lookupOrder = {}      # device -> (hidden, sequence number)
+        self._lookupSeq = 0
+        self._bumpGeneration()
+
+        # devices whose path can change without any of their attributes
+        # changing, eg: when the filesystem containing a file is mounted
+        self._volatilePaths = set()
+
+    def _rebuildLookupIndexes(self):
+        """ Rebuild the lookup indexes from self._devices and self._hidden. """
+        for device in self._lookupOrder:
+            device._devicetree = None
+
+        self._resetLookupIndexes()
+        for device in self._devices:
+            self._addToLookupIndexes(device)
+
+        for device in self._hidden:
+            self._addToLookupIndexes(device, hidden=True)
+
+    def _getLookupKeys(self, device):
+        """ Return a dict of index name -> list of keys for a device. """
+        keys = {"name": [device.name],
+                "uuid": [device.uuid, getattr(device.format, "uuid", None)],
+                "sysfsPath": [device.sysfsPath],
+                "label": [getattr(device.format, "label", None)],
+                "type": [device.type],
+                "formatType": [getattr(device.format, "type", None)]}
+
+        if not isinstance(device, (FileDevice, BTRFSDevice)):
+            keys["path"] = [device.path]
+
+        # the lookup methods bail out early on empty values for these
+        for (index, values) in keys.items():
+            keys[index] = [v for v in values if v]
+
+        keys["id"] = [device.id]
+        keys["class"] = list(type(device).__mro__)
+        if hasattr(device, "serial"):
+            keys["serial"] = [device.serial]
+        else:
+            log.warning("device %s has no serial attr" % device.name)
+
+        return keys
+
+    def _indexLookupKeys(self, device):
+        keys = self._getLookupKeys(device)
+        self._lookupKeys[device] = keys
+        for (index, values) in keys.items():
+            for value in set(values):
+                self._lookupIndexes[index].setdefault(value, set()).add(device)
+
+        if "path" not in keys:
+            self._volatilePaths.add(device)
+
+    def _unindexLookupKeys(self, device):
+        keys = self._lookupKeys.pop(device)
+        for (index, values) in keys.items():
+            for value in set(values):
+                devices = self._lookupIndexes[index][value]
+                devices.discard(device)
+                if not devices:
+                    del self._lookupIndexes[index][value]
+
+        self._volatilePaths.discard(device)
+
+    def _addToLookupIndexes(self, device, hidden=False):
+        """ Add a device to the lookup indexes.
+
+            :param device: the device to add
+            :type device: :class:`~.devices.StorageDevice`
+            :keyword hidden: whether the device is being added to the hidden list
+            :type hidden: bool
+        """
+        with self._lock:
+            self._lookupOrder[device] = (hidden, self._lookupSeq)
+            self._lookupSeq += 1
+            self._indexLookupKeys(device)
+            device._devicetree = self
+            self._bumpGeneration()
+
+        self._journal("index", device)
+
+    def _removeFromLookupIndexes(self, device):
+        """ Remove a device from the lookup indexes.
+
+            :param device: the device to remove
+            :type device: :class:`~.devices.StorageDevice`
+        """
+        self._journal("unindex", device, self._lookupOrder[device])
+        with self._lock:
+            self._unindexLookupKeys(device)
+            del self._lookupOrder[device]
+            device._devicetree = None
+            self._bumpGeneration()
+
+    def _updateLookupIndexes(self, device, attr):
+        """ Re-index a device after one of its lookup keys changed.
+
+            :param device: the device whose keys changed
+            :type device: :class:`~.devices.StorageDevice`
+            :param attr: the name of the attribute that changed
+            :type attr: str
+
+            Renaming a device can also change the names and paths of the
+            devices that depend on it (eg: renaming a vg renames its lvs).
+        """
+        with self._lock:
+            if device not in self._lookupKeys:
+                return
+
+            self._bumpGeneration()
+            devices = [device]
+            if attr == "_name" and device.kids:
+                devices.extend(d for d in self._getDescendants(device)
+                               if d in self._lookupKeys)
+
+            for dev in devices:
+                self._unindexLookupKeys(dev)
+                self._indexLookupKeys(dev)
+
+    def _lookupDevices(self, index, key, incomplete=False, hidden=False):
+        """ Return the devices indexed under key, in tree order.
+
+            :param index: the name of the index to search
+            :type index: str
+            :param key: the value to look for
+            :keyword incomplete: include incomplete devices in results
+            :type incomplete: bool
+            :keyword hidden: include hidden devices in results
+            :type hidden: bool
+            :returns: the matching devices
+            :rtype: list of :class:`~.devices.StorageDevice`
+
+            Actions running in parallel re-index devices from their own
+            threads, so the index entries are copied with the lock held.
+        """
+        with self._lock:
+            devices = list(self._lookupIndexes[index].get(key, []))
+
+        return self._filterLookupResults(devices, incomplete=incomplete,
+                                         hidden=hidden)
+
+    def _filterLookupResults(self, devices, incomplete=False, hidden=False):
+        with self._lock:
+            order = dict((d, self._lookupOrder[d]) for d in devices
+                            if d in self._lookupOrder)
+
+        results = []
+        for device in devices:
+            if device not in order or (order[device][0] and not hidden):
+                continue
+
+            if not incomplete and not getattr(device, "complete", True):
+                continue
+
+            results.append(device)
+
+        results.sort(key=order.get)
+        return results
+
+    def _bumpGeneration(self):
+        """ Invalidate everything cached for the current tree contents. """
+        with self._lock:
+            self._generation += 1
+
+    @property
+    def generation(self):
+        """ A number that changes whenever the tree's contents change. """
+        return self._generation
+
+    def _getView(self, key, build):
+        """ Return a list derived from the tree's contents.
+
+            :param key: a key identifying the list
+            :param build: a function that computes the list
+            :type build: callable
+            :returns: a copy of the list build returned for this generation
+            :rtype: list
+        """
+        with self._lock:
+            if self._viewsGeneration != self._generation:
+                self._views = {}
+                self._viewsGeneration = self._generation
+
+            if key not in self._views:
+                self._views[key] = build()
+
+            return self._views[key][:]
+
     def addIgnoredDisk(self, disk):
         self.ignoredDisks.append(disk)
         devicelibs.lvm.lvm_cc_addFilterRejectRegexp(disk)
 
     def pruneActions(self):
         """ Remove redundant/obsolete actions from the action list. """
-        for action in reversed(self._actions[:]):
+        for action in reversed(self._actions):
             if action not in self._actions:
                 log.debug("action %d already pruned" % action.id)
                 continue
 
-            for obsolete in self._actions[:]:
+            # actions only obsolete other actions on the same device
+            for obsolete in self._actions.find(devid=action.device.id):
                 if action.obsoletes(obsolete):
                     log.info("removing obsolete action %d (%d)"
                              % (obsolete.id, action.id))
                     self._actions.remove(obsolete)
 
     def sortActions(self):
-        """ Sort actions based on dependencies. """
+        """ Sort actions based on dependencies.
+
+            Actions of a higher type (destroy, resize, create) always come
+            before actions of a lower type, so each type is sorted on its
+            own, using only the requirements among actions of that type.
+            Requirements are found via an index of the actions rather than
+            by comparing every pair of actions.
+        """
         if not self._actions:
             return
 
-        edges = []
-
-        # collect all ordering requirements for the actions
-        for action in self._actions:
-            action_idx = self._actions.index(action)
-            children = []
-            for _action in self._actions:
-                if _action == action:
-                    continue
+        all_actions = list(self._actions)
+        groups = {}
+        for (i, action) in enumerate(all_actions):
+            groups.setdefault(action.type, []).append(i)
 
-                # create edges based on both action type and dependencies.
-                if action.type > _action.type or _action.requires(action):
-                    children.append(_action)
+        order = []
+        for action_type in sorted(groups.keys(), reverse=True):
+            items = groups[action_type]
+            actions = [all_actions[i] for i in items]
+            positions = dict((a.id, i) for (i, a) in zip(items, actions))
+            index = ActionIndex(actions)
 
-            for child in children:
-                child_idx = self._actions.index(child)
-                edges.append((action_idx, child_idx))
+            # collect all ordering requirements for the actions
+            edges = set()
+            for (action_idx, action) in zip(items, actions):
+                for required in action._requiredActions(index):
+                    if required is not action:
+                        edges.add((positions[required.id], action_idx))
 
-        # create a graph reflecting the ordering information we have
-        graph = tsort.create_graph(range(len(self._actions)), edges)
+            # create a graph reflecting the ordering information we have
+            graph = tsort.create_graph(items, sorted(edges))
 
-        # perform a topological sort based on the graph's contents
-        order = tsort.tsort(graph)
+            # perform a topological sort based on the graph's contents
+            order.extend(tsort.tsort(graph))
 
         # now replace self._actions with a sorted version of the same list
-        actions = []
-        for idx in order:
-            actions.append(self._actions[idx])
-        self._actions = actions
-
-    def processActions(self, dryRun=None):
-        """ Execute all registered actions. """
+        self._actions = ActionList(all_actions[idx] for idx in order)
+
+    def processActions(self, dryRun=None, workers=None, batchCommits=None):
+        """ Execute all registered actions.
+
+            :keyword dryRun: only log the actions instead of executing them
+            :type dryRun: bool
+            :keyword workers: the most actions to execute at the same time
+                              (default is flags.action_workers)
+            :type workers: int
+            :keyword batchCommits: commit each disk's partition table once
+                                   for consecutive partition create or destroy
+                                   actions (default is
+                                   flags.batch_disklabel_commits)
+            :type batchCommits: bool
+
+            With more than one worker, actions on unrelated devices are
+            executed concurrently. See :meth:`_getActionGraph`. Commits are
+            only batched when actions are executed one at a time.
+        """
         log.info("resetting parted disks...")
         for device in self.devices:
             if device.partitioned:
@@ -255,32 +535,22 @@ class DeviceTree(object):
             log.debug("action: %s" % action)
 
             # Remove lvm filters for devices we are operating on
-            for device in (d for d in self._devices if d.dependsOn(action.device)):
+            for device in self.getDependentDevices(action.device):
                 lvm.lvm_cc_removeFilterRejectRegexp(device.name)
 
-        for action in self._actions[:]:
-            log.info("executing action: %s" % action)
-            if not dryRun:
-                try:
-                    action.execute()
-                except DiskLabelCommitError:
-                    if not flags.installer_mode:
-                        raise
+        if workers is None:
+            workers = flags.action_workers
 
-                    # it's likely that a previous format destroy action
-                    # triggered setup of an lvm or md device.
-                    for dep in self.getDependentDevices(action.device.disk):
-                       dep.teardown(recursive=True)
-                    action.execute()
+        if batchCommits is None:
+            batchCommits = flags.batch_disklabel_commits
 
-                udev_settle()
-                for device in self._devices:
-                    # make sure we catch any renumbering parted does
-                    if device.exists and isinstance(device, PartitionDevice):
-                        device.updateName()
-                        device.format.device = device.path
-
-                self._completed_actions.append(self._actions.pop(0))
+        if dryRun:
+            for action in self._actions:
+                log.info("executing action: %s" % action)
+        elif workers > 1:
+            self._executeActionsInParallel(workers)
+        else:
+            self._executeActions(batchCommits)
 
         # removal of partitions makes use of originalFormat, so it has to stay
         # up to date in case of multiple passes through this method
@@ -294,6 +564,71 @@ class DeviceTree(object):
             pdisk = partition.disk.format.partedDisk
             partition.partedPartition = pdisk.getPartitionByPath(partition.path)
 
+    #
+    # Changes to the tree's contents are recorded in the journals of any
+    # active snapshots (see :mod:`~.snapshot`) so they can be undone.
+    #
+    def _journal(self, *entry):
+        """ Record a change to the tree in the active snapshots' journals. """
+        snapshot.record(self, entry)
+
+    def _appendTo(self, attr, item):
+        """ Append an item to one of the tree's lists. """
+        getattr(self, attr).append(item)
+        self._journal("append", attr, item)
+
+    def _removeFrom(self, attr, item):
+        """ Remove an item from one of the tree's lists. """
+        items = getattr(self, attr)
+        idx = items.index(item)
+        del items[idx]
+        self._journal("remove", attr, item, idx)
+
+    def _undoJournal(self, journal):
+        """ Undo the changes recorded in a journal, newest first.
+
+            :param journal: entries recorded by :meth:`_journal`
+            :type journal: list of tuple
+
+            Devices that get added back to the lookup indexes are indexed
+            by their current attributes, so restore those first.
+        """
+        for entry in reversed(journal):
+            op = entry[0]
+            if op == "append":
+                items = getattr(self, entry[1])
+                if items and items[-1] is entry[2]:
+                    items.pop()
+                else:
+                    items.remove(entry[2])
+            elif op == "remove":
+                getattr(self, entry[1]).insert(entry[3], entry[2])
+            elif op == "index":
+                device = entry[1]
+                self._unindexLookupKeys(device)
+                del self._lookupOrder[device]
+                device._devicetree = None
+            elif op == "unindex":
+                device = entry[1]
+                self._lookupOrder[device] = entry[2]
+                self._indexLookupKeys(device)
+                device._devicetree = self
+            elif op == "registerAction":
+                self._actions.remove(entry[1])
+            elif op == "cancelAction":
+                self._actions.insert(entry[1], entry[2])
+
+        self._bumpGeneration()
+
+    def _reindexDevices(self, devices):
+        """ Update the lookup indexes for devices whose attributes changed. """
+        for device in devices:
+            if device in self._lookupKeys:
+                self._unindexLookupKeys(device)
+                self._indexLookupKeys(device)
+
+        self._bumpGeneration()
+
     def _addDevice(self, newdev):
         """ Add a device to the tree.
 
@@ -303,8 +638,9 @@ class DeviceTree(object):
             Raise ValueError if the device's identifier is already
             in the list.
         """
-        if newdev.uuid and newdev.uuid in [d.uuid for d in self._devices] and \
-           not isinstance(newdev, NoDevice):
+        if newdev.uuid and not isinstance(newdev, NoDevice) and \
+           any(d.uuid == newdev.uuid for d in
+               self._lookupDevices("uuid", newdev.uuid, incomplete=True)):
             raise ValueError("device is already in tree")
 
         # make sure this device's parent devices are in the tree already
@@ -312,14 +648,20 @@ class DeviceTree(object):
             if parent not in self._devices:
                 raise DeviceTreeError("parent device not in tree")
 
-        self._devices.append(newdev)
+        self._appendTo("_devices", newdev)
+        self._addToLookupIndexes(newdev)
+
+        # a device that was removed from the tree is no longer its parents'
+        # child, so re-establish that relationship (eg: on action cancel)
+        for parent in newdev.parents:
+            parent.addChild(newdev)
 
         # don't include "req%d" partition names
         if ((newdev.type != "partition" or
              not newdev.name.startswith("req")) and
             newdev.type != "btrfs volume" and
             newdev.name not in self.names):
-            self.names.append(newdev.name)
+            self._appendTo("names", newdev.name)
         log.info("added %s %s (id %d) to device tree" % (newdev.type,
                                                           newdev.name,
                                                           newdev.id))
@@ -371,17 +713,16 @@ class DeviceTree(object):
             elif hasattr(dev, "volume"):
                 dev.volume._removeSubVolume(dev.name)
 
-        self._devices.remove(dev)
+        self._removeFrom("_devices", dev)
+        self._removeFromLookupIndexes(dev)
         if dev.name in self.names and getattr(dev, "complete", True):
-            self.names.remove(dev.name)
+            self._removeFrom("names", dev.name)
         log.info("removed %s %s (id %d) from device tree" % (dev.type,
                                                               dev.name,
                                                               dev.id))
 
         for parent in dev.parents:
-            # Will this cause issues with garbage collection?
-            #   Do we care about garbage collection? At all?
-            parent.removeChild()
+            parent.removeChild(dev)
 
     def _removeChildrenFromTree(self, device):
         devs_to_remove = self.getDependentDevices(device)
@@ -390,10 +731,316 @@ class DeviceTree(object):
             for leaf in leaves:
                 self._removeDevice(leaf, moddisk=False)
                 devs_to_remove.remove(leaf)
-            if len(devs_to_remove) == 1 and devs_to_remove[0].isExtended:
+            if len(devs_to_remove) == 1 and \
+               isinstance(devs_to_remove[0], PartitionDevice) and \
+               devs_to_remove[0].isExtended:
                 self._removeDevice(devs_to_remove[0], force=True, moddisk=False)
                 break
 
+    def _executeAction(self, action):
+        """ Execute an action and wait for udev to process the changes. """
+        try:
+            action.execute()
+        except DiskLabelCommitError:
+            if not flags.installer_mode:
+                raise
+
+            # it's likely that a previous format destroy action
+            # triggered setup of an lvm or md device.
+            for dep in self.getDependentDevices(action.device.disk):
+               dep.teardown(recursive=True)
+            action.execute()
+        finally:
+            probecache.invalidate()
+            devicelibs.dm.invalidate()
+
+        udev_settle()
+
+    def _updatePartitionNames(self, disks=None):
+        """ Catch any renumbering parted does.
+
+            :keyword disks: only update the partitions on these disks
+            :type disks: list of :class:`~.devices.StorageDevice`
+        """
+        for device in self._devices:
+            if device.exists and isinstance(device, PartitionDevice) and \
+               (disks is None or device.disk in disks):
+                device.updateName()
+                device.format.device = device.path
+
+    def _executeActions(self, batchCommits=False):
+        """ Execute the sorted actions one at a time.
+
+            :keyword batchCommits: hold back partition table commits for
+                                   partition create and destroy actions
+            :type batchCommits: bool
+
+            With batchCommits, partition create and destroy actions only
+            change the in-memory partition table of their disk. The table is
+            committed once, before the first action that uses the disk in
+            any other way, or at the end. See :meth:`_commitPartitions`.
+
+            If an action fails, the failure is what gets raised; errors from
+            committing the remaining batches after it are only logged.
+        """
+        batches = {}        # disk -> actions waiting for a commit
+        failure = None
+        try:
+            for action in self._actions[:]:
+                log.info("executing action: %s" % action)
+                disk = None
+                if batchCommits and action.isDevice and \
+                   (action.isCreate or action.isDestroy) and \
+                   isinstance(action.device, PartitionDevice):
+                    disk = action.device.disk
+
+                ancestors = action.device.ancestors
+                for (other, batch) in batches.items():
+                    if other in ancestors and \
+                       not (other is disk and batch[0].type == action.type):
+                        del batches[other]
+                        self._commitPartitions(other, batch)
+
+                if disk is None:
+                    self._executeAction(action)
+                    self._updatePartitionNames()
+                    self._completed_actions.append(action)
+                    self._actions.remove(action)
+                    continue
+
+                if disk not in batches:
+                    batches[disk] = []
+                    for label in self._getDiskLabels(disk):
+                        label.deferCommits()
+
+                action.execute()
+                batches[disk].append(action)
+        except:
+            failure = sys.exc_info()
+            raise
+        finally:
+            # commit everything that is left, even if one of the commits fails
+            error = None
+            for (disk, batch) in batches.items():
+                try:
+                    self._commitPartitions(disk, batch)
+                except DiskLabelCommitError as e:
+                    if failure or error:
+                        log.error("failed to commit partitions on %s: %s"
+                                  % (disk.name, e))
+                    else:
+                        error = sys.exc_info()
+
+            if failure:
+                raise failure[0], failure[1], failure[2]
+            elif error:
+                raise error[0], error[1], error[2]
+
+    def _getDiskLabels(self, disk):
+        """ Return the disk's current and original disklabels. """
+        labels = []
+        for label in (disk.originalFormat, disk.format):
+            if label.type == "disklabel" and \
+               not any(l is label for l in labels):
+                labels.append(label)
+        return labels
+
+    def _commitPartitions(self, disk, actions):
+        """ Commit partition changes held back while executing actions.
+
+            :param disk: the disk the partitions are on
+            :type disk: :class:`~.devices.StorageDevice`
+            :param actions: the partition actions that were executed
+            :type actions: list of :class:`~.deviceaction.DeviceAction`
+        """
+        log.info("committing %d partition changes to %s"
+                 % (len(actions), disk.name))
+        error = None
+        for label in self._getDiskLabels(disk):
+            # flush every label so none of them keeps deferring commits
+            try:
+                label.flushCommits()
+            except DiskLabelCommitError:
+                error = error or sys.exc_info()
+
+        if error and not flags.installer_mode:
+            raise error[0], error[1], error[2]
+        elif error:
+            # the changes have been reverted, so try again one at a time
+            for dep in self.getDependentDevices(disk):
+               dep.teardown(recursive=True)
+            for action in actions:
+                action.execute()
+
+        probecache.invalidate()
+        devicelibs.dm.invalidate()
+        udev_settle()
+        self._updatePartitionNames()
+        for action in actions:
+            self._completed_actions.append(action)
+            self._actions.remove(action)
+
+    def _getActionLocks(self, action):
+        """ Return the ids of the devices an action uses.
+
+            :param action: the action
+            :type action: :class:`~.deviceaction.DeviceAction`
+            :returns: the ids of the devices the action changes and the ids
+                      of the other devices it only needs to be there
+            :rtype: tuple of two sets
+        """
+        device = action.device
+        exclusive = set([device.id])
+        if action.isDevice:
+            # creating, resizing or removing a device also changes its
+            # parents, eg: an lv's vg or a partition's disklabel
+            exclusive.update(p.id for p in device.parents)
+        elif isinstance(device, PartitionDevice) and device.disk:
+            # partition flags get committed to the disklabel
+            exclusive.add(device.disk.id)
+
+        shared = set(d.id for d in device.ancestors) - exclusive
+        return (exclusive, shared)
+
+    def _getActionGraph(self, actions):
+        """ Return the order in which sorted actions have to run.
+
+            :param actions: the sorted actions
+            :type actions: list of :class:`~.deviceaction.DeviceAction`
+            :returns: a list of successor index sets and a list of
+                      predecessor counts, both indexed like actions
+            :rtype: tuple of two lists
+
+            An action has to wait for the earlier actions that change a
+            device it uses and for the earlier actions that use a device it
+            changes. Every action an action requires acts on a device one of
+            them uses, so this keeps all of the ordering from sortActions
+            that matters, and actions on unrelated devices (eg: formats on
+            two lvs) do not wait for each other.
+        """
+        successors = [set() for a in actions]
+        incoming = [0] * len(actions)
+        writers = {}        # device id -> last action to change it
+        readers = {}        # device id -> actions using it since then
+        for (idx, action) in enumerate(actions):
+            (exclusive, shared) = self._getActionLocks(action)
+            predecessors = set()
+            for devid in exclusive:
+                if devid in writers:
+                    predecessors.add(writers[devid])
+                predecessors.update(readers.pop(devid, []))
+                writers[devid] = idx
+
+            for devid in shared:
+                if devid in writers:
+                    predecessors.add(writers[devid])
+                readers.setdefault(devid, []).append(idx)
+
+            for predecessor in predecessors:
+                successors[predecessor].add(idx)
+            incoming[idx] = len(predecessors)
+
+        return (successors, incoming)
+
+    def _executeActionsInParallel(self, workers):
+        """ Execute the sorted actions using a pool of worker threads.
+
+            :param workers: the number of worker threads
+            :type workers: int
+
+            All actions of one type (destroy, resize, create) finish before
+            any action of the next type starts. Within a type, an action
+            starts once the actions it has to wait for are done. See
+            :meth:`_getActionGraph`.
+
+            If an action fails no more actions are started. Once the running
+            actions finish the first error is raised again, leaving the
+            failed action and those that did not run in the action list.
+
+            The tree's lookup indexes are updated under the tree's lock as
+            the actions change their devices. Partition names are only
+            updated on the main thread, and only on the disks a finished
+            action changed; no running action can be changing those.
+        """
+        actions = list(self._actions)
+        (successors, incoming) = self._getActionGraph(actions)
+
+        phases = []
+        remaining = []
+        for (idx, action) in enumerate(actions):
+            if not idx or action.type != actions[idx - 1].type:
+                remaining.append(0)
+            phases.append(len(remaining) - 1)
+            remaining[-1] += 1
+
+        ready = [idx for (idx, count) in enumerate(incoming) if not count]
+        heapq.heapify(ready)
+
+        todo = Queue.Queue()
+        done = Queue.Queue()
+
+        def worker():
+            while True:
+                idx = todo.get()
+                if idx is None:
+                    return
+
+                try:
+                    self._executeAction(actions[idx])
+                except Exception:
+                    done.put((idx, sys.exc_info()))
+                else:
+                    done.put((idx, None))
+
+        threads = [threading.Thread(target=worker) for i in range(workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        phase = 0
+        running = 0
+        error = None
+        try:
+            while True:
+                while error is None and ready and running < workers and \
+                      phases[ready[0]] == phase:
+                    idx = heapq.heappop(ready)
+                    log.info("executing action: %s" % actions[idx])
+                    todo.put(idx)
+                    running += 1
+
+                if not running:
+                    break
+
+                (idx, exc_info) = done.get()
+                running -= 1
+                if exc_info:
+                    log.error("action failed: %s" % actions[idx])
+                    if error is None:
+                        error = exc_info
+                    continue
+
+                exclusive = self._getActionLocks(actions[idx])[0]
+                self._updatePartitionNames([d for d in self._devices
+                                            if d.id in exclusive])
+                self._completed_actions.append(actions[idx])
+                self._actions.remove(actions[idx])
+
+                remaining[phases[idx]] -= 1
+                while phase < len(remaining) and not remaining[phase]:
+                    phase += 1
+
+                for successor in successors[idx]:
+                    incoming[successor] -= 1
+                    if not incoming[successor]:
+                        heapq.heappush(ready, successor)
+        finally:
+            for thread in threads:
+                todo.put(None)
+
+        if error:
+            raise error[0], error[1], error[2]
+
     def registerAction(self, action):
         """ Register an action to be performed at a later time.
 
@@ -421,6 +1068,7 @@ class DeviceTree(object):
 
         log.info("registered action: %s" % action)
         self._actions.append(action)
+        self._journal("registerAction", action)
 
     def cancelAction(self, action):
         """ Cancel a registered action.
@@ -442,6 +1090,7 @@ class DeviceTree(object):
             self._addDevice(action.device)
 
         action.cancel()
+        self._journal("cancelAction", action, self._actions.position(action))
         self._actions.remove(action)
         log.info("canceled action %s", action)
 
@@ -468,29 +1117,23 @@ class DeviceTree(object):
         """
         if device is None and type is None and object is None and \
            path is None and devid is None:
-            return self._actions[:]
+            return list(self._actions)
 
         # convert the string arguments to the types used in actions
         _type = action_type_from_string(type)
         _object = action_object_from_string(object)
 
+        if devid is None and device is not None:
+            devid = device.id
+
         actions = []
-        for action in self._actions:
+        for action in self._actions.find(devid=devid, type=_type, obj=_object):
             if device is not None and action.device != device:
                 continue
 
-            if _type is not None and action.type != _type:
-                continue
-
-            if _object is not None and action.obj != _object:
-                continue
-
             if path is not None and action.device.path != path:
                 continue
 
-            if devid is not None and action.device.id != devid:
-                continue
-                
             actions.append(action)
 
         return actions
@@ -503,19 +1146,35 @@ class DeviceTree(object):
             :param dep: the device whose dependents we are looking for
             :type dep: :class:`~.devices.StorageDevice`
         """
-        dependents = []
-
-        # don't bother looping looking for dependents if this is a leaf device
+        # don't bother looking for dependents if this is a leaf device
         if dep.isleaf:
-            return dependents
-
-        incomplete = [d for d in self._devices
+            return []
+
+        dependents = self._filterLookupResults([d for d in self._getDescendants(dep)
+                                                  if d in self._lookupOrder],
+                                               incomplete=True)
+        # complete devices first, as in self.devices
+        complete = [d for d in dependents if getattr(d, "complete", True)]
+        incomplete = [d for d in dependents
                             if not getattr(d, "complete", True)]
-        for device in self.devices + incomplete:
-            if device.dependsOn(dep):
-                dependents.append(device)
+        return complete + incomplete
+
+    def _getDescendants(self, device):
+        """ Return the set of devices that depend on device.
+
+            This only follows the devices' dependents, so it takes time
+            proportional to the size of the subtree rather than of the
+            whole tree. The result is not limited to devices in the tree.
+        """
+        descendants = set()
+        queue = [device]
+        while queue:
+            for dependent in queue.pop().dependents:
+                if dependent not in descendants and dependent is not device:
+                    descendants.add(dependent)
+                    queue.append(dependent)
 
-        return dependents
+        return descendants
 
     def isIgnored(self, info):
         """ Return True if info is a device we should ignore.
@@ -574,7 +1233,7 @@ class DeviceTree(object):
 
         if name.startswith("loop"):
             # ignore loop devices unless they're backed by a file
-            return (not devicelibs.loop.get_backing_file(name))
+            return (not self._loopIndex.backing_file(name))
 
         if self.udevDeviceIsDisk(info):
             # Ignore any readonly disks
@@ -908,6 +1567,22 @@ class DeviceTree(object):
         self._addDevice(device)
         return device
 
+    def _isMultipathMember(self, info):
+        """ Return True if a disk is a multipath member.
+
+            :param info: the disk's udev info
+            :type info: dict
+            :rtype: bool
+
+            multipath's state is read once per populate instead of running
+            multipath for every disk.
+        """
+        if udev_device_is_multipath_path(info):
+            return True
+
+        return self._mpathMembers.is_member(udev_device_get_name(info),
+                                            wwid=info.get("ID_SERIAL"))
+
     def addUdevDiskDevice(self, info):
         name = udev_device_get_name(info)
         log_method_call(self, name=name)
@@ -1005,7 +1680,7 @@ class DeviceTree(object):
                           minor=udev_device_get_minor(info),
                           sysfsPath=sysfs_path, **kwargs)
 
-        if devicelibs.mpath.is_multipath_member(device.path):
+        if self._isMultipathMember(info):
             info["ID_FS_TYPE"] = "multipath_member"
 
         if diskType == DASDDevice:
@@ -1050,9 +1725,16 @@ class DeviceTree(object):
         self._addDevice(device)
         return device
 
-    def addUdevDevice(self, info):
+    def addUdevDevice(self, info, handleFormat=True):
+        """ Add a device and its formatting to the tree.
+
+            :param info: the device's udev info
+            :type info: dict
+            :keyword handleFormat: whether to scan the device's formatting
+            :type handleFormat: bool
+        """
         name = udev_device_get_name(info)
-        log_method_call(self, name=name, info=pprint.pformat(info))
+        log_method_call(self, name=name, info=LazyPFormat(info))
         uuid = udev_device_get_uuid(info)
         sysfs_path = udev_device_get_sysfs_path(info)
 
@@ -1073,7 +1755,7 @@ class DeviceTree(object):
 
         # make sure we note the name of every device we see
         if name not in self.names:
-            self.names.append(name)
+            self._appendTo("names", name)
 
         if self.isIgnored(info):
             log.info("ignoring %s (%s)" % (name, sysfs_path))
@@ -1090,8 +1772,7 @@ class DeviceTree(object):
                 # make sure any device we found is an md device
                 device = None
 
-        if device and device.isDisk and \
-           devicelibs.mpath.is_multipath_member(device.path):
+        if device and device.isDisk and self._isMultipathMember(info):
             # mark as multipath_member also when repopulating devicetree
             info["ID_FS_TYPE"] = "multipath_member"
             # newly added device (eg iSCSI) could make this one a multipath member
@@ -1174,6 +1855,10 @@ class DeviceTree(object):
             log.debug("no device or no media present")
             return
 
+        if not handleFormat:
+            log.info("not scanning the contents of %s" % name)
+            return
+
         # now handle the device's formatting
         self.handleUdevDeviceFormat(info, device)
         log.info("got device: %r" % device)
@@ -1277,7 +1962,7 @@ class DeviceTree(object):
             except (LUKSError, CryptoError, DeviceError) as e:
                 log.info("setup of %s failed: %s" % (device.format.mapName,
                                                      e))
-                device.removeChild()
+                device.removeChild(luks_device)
             else:
                 luks_device.updateSysfsPath()
                 self._addDevice(luks_device)
@@ -1334,7 +2019,7 @@ class DeviceTree(object):
 
             if lv_attr[0] in 'Ss':
                 log.info("found lvm snapshot volume '%s'" % name)
-                origin_name = devicelibs.lvm.lvorigin(vg_name, lv_name)
+                origin_name = self._lvmReport.lvorigin(vg_name, lv_name)
                 if not origin_name:
                     log.error("lvm snapshot '%s-%s' has unknown origin"
                                 % (vg_name, lv_name))
@@ -1392,7 +2077,7 @@ class DeviceTree(object):
                 lv_class = LVMThinPoolDevice
             elif lv_attr[0] == 'V':
                 # thin volume
-                pool_name = devicelibs.lvm.thinlvpoolname(vg_name, lv_name)
+                pool_name = self._lvmReport.thinlvpoolname(vg_name, lv_name)
                 pool_device_name = "%s-%s" % (vg_name, pool_name)
                 pool_device = self.getDeviceByName(pool_device_name)
                 if pool_device is None:
@@ -1499,7 +2184,7 @@ class DeviceTree(object):
                                              exists=True)
             self._addDevice(vg_device)
 
-        info.update(lvm.lvs(vg_name))
+        info.update(self._lvmReport.lvs(vg_name))
 
         # Now we add any lv info found in this pv to the vg_device, we
         # do this for all pvs as pvs only contain lv info for lvs which they
@@ -1527,7 +2212,7 @@ class DeviceTree(object):
 
             name = "%s-%s" % (vg_name, lv_names[i])
             if name not in self.names:
-                self.names.append(name)
+                self._appendTo("names", name)
 
         self.handleVgLvs(vg_device)
 
@@ -1648,7 +2333,10 @@ class DeviceTree(object):
                 dm_array._addDevice(device)
             else:
                 # Activate the Raid set.
-                rs.activate(mknod=True)
+                try:
+                    rs.activate(mknod=True)
+                finally:
+                    devicelibs.dm.invalidate()
                 dm_array = DMRaidArrayDevice(rs.name,
                                              raidSet=rs,
                                              parents=[device])
@@ -1726,6 +2414,43 @@ class DeviceTree(object):
                                               exists=True)
                 self._addDevice(subvol)
 
+    def _getMDMemberInfo(self, info, device):
+        """ Return mdadm's information about an md member device.
+
+            :param info: the device's udev info
+            :type info: dict
+            :param device: the md member device
+            :type device: :class:`~.devices.StorageDevice`
+            :returns: information like :func:`~.devicelibs.mdraid.mdexamine`'s
+            :rtype: dict
+
+            The first call after the start of a populate examines every md
+            member udev knows about with a single run of mdadm.
+        """
+        if self._mdMemberInfo is None:
+            members = [dev for dev in udev_get_block_devices()
+                       if udev_device_get_format(dev) in
+                       formats.mdraid.MDRaidMember._udevTypes]
+            paths = ["/dev/" + dev["name"] for dev in members]
+            scan = devicelibs.mdraid.mdexamine_scan(paths)
+
+            self._mdMemberInfo = {}
+            for (dev, path) in zip(members, paths):
+                if path in scan:
+                    key = (udev_device_get_major(dev),
+                           udev_device_get_minor(dev))
+                    self._mdMemberInfo[key] = scan[path]
+
+        try:
+            key = (udev_device_get_major(info), udev_device_get_minor(info))
+        except (KeyError, ValueError):
+            key = None
+
+        if key in self._mdMemberInfo:
+            return self._mdMemberInfo[key]
+
+        return devicelibs.mdraid.mdexamine(device.path)
+
     def handleUdevDeviceFormat(self, info, device):
         log_method_call(self, name=getattr(device, "name", None))
         name = udev_device_get_name(info)
@@ -1771,7 +2496,7 @@ class DeviceTree(object):
             # luks/dmcrypt
             kwargs["name"] = "luks-%s" % uuid
         elif format_type in formats.mdraid.MDRaidMember._udevTypes:
-            info.update(devicelibs.mdraid.mdexamine(device.path))
+            info.update(self._getMDMemberInfo(info, device))
 
             # mdraid
             try:
@@ -1781,7 +2506,7 @@ class DeviceTree(object):
             kwargs["biosraid"] = udev_device_is_biosraid_member(info)
         elif format_type == "LVM2_member":
             # lvm
-            info.update(devicelibs.lvm.pvinfo(device.path))
+            info.update(self._lvmReport.pvinfo(device.path))
 
             try:
                 kwargs["vgName"] = udev_device_get_vg_name(info)
@@ -1905,29 +2630,43 @@ class DeviceTree(object):
         if device in self._hidden:
             return
 
+        for action in reversed(self._actions):
+            self.cancelAction(action)
+
+        self._hide(device)
+
+    def _hide(self, device):
+        """ Hide a device and its dependents without canceling any actions.
+
+            :param device: the device to hide
+            :type device: :class:`~.devices.StorageDevice`
+
+            Only for devices that no action involves, see :meth:`hide`.
+        """
+        if device in self._hidden:
+            return
+
         for d in self.getChildren(device):
-            self.hide(d)
+            self._hide(d)
 
         log.info("hiding device %s %s (id %d)" % (device.type,
                                                   device.name,
                                                   device.id))
 
-        for action in reversed(self._actions):
-            self.cancelAction(action)
-
         if not device.exists:
             return
 
         self._removeDevice(device, moddisk=False)
 
-        self._hidden.append(device)
+        self._appendTo("_hidden", device)
+        self._addToLookupIndexes(device, hidden=True)
         lvm.lvm_cc_addFilterRejectRegexp(device.name)
 
         if isinstance(device, DASDDevice):
             self.dasd.remove(device)
 
         if device.name not in self.names:
-            self.names.append(device.name)
+            self._appendTo("names", device.name)
 
     def unhide(self, device):
         """ Restore a device's visibility.
@@ -1948,11 +2687,13 @@ class DeviceTree(object):
                 log.info("unhiding device %s %s (id %d)" % (hidden.type,
                                                             hidden.name,
                                                             hidden.id))
-                self._hidden.remove(hidden)
-                self._devices.append(hidden)
+                self._removeFrom("_hidden", hidden)
+                self._removeFromLookupIndexes(hidden)
+                self._appendTo("_devices", hidden)
+                self._addToLookupIndexes(hidden)
                 lvm.lvm_cc_removeFilterRejectRegexp(hidden.name)
                 for parent in hidden.parents:
-                    parent.addChild()
+                    parent.addChild(hidden)
 
                 if isinstance(device, DASDDevice):
                     self.dasd.append(device)
@@ -2036,22 +2777,36 @@ class DeviceTree(object):
     def restoreConfigs(self):
         self.backupConfigs(restore=True)
 
-    def populate(self, cleanupOnly=False):
+    def populate(self, cleanupOnly=False, scope=None):
         """ Locate all storage devices.
 
+            :keyword cleanupOnly: prepare the tree only to deactivate devices
+            :type cleanupOnly: bool
+            :keyword scope: names of the disks to scan, or None for all devices
+            :type scope: list of str
+
             Everything should already be active. We just go through and gather
             details as needed and set up the relations between various devices.
 
             Devices excluded via disk filtering (or because of disk images) are
-            scanned just the rest, but then they are hidden at the end of this
-            process.
+            hidden at the end of this process. Their contents are only scanned
+            when they could be part of a device that is not excluded, see
+            :meth:`_getExcludedDisks`.
+
+            With a scope, only the named disks and the devices on top of them
+            are scanned again, see :meth:`updateDevices`. Pending actions on
+            those devices are canceled. The rest of the tree and the actions
+            on it are left as they are.
         """
         self.backupConfigs()
         if cleanupOnly:
             self._cleanup = True
 
         try:
-            self._populate()
+            if scope is None:
+                self._populate()
+            else:
+                self._populateScope(scope)
         except Exception:
             raise
         finally:
@@ -2063,6 +2818,11 @@ class DeviceTree(object):
 
         # this has proven useful when populating after opening a LUKS device
         udev_settle()
+        self._resetProbeState()
+
+        # only the devices that changed since the last run get probed again
+        if flags.probe_cache_file:
+            probecache.load(flags.probe_cache_file)
 
         if flags.installer_mode and not flags.image_install:
             devicelibs.mpath.set_friendly_names(enabled=flags.multipath_friendly_names)
@@ -2073,28 +2833,10 @@ class DeviceTree(object):
         # exception originated while finding storage devices
         self.populated = False
 
-        # resolve the protected device specs to device names
-        for spec in self.protectedDevSpecs:
-            name = udev_resolve_devspec(spec)
-            log.debug("protected device spec %s resolved to %s" % (spec, name))
-            if name:
-                self.protectedDevNames.append(name)
-
-        # FIXME: the backing dev for the live image can't be used as an
-        # install target.  note that this is a little bit of a hack
-        # since we're assuming that /run/initramfs/live will exist
-        for mnt in open("/proc/mounts").readlines():
-            if " /run/initramfs/live " not in mnt:
-                continue
-
-            live_device_name = mnt.split()[0].split("/")[-1]
-            log.info("%s looks to be the live device; marking as protected"
-                     % (live_device_name,))
-            self.protectedDevNames.append(live_device_name)
-            self.liveBackingDevice = live_device_name
-            break
+        self._resolveProtectedDevices()
 
         old_devices = {}
+        excluded = set()
 
         # Now, loop and scan for devices that have appeared since the two above
         # blocks or since previous iterations.
@@ -2111,12 +2853,27 @@ class DeviceTree(object):
                 # nothing is changing -- we are finished building devices
                 break
 
+            # the partitions on excluded disks are left out altogether
+            excluded.update(self._getExcludedDisks(devices))
+            for dev in devices[:]:
+                sysfs_path = udev_device_get_sysfs_path(dev)
+                if any(sysfs_path.startswith(p + "/") for p in excluded):
+                    name = udev_device_get_name(dev)
+                    log.info("skipping %s on an excluded disk" % name)
+                    if name not in self.names:
+                        self._appendTo("names", name)
+                    devices.remove(dev)
+
             log.info("devices to scan: %s" % [d['name'] for d in devices])
             for dev in devices:
-                self.addUdevDevice(dev)
+                handleFormat = udev_device_get_sysfs_path(dev) not in excluded
+                self.addUdevDevice(dev, handleFormat=handleFormat)
 
         self.populated = True
 
+        if flags.probe_cache_file:
+            probecache.save(flags.probe_cache_file)
+
         # After having the complete tree we make sure that the system
         # inconsistencies are ignored or resolved.
         self._handleInconsistencies()
@@ -2124,13 +2881,157 @@ class DeviceTree(object):
         if flags.installer_mode:
             self.teardownAll()
 
+        # hide any subtrees that begin with an ignored disk
+        for disk in self._getIgnoredDisks(self._devices):
+            self.hide(disk)
+
+    def _populateScope(self, names):
+        """ Scan some disks and the devices on top of them again.
+
+            :param names: the names of the disks
+            :type names: list of str
+        """
+        log.info("DeviceTree.populate: scope is %s" % (names,))
+        if not self.populated:
+            self._resolveProtectedDevices()
+
+        paths = []
+        for name in names:
+            disk = self.getDeviceByName(name, incomplete=True, hidden=True)
+            if disk is not None and disk.sysfsPath:
+                paths.append(disk.sysfsPath)
+                continue
+
+            sysfs_dir = os.path.realpath("/sys/class/block/%s" % name)
+            if not os.path.exists(sysfs_dir):
+                log.warning("disk %s not found" % name)
+                continue
+
+            paths.append(sysfs_dir[len("/sys"):])
+
+        # the devices in the scope are about to be replaced
+        scoped = set()
+        for path in paths:
+            disk = self.getDeviceBySysfsPath(path, incomplete=True)
+            if disk is not None:
+                scoped.add(disk)
+                scoped.update(self._getDescendants(disk))
+
+        for action in reversed(self._actions[:]):
+            if action.device in scoped:
+                self.cancelAction(action)
+
+        self.updateDevices(changed=paths)
+        self.populated = True
+
+    def _resolveProtectedDevices(self):
+        """ Find the names of the devices that must not be changed. """
+        # resolve the protected device specs to device names
+        for spec in self.protectedDevSpecs:
+            name = udev_resolve_devspec(spec)
+            log.debug("protected device spec %s resolved to %s" % (spec, name))
+            if name:
+                self.protectedDevNames.append(name)
+
+        # FIXME: the backing dev for the live image can't be used as an
+        # install target.  note that this is a little bit of a hack
+        # since we're assuming that /run/initramfs/live will exist
+        for mnt in open("/proc/mounts").readlines():
+            if " /run/initramfs/live " not in mnt:
+                continue
+
+            live_device_name = mnt.split()[0].split("/")[-1]
+            log.info("%s looks to be the live device; marking as protected"
+                     % (live_device_name,))
+            self.protectedDevNames.append(live_device_name)
+            self.liveBackingDevice = live_device_name
+            break
+
+    def _resetProbeState(self):
+        """ Forget what was learned about the system's devices as a whole.
+
+            lvm gets run once for all pvs and once for all lvs, mdadm once
+            for all md members and multipath once for all disks; the dm maps
+            get looked at once. Call this before scanning devices so that
+            happens again.
+        """
+        devicelibs.dm.invalidate()
+        devicelibs.loop.invalidate()
+        self._lvmReport.invalidate()
+        self._mdMemberInfo = None
+        self._mpathMembers.invalidate()
+
+    def _isFilteredOut(self, name):
+        """ Return whether disk filtering excludes the disk with this name. """
+        return ((self.ignoredDisks and name in self.ignoredDisks) or
+                (self.exclusiveDisks and name not in self.exclusiveDisks))
+
+    def _getExcludedDisks(self, devices):
+        """ Return the disks whose contents need not be scanned.
+
+            :param devices: udev info for the devices about to be scanned
+            :type devices: list of dict
+            :returns: the sysfs paths of the disks
+            :rtype: set of str
+
+            A disk that disk filtering excludes is hidden at the end of
+            populate along with everything on it, so scanning its contents is
+            wasted unless they could be part of a device that is not excluded.
+            That is ruled out when the disk is not a multipath or fwraid
+            member, nothing is stacked on it or its partitions, and neither it
+            nor its partitions are formatted as members of a multi-device
+            format like lvm or md.
+        """
+        if not self.ignoredDisks and not self.exclusiveDisks:
+            return set()
+
+        infos = dict((udev_device_get_sysfs_path(info), info)
+                     for info in devices)
+        excluded = set()
+        for (path, info) in infos.items():
+            if not udev_device_is_disk(info) or udev_device_is_dm(info) or \
+               udev_device_is_md(info) or udev_device_is_loop(info):
+                continue
+
+            if not self._isFilteredOut(udev_device_get_name(info)) or \
+               udev_device_is_biosraid_member(info) or \
+               self._isMultipathMember(info):
+                continue
+
+            members = [info]
+            for dependent in udev_enumerate_dependents(path):
+                # anything else is a holder, ie: a device stacked on the disk
+                if not dependent.startswith(path + "/") or \
+                   dependent not in infos:
+                    members = None
+                    break
+
+                members.append(infos[dependent])
+
+            if members is None:
+                continue
+
+            types = set()
+            for member in members:
+                format_class = formats.get_device_format_class(udev_device_get_format(member))
+                types.add(getattr(format_class, "_type", None))
+
+            if not types.intersection(self._multiDeviceFormats):
+                excluded.add(path)
+
+        if excluded:
+            log.info("not scanning the contents of excluded disks %s"
+                     % sorted(udev_device_get_name(infos[p]) for p in excluded))
+
+        return excluded
+
+    def _getIgnoredDisks(self, devices):
+        """ Return the disks among devices that disk filtering excludes. """
         def _is_ignored(disk):
-            return ((self.ignoredDisks and disk.name in self.ignoredDisks) or
-                    (self.exclusiveDisks and
-                     disk.name not in self.exclusiveDisks))
+            return self._isFilteredOut(disk.name)
 
-        # hide any subtrees that begin with an ignored disk
-        for disk in [d for d in self._devices if d.isDisk]:
+        ignored_disks = []
+        for disk in [d for d in devices if d.isDisk]:
             if _is_ignored(disk):
                 ignored = True
                 # If the filter allows all members of a fwraid or mpath, the
@@ -2141,7 +3042,149 @@ class DeviceTree(object):
                     ignored = any(_is_ignored(d) for d in disk.parents)
 
                 if ignored:
-                    self.hide(disk)
+                    ignored_disks.append(disk)
+
+        return ignored_disks
+
+    def _removeDependents(self, device):
+        """ Remove all devices that depend on a device from the tree.
+
+            Devices are removed leaves first. A device counts as a leaf once
+            none of its children are left to remove, which also covers an
+            extended partition with logical partitions on it.
+        """
+        devices = self.getDependentDevices(device)
+        while devices:
+            leaves = [d for d in devices
+                        if not any(c in devices for c in d.children)]
+            for leaf in leaves:
+                self._removeDevice(leaf, force=True, moddisk=False)
+                devices.remove(leaf)
+
+    def _removeSubtree(self, device):
+        """ Remove a device and all devices that depend on it from the tree. """
+        self._removeDependents(device)
+        self._removeDevice(device, force=True, moddisk=False)
+
+    def updateDevices(self, added=None, changed=None, removed=None):
+        """ Update the tree for devices that udev reports have changed.
+
+            :keyword added: sysfs paths of devices that have appeared
+            :type added: list of str
+            :keyword changed: sysfs paths of devices that have changed
+            :type changed: list of str
+            :keyword removed: sysfs paths of devices that have gone away
+            :type removed: list of str
+
+            This is a cheap alternative to a full reset and :meth:`populate`
+            when a few devices change while the tree is in use, eg: when a
+            disk is hot-plugged, an iSCSI target is logged into or a LUKS
+            device is opened. The paths are the ones in udev's events, without
+            the leading /sys.
+
+            Removed devices are taken out of the tree along with everything
+            on top of them. Changed devices are taken out the same way and
+            scanned again, and so are the formats of the other members of any
+            container that was on top of them. Then changed and added devices
+            are scanned along with the partitions and holders that sysfs shows
+            on top of them. Devices involved in pending
+            actions, directly or through a device on top of them, and devices
+            whose format is active are left as they are.
+
+            A removed partition is still part of its disk's disklabel until
+            the disk is reported as changed, which the kernel does when it
+            rereads the partition table.
+        """
+        log_method_call(self, added=added, changed=changed, removed=removed)
+        udev_settle()
+        self._resetProbeState()
+
+        busy = set(a.device for a in self._actions)
+        def _keep(device, reason):
+            if device in busy or busy.intersection(self._getDescendants(device)):
+                log.info("not %s %s: it has pending actions" % (reason,
+                                                                device.name))
+                return True
+
+            if device.format.status:
+                log.info("not %s %s: its format is active" % (reason,
+                                                              device.name))
+                return True
+
+            return False
+
+        for path in removed or []:
+            device = self.getDeviceBySysfsPath(path, incomplete=True)
+            if device is None or _keep(device, "removing"):
+                continue
+
+            self._removeSubtree(device)
+
+        paths = list(added or [])
+        stale = []
+        for path in changed or []:
+            device = self.getDeviceBySysfsPath(path, incomplete=True)
+            if device is not None:
+                if _keep(device, "rescanning"):
+                    continue
+
+                stale.append(device)
+
+            paths.append(path)
+
+        # a changed device is added again from scratch, so its size and
+        # parted device are current; the other members of a vg or md array
+        # on top of it lose their container and get their formats rescanned
+        orphans = []
+        for device in stale:
+            if device not in self._devices:
+                # it was on top of another changed device
+                continue
+
+            for dependent in self.getDependentDevices(device):
+                orphans.extend(p for p in dependent.parents
+                                if p not in orphans)
+
+            self._removeSubtree(device)
+
+        rescan = set()
+        for device in orphans:
+            if device not in self._devices:
+                continue
+
+            self._removeDependents(device)
+            device.format = None
+            rescan.add(device.sysfsPath)
+            paths.append(device.sysfsPath)
+
+        for path in paths[:]:
+            paths.extend(udev_enumerate_dependents(path))
+
+        known = set(self._devices)
+        seen = set()
+        devices = []
+        for path in paths:
+            if path in seen:
+                continue
+
+            seen.add(path)
+            if path not in rescan and \
+               self.getDeviceBySysfsPath(path, incomplete=True):
+                continue
+
+            info = udev_get_block_device(path)
+            if info:
+                devices.append(info)
+
+        log.info("devices to scan: %s" % [d['name'] for d in devices])
+        for dev in devices:
+            self.addUdevDevice(dev)
+
+        # nothing uses the new devices yet, so hide them without canceling
+        # the pending actions
+        new = [d for d in self._devices if d not in known]
+        for disk in self._getIgnoredDisks(new):
+            self._hide(disk)
 
     def teardownAll(self):
         """ Run teardown methods on all devices. """
@@ -2176,17 +3219,10 @@ class DeviceTree(object):
             return None
 
         found = None
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        for device in devices:
-            if not incomplete and not getattr(device, "complete", True):
-                continue
-
-            if device.sysfsPath == path:
-                found = device
-                break
+        devices = self._lookupDevices("sysfsPath", path,
+                                      incomplete=incomplete, hidden=hidden)
+        if devices:
+            found = devices[0]
 
         log_method_return(self, found)
         return found
@@ -2205,20 +3241,10 @@ class DeviceTree(object):
             return None
 
         found = None
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        for device in devices:
-            if not incomplete and not getattr(device, "complete", True):
-                continue
-
-            if device.uuid == uuid:
-                found = device
-                break
-            elif device.format.uuid == uuid:
-                found = device
-                break
+        devices = self._lookupDevices("uuid", uuid,
+                                      incomplete=incomplete, hidden=hidden)
+        if devices:
+            found = devices[0]
 
         log_method_return(self, found)
         return found
@@ -2233,20 +3259,8 @@ class DeviceTree(object):
             :keyword hidden: include hidden devices in results
             :type hidden: bool
         """
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        retval = []
-        for device in devices:
-            if not incomplete and not getattr(device, "complete", True):
-                continue
-
-            if not hasattr(device, "serial"):
-                log.warning("device %s has no serial attr" % device.name)
-                continue
-            if device.serial == serial:
-                retval.append(device)
+        retval = self._lookupDevices("serial", serial,
+                                     incomplete=incomplete, hidden=hidden)
 
         log_method_return(self, retval)
         return retval
@@ -2265,21 +3279,10 @@ class DeviceTree(object):
             return None
 
         found = None
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        for device in devices:
-            if not incomplete and not getattr(device, "complete", True):
-                continue
-
-            _label = getattr(device.format, "label", None)
-            if not _label:
-                continue
-
-            if _label == label:
-                found = device
-                break
+        devices = self._lookupDevices("label", label,
+                                      incomplete=incomplete, hidden=hidden)
+        if devices:
+            found = devices[0]
 
         log_method_return(self, found)
         return found
@@ -2300,21 +3303,16 @@ class DeviceTree(object):
             return None
 
         found = None
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        for device in devices:
-            if not incomplete and not getattr(device, "complete", True):
-                continue
-
-            if device.name == name:
-                found = device
-                break
-            elif (device.type == "lvmlv" or device.type == "lvmvg") and \
-                    device.name == name.replace("--","-"):
-                found = device
-                break
+        with self._lock:
+            devices = set(self._lookupIndexes["name"].get(name, []))
+            # lvm doubles the dashes in vg and lv names when forming map names
+            devices.update(d for d in
+                           self._lookupIndexes["name"].get(name.replace("--","-"), [])
+                           if d.type == "lvmlv" or d.type == "lvmvg")
+        devices = self._filterLookupResults(devices, incomplete=incomplete,
+                                            hidden=hidden)
+        if devices:
+            found = devices[0]
 
         log_method_return(self, str(found))
         return found
@@ -2338,21 +3336,20 @@ class DeviceTree(object):
         leaf = None
         other = None
 
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
+        with self._lock:
+            devices = set(self._lookupIndexes["path"].get(path, []))
+            devices.update(d for d in
+                           self._lookupIndexes["path"].get(path.replace("--","-"), [])
+                           if d.type == "lvmlv" or d.type == "lvmvg")
+            devices.update(d for d in self._volatilePaths if d.path == path)
+        devices = self._filterLookupResults(devices, incomplete=incomplete,
+                                            hidden=hidden)
 
         for device in devices:
-            if not incomplete and not getattr(device, "complete", True):
-                continue
-
-            if (device.path == path or
-                ((device.type == "lvmlv" or device.type == "lvmvg") and
-                 device.path == path.replace("--","-"))):
-                if device.isleaf and not leaf:
-                    leaf = device
-                elif not other:
-                    other = device
+            if device.isleaf and not leaf:
+                leaf = device
+            elif not other:
+                other = device
 
         if preferLeaves:
             all_devs = [leaf, other]
@@ -2371,8 +3368,21 @@ class DeviceTree(object):
             :param device_type: the type to match
             :type device_type: str
         """
-        # TODO: expand this to catch device format types
-        return [d for d in self._devices if d.type == device_type]
+        return self._lookupDevices("type", device_type, incomplete=True)
+
+    def getDevicesByFormatType(self, format_type, incomplete=False,
+                               hidden=False):
+        """ Return a list of devices whose format has a matching type.
+
+            :param format_type: the format type to match
+            :type format_type: str
+            :keyword incomplete: include incomplete devices in search
+            :type incomplete: bool
+            :keyword hidden: include hidden devices in search
+            :type hidden: bool
+        """
+        return self._lookupDevices("formatType", format_type,
+                                   incomplete=incomplete, hidden=hidden)
 
     def getDevicesByInstance(self, device_class):
         """ Return a list of devices with a matching device class.
@@ -2380,7 +3390,7 @@ class DeviceTree(object):
             :param path: the device class to match
             :type path: class
         """
-        return [d for d in self._devices if isinstance(d, device_class)]
+        return self._lookupDevices("class", device_class, incomplete=True)
 
     def getDeviceByID(self, id_num, hidden=False):
         """ Return a device with specified device id.
@@ -2388,26 +3398,28 @@ class DeviceTree(object):
             :param int id_num: the id to look for
             :param bool hidden: if True return hidden devices 
         """
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        for device in devices:
-            if device.id == id_num:
-                return device
+        devices = self._lookupDevices("id", id_num, incomplete=True,
+                                      hidden=hidden)
+        if devices:
+            return devices[0]
 
     @property
     def devices(self):
         """ List of devices currently in the tree """
+        return self._getView("devices", self._getDevices)
+
+    def _getDevices(self):
         devices = []
+        uuids = set()
         for device in self._devices:
             if not getattr(device, "complete", True):
                 continue
 
-            if device.uuid and device.uuid in [d.uuid for d in devices] and \
+            if device.uuid and device.uuid in uuids and \
                not isinstance(device, NoDevice):
                 raise DeviceTreeError("duplicate uuids in device tree")
 
+            uuids.add(device.uuid)
             devices.append(device)
 
         return devices
@@ -2469,7 +3481,9 @@ class DeviceTree(object):
 
     def getChildren(self, device):
         """ Return a list of a device's children. """
-        return [c for c in self._devices if device in c.parents]
+        return self._filterLookupResults([c for c in device.children
+                                            if c in self._lookupOrder],
+                                         incomplete=True)
 
     def resolveDevice(self, devspec, blkidTab=None, cryptTab=None, options=None):
         """ Return the device matching the provided device specification.
@@ -60,6 +60,21 @@ class Flags(object):
         # meaningful when flags.installer_mode is False)
         self.include_nodev = False
 
+        # the most actions DeviceTree.processActions may execute at once
+        self.action_workers = 1
+
+        # commit partition tables once for a run of partition actions
+        self.batch_disklabel_commits = False
+
+        # run lvm reporting commands in a long-running lvm shell
+        self.lvm_shell = False
+
+        # file to keep the output of read-only probes in between runs; only
+        # probes of metadata that udev sees change, like md and lvm metadata,
+        # are kept, since filesystem sizes can change through a mounted
+        # filesystem without a udev event
+        self.probe_cache_file = None
+
         self.boot_cmdline = {}
 
         self.update_from_boot_cmdline()
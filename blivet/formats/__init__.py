@@ -28,6 +28,7 @@ from ..util import get_sysfs_path_by_name
 from ..util import run_program
 from ..util import ObjectID
 from ..storage_log import log_method_call
+from .. import snapshot
 from ..errors import *
 from ..devicelibs.dm import dm_node_from_name
 from ..devicelibs.mdraid import md_node_from_name
@@ -162,6 +163,11 @@ class DeviceFormat(ObjectID):
     _check = False
     _hidden = False                     # hide devices with this formatting?
     _ksMountpoint = None
+    _owner = None                       # weakref to the device using this
+    _persistentProbes = True            # can probe output be saved?
+
+    # attributes that feed the device tree's lookup indexes
+    _lookupAttrs = frozenset(["uuid", "_label"])
 
     def __init__(self, *args, **kwargs):
         """
@@ -191,6 +197,14 @@ class DeviceFormat(ObjectID):
         #if self.__class__ is DeviceFormat:
         #    self.exists = True
 
+    def __setattr__(self, attr, value):
+        snapshot.preserve(self)
+        super(DeviceFormat, self).__setattr__(attr, value)
+        if attr in self._lookupAttrs and self._owner is not None:
+            device = self._owner()
+            if device is not None:
+                device._lookupKeysChanged(attr)
+
     def __repr__(self):
         s = ("%(classname)s instance (%(id)s) object id %(object_id)d--\n"
              "  type = %(type)s  name = %(name)s  status = %(status)s\n"
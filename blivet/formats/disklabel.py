@@ -24,6 +24,7 @@ import os
 import copy
 
 from ..storage_log import log_method_call
+from .. import snapshot
 import parted
 import _ped
 from ..errors import *
@@ -70,6 +71,12 @@ class DiskLabel(DeviceFormat):
         self._alignment = None
         self._endAlignment = None
 
+        # see deferCommits
+        self._commitsDeferred = False
+        self._commitPending = False
+        self._undoCommit = []
+        self._afterCommit = []
+
         if self.partedDevice:
             # set up the parted objects and raise exception on failure
             self.updateOrigPartedDisk()
@@ -86,11 +93,11 @@ class DiskLabel(DeviceFormat):
         duplicate_attrs = ('_partedDisk', '_origPartedDisk')
         for (attr, value) in self.__dict__.items():
             if attr in shallow_copy_attrs:
-                setattr(new, attr, copy.copy(value))
+                new.__dict__[attr] = copy.copy(value)
             elif attr in duplicate_attrs:
-                setattr(new, attr, value.duplicate())
+                new.__dict__[attr] = value.duplicate()
             else:
-                setattr(new, attr, copy.deepcopy(value, memo))
+                new.__dict__[attr] = copy.deepcopy(value, memo)
 
         return new
 
@@ -263,18 +270,87 @@ class DiskLabel(DeviceFormat):
         self.partedDevice.clobber()
         self.exists = False
 
-    def commit(self):
-        """ Commit the current partition table to disk and notify the OS. """
+    def commit(self, undo=None):
+        """ Commit the current partition table to disk and notify the OS.
+
+            :keyword undo: function that reverts the changes being committed,
+                           called if the commit fails
+            :type undo: callable
+
+            While commits are deferred this only notes that there are
+            changes to commit. See :meth:`deferCommits`.
+        """
         log_method_call(self, device=self.device,
-                        numparts=len(self.partitions))
+                        numparts=len(self.partitions),
+                        deferred=self._commitsDeferred)
+        if self._commitsDeferred:
+            self._commitPending = True
+            if undo:
+                self._undoCommit.append(undo)
+            return
+
         try:
             self.partedDisk.commit()
         except parted.DiskException as msg:
+            if undo:
+                undo()
             raise DiskLabelCommitError(msg)
         else:
             self.updateOrigPartedDisk()
             udev_settle()
 
+    @property
+    def commitsDeferred(self):
+        """ Whether commits are being held back. """
+        return self._commitsDeferred
+
+    def deferCommits(self):
+        """ Hold back commits until :meth:`flushCommits` is called.
+
+            This allows changing any number of partitions in the in-memory
+            partition table and then having the kernel re-read the table
+            only once.
+        """
+        self._commitsDeferred = True
+
+    def afterCommit(self, func):
+        """ Call func once the current changes have been committed.
+
+            :param func: the function to call
+            :type func: callable
+
+            If commits are not being deferred func is called right away.
+        """
+        if self._commitsDeferred:
+            self._afterCommit.append(func)
+        else:
+            func()
+
+    def flushCommits(self):
+        """ Commit the held back changes and stop deferring commits.
+
+            If the commit fails the undo functions passed to :meth:`commit`
+            are called, most recent first, and :class:`DiskLabelCommitError`
+            is raised.
+        """
+        pending = self._commitPending
+        undo = self._undoCommit
+        after = self._afterCommit
+        self._commitsDeferred = False
+        self._commitPending = False
+        self._undoCommit = []
+        self._afterCommit = []
+
+        def undoAll():
+            for func in reversed(undo):
+                func()
+
+        if pending:
+            self.commit(undo=undoAll)
+
+        for func in after:
+            func()
+
     def commitToDisk(self):
         """ Commit the current partition table to disk. """
         log_method_call(self, device=self.device,
@@ -308,6 +384,7 @@ class DiskLabel(DeviceFormat):
         new_partition = parted.Partition(disk=self.partedDisk,
                                          type=partition.type,
                                          geometry=geometry)
+        snapshot.preserve(self)
         self.partedDisk.addPartition(partition=new_partition,
                                      constraint=constraint)
 
@@ -323,6 +400,7 @@ class DiskLabel(DeviceFormat):
                 passed is what will be removed from the disklabel.
 
         """
+        snapshot.preserve(self)
         self.partedDisk.removePartition(partition)
 
     @property
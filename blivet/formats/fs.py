@@ -31,6 +31,7 @@ from . import fslabeling
 from ..errors import *
 from . import DeviceFormat, register_device_format
 from .. import util
+from .. import probecache
 from .. import platform
 from ..flags import flags
 from parted import fileSystemType
@@ -76,6 +77,7 @@ class FS(DeviceFormat):
     _defaultInfoOptions = []
     _existingSizeFields = []
     _fsProfileSpecifier = None           # mkfs option specifying fsprofile
+    _persistentProbes = False            # sizes change without udev events
 
     def __init__(self, *args, **kwargs):
         """
@@ -230,7 +232,9 @@ class FS(DeviceFormat):
            util.find_program_in_path(self.infofsProg):
             argv = self._defaultInfoOptions + [ self.device ]
             try:
-                buf = util.capture_output([self.infofsProg] + argv)
+                buf = probecache.captureOutput([self.infofsProg] + argv,
+                                               self.device,
+                                               persistent=self._persistentProbes)
             except OSError as e:
                 log.error("failed to gather fs info: %s" % e)
 
@@ -445,6 +449,8 @@ class FS(DeviceFormat):
             ret = util.run_program([self.resizefsProg] + self.resizeArgs)
         except OSError as e:
             raise FSResizeError(e, self.device)
+        finally:
+            probecache.invalidate(self.device)
 
         if ret:
             raise FSResizeError("resize failed: %s" % ret, self.device)
@@ -485,6 +491,9 @@ class FS(DeviceFormat):
             ret = util.run_program([self.fsckProg] + self._getCheckArgs())
         except OSError as e:
             raise FSError("filesystem check failed: %s" % e)
+        finally:
+            # the check may have repaired the filesystem
+            probecache.invalidate(self.device)
 
         if self._fsckFailed(ret):
             hdr = _("%(type)s filesystem check failure on %(device)s: ") % \
@@ -962,8 +971,10 @@ class Ext2FS(FS):
                               "on %s" % (self.mountType, self.device))
 
             # get minimum size according to resize2fs
-            buf = util.capture_output([self.resizefsProg,
-                                       "-P", self.device])
+            buf = probecache.captureOutput([self.resizefsProg,
+                                            "-P", self.device],
+                                           self.device,
+                                           persistent=self._persistentProbes)
             for line in buf.splitlines():
                 if "minimum size of the filesystem:" not in line:
                     continue
@@ -1378,7 +1389,10 @@ class NTFS(FS):
         if self.exists and os.path.exists(self.device) and \
            util.find_program_in_path(self.resizefsProg):
             minSize = None
-            buf = util.capture_output([self.resizefsProg, "-m", self.device])
+            buf = probecache.captureOutput([self.resizefsProg, "-m",
+                                            self.device],
+                                           self.device,
+                                           persistent=self._persistentProbes)
             for l in buf.split("\n"):
                 if not l.startswith("Minsize"):
                     continue
@@ -1472,6 +1486,7 @@ register_device_format(Iso9660FS)
 class NoDevFS(FS):
     """ nodev filesystem base class """
     _type = "nodev"
+    _lookupAttrs = FS._lookupAttrs | frozenset(["_device"])
 
     def __init__(self, *args, **kwargs):
         FS.__init__(self, *args, **kwargs)
@@ -85,11 +85,16 @@ class MDRaidMember(DeviceFormat):
         if not self.exists:
             raise MDMemberError("format does not exist")
 
-        info = mdraid.mdexamine(self.device)
-        if self.uuid is None:
-            self.uuid = info['uuid']
+        info = mdraid.mdexamine_scan([self.device]).get(self.device)
+        if info is None:
+            info = mdraid.mdexamine(self.device)
+
+        if self.mdUuid is None:
+            self.mdUuid = info.get("MD_UUID")
         if self.raidMinor is None:
-            self.raidMinor = info['mdMinor']
+            md_node = os.path.basename(info.get("DEVICE", ""))
+            if md_node.startswith("md") and md_node[2:].isdigit():
+                self.raidMinor = int(md_node[2:])
 
     def destroy(self, *args, **kwargs):
         """ Remove the formatting from the associated block device.
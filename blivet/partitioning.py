@@ -34,6 +34,7 @@ from devices import PartitionDevice, LUKSDevice, devicePathToName
 from formats import getFormat
 from devicelibs.lvm import get_pool_padding
 from size import Size
+import snapshot
 from i18n import _
 
 import logging
@@ -670,6 +671,10 @@ def removeNewPartitions(disks, partitions):
                 % (["%s(id %d)" % (p.name, p.id) for p in partitions
                                                     if not p.exists],
                    [d.name for d in disks]))
+    # the partitions on these disks' parted.Disks are about to change
+    for disk in disks:
+        snapshot.preserve(disk.format)
+
     for part in partitions:
         if part.partedPartition and part.disk in disks:
             if part.exists:
@@ -765,6 +770,7 @@ def addPartition(disklabel, free, part_type, size, start=None, end=None):
                                  type=part_type,
                                  geometry=new_geom)
     constraint = parted.Constraint(exactGeom=new_geom)
+    snapshot.preserve(disklabel)
     disklabel.partedDisk.addPartition(partition=partition,
                                       constraint=constraint)
     return partition
@@ -1097,6 +1103,7 @@ def allocatePartitions(storage, disks, partitions, freespace):
                                              "extended partition for growth test")
                                     if new_part_type == parted.PARTITION_EXTENDED:
                                         e = disklabel.extendedPartition
+                                        snapshot.preserve(disklabel)
                                         disklabel.partedDisk.removePartition(e)
 
                                     continue
@@ -1137,6 +1144,7 @@ def allocatePartitions(storage, disks, partitions, freespace):
                                          sectorsToSize(disk_growth,
                                                        disk_sector_size)))
 
+                    snapshot.preserve(disklabel)
                     disklabel.partedDisk.removePartition(temp_part)
                     _part.partedPartition = None
                     _part.disk = None
@@ -2094,6 +2102,7 @@ def growPartitions(disks, partitions, free, size_sets=None):
                 log.debug("setting %s new geometry: %s" % (name,
                                                            partition.geometry))
                 constraint = parted.Constraint(exactGeom=partition.geometry)
+                snapshot.preserve(disklabel)
                 disklabel.partedDisk.addPartition(partition=partition,
                                                   constraint=constraint)
                 path = partition.path
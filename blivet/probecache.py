@@ -0,0 +1,335 @@
+# probecache.py
+# Cache of the output of read-only probing tools.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import json
+import os
+import stat
+import tempfile
+import threading
+
+from . import util
+
+import logging
+log = logging.getLogger("blivet")
+
+UDEV_DATA_DIR = "/run/udev/data"
+SYSFS_BLOCK_DIR = "/sys/class/block"
+
+def getGeneration(devno):
+    """ Return a value that changes every time a device changes.
+
+        :param devno: the device's number
+        :type devno: int
+        :returns: the generation, or None if it cannot be determined
+        :rtype: tuple or NoneType
+
+        udev rewrites its database entry for a device every time it handles
+        an event for the device, so the entry's inode and modification time
+        change with every change to the device that udev sees.
+    """
+    path = "%s/b%d:%d" % (UDEV_DATA_DIR, os.major(devno), os.minor(devno))
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return (st.st_ino, st.st_mtime)
+
+def getDeviceNumber(device):
+    """ Return the device number of a block device node, or None. """
+    try:
+        st = os.stat(device)
+    except (OSError, TypeError):
+        return None
+
+    if not stat.S_ISBLK(st.st_mode):
+        return None
+
+    return st.st_rdev
+
+def getBlockDeviceNumbers():
+    """ Return the device numbers of all block devices.
+
+        :returns: the sorted device numbers, or None if sysfs cannot be read
+        :rtype: list of int or NoneType
+    """
+    try:
+        names = os.listdir(SYSFS_BLOCK_DIR)
+    except OSError:
+        return None
+
+    devnos = []
+    for name in names:
+        try:
+            with open("%s/%s/dev" % (SYSFS_BLOCK_DIR, name)) as f:
+                (major, minor) = f.read().strip().split(":")
+            devnos.append(os.makedev(int(major), int(minor)))
+        except (IOError, ValueError):
+            return None
+
+    return sorted(devnos)
+
+class ProbeCache(object):
+    """ The output of read-only probing tools, by device.
+
+        Results are keyed by the tool's arguments and the numbers and
+        generations of the devices the tool looks at, so a tool is only run
+        again once udev has seen a change to one of the devices or something
+        invalidated their results. The device's node is left out of the
+        arguments in the key, so any path to the node gets the same result.
+        Devices without a generation are never cached.
+
+        A device's generation only changes when udev sees a change to it, and
+        writes through a mounted filesystem are not seen by udev. Results
+        that depend on a filesystem's contents, like its minimum size, are
+        only kept while blivet is running, and they are never saved.
+    """
+    def __init__(self):
+        self._results = {}
+        self._volatile = set()
+        self._lock = threading.Lock()
+
+    def _getGenerations(self, devnos):
+        generations = tuple(getGeneration(devno) for devno in devnos)
+        if None in generations:
+            return None
+
+        return generations
+
+    def _getKey(self, argv, devnos):
+        if devnos is None:
+            return None
+
+        generations = self._getGenerations(devnos)
+        if generations is None:
+            return None
+
+        return (tuple(devnos), generations, tuple(argv))
+
+    def _capture(self, key, argv, capture, persistent):
+        if capture is None:
+            capture = util.capture_output
+
+        if key is not None:
+            with self._lock:
+                if key in self._results:
+                    log.debug("using cached output of %s" % " ".join(argv))
+                    if not persistent:
+                        self._volatile.add(key)
+                    return self._results[key]
+
+        out = capture(argv)
+
+        if key is not None:
+            with self._lock:
+                self._results[key] = out
+                if not persistent:
+                    self._volatile.add(key)
+
+        return out
+
+    def captureOutput(self, argv, device, capture=None, persistent=True):
+        """ Return the output of a read-only probe of a device.
+
+            :param argv: the probing command
+            :type argv: list of str
+            :param device: the path to the probed device's node
+            :type device: str
+            :keyword capture: the function that runs the command
+            :type capture: callable taking argv, :func:`~.util.capture_output`
+                           by default
+            :keyword persistent: whether the output may be saved by
+                                 :meth:`save`; False for output that can
+                                 change without udev seeing a change
+            :type persistent: bool
+            :returns: the command's output
+            :rtype: str
+        """
+        devno = getDeviceNumber(device)
+        key = None
+        if devno is not None:
+            key = self._getKey([None if arg == device else arg
+                                for arg in argv],
+                               [devno])
+
+        return self._capture(key, argv, capture, persistent)
+
+    def captureReport(self, argv, devnos, capture=None):
+        """ Return the output of a read-only probe of several devices.
+
+            :param argv: the probing command
+            :type argv: list of str
+            :param devnos: the numbers of all devices the output depends on
+            :type devnos: list of int or NoneType
+            :keyword capture: the function that runs the command
+            :type capture: callable taking argv, :func:`~.util.capture_output`
+                           by default
+            :returns: the command's output
+            :rtype: str
+
+            This is for reports that cover every device a tool can see, like
+            lvm's, which only stay valid while none of the devices change and
+            no device comes or goes. Pass the numbers from
+            :func:`getBlockDeviceNumbers` for those. The output is never
+            cached if devnos is None.
+        """
+        return self._capture(self._getKey(argv, devnos), argv, capture, True)
+
+    def save(self, path):
+        """ Write the results that are still valid to a file.
+
+            :param path: the file to write
+            :type path: str
+
+            Results are saved along with the generations of their devices, so
+            :meth:`load` can tell which ones are still valid. Results that
+            are not persistent or cannot be represented as JSON, like output
+            that is not UTF-8, are left out.
+
+            The file is written under a new name in the same directory and
+            then renamed, so a reader never sees a partly written file.
+        """
+        with self._lock:
+            items = [(key, out) for (key, out) in self._results.items()
+                        if key not in self._volatile]
+
+        entries = []
+        for ((devnos, generations, argv), out) in items:
+            if self._getGenerations(devnos) != generations:
+                continue
+
+            entry = [devnos, generations, argv, out]
+            try:
+                json.dumps(entry)
+            except (TypeError, ValueError):
+                continue
+
+            entries.append(entry)
+
+        tmp = None
+        try:
+            (fd, tmp) = tempfile.mkstemp(prefix=".probecache.",
+                                         dir=os.path.dirname(path) or os.curdir)
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.rename(tmp, path)
+        except (IOError, OSError) as e:
+            log.warning("failed to save probe results to %s: %s" % (path, e))
+            if tmp is not None and os.path.exists(tmp):
+                os.unlink(tmp)
+            return
+
+        log.debug("saved %d probe results to %s" % (len(entries), path))
+
+    def load(self, path):
+        """ Add the results saved in a file that are still valid.
+
+            :param path: the file written by :meth:`save`
+            :type path: str
+
+            A result is only used if its device's generation is the same as
+            when it was saved, so only the devices that changed since then
+            get probed again.
+        """
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except (IOError, ValueError) as e:
+            log.info("not using saved probe results from %s: %s" % (path, e))
+            return
+
+        results = {}
+        for entry in entries:
+            try:
+                (devnos, generations, argv, out) = entry
+                devnos = tuple(devnos)
+                generations = tuple(tuple(g) for g in generations)
+            except (TypeError, ValueError):
+                # not an entry this version writes
+                continue
+
+            if self._getGenerations(devnos) != generations:
+                continue
+
+            argv = tuple(a if a is None else a.encode("utf-8") for a in argv)
+            results[(devnos, generations, argv)] = out.encode("utf-8")
+
+        with self._lock:
+            for (key, out) in results.items():
+                self._results.setdefault(key, out)
+
+        log.debug("loaded %d of %d probe results from %s"
+                  % (len(results), len(entries), path))
+
+    def invalidate(self, device=None):
+        """ Forget cached results.
+
+            :keyword device: the path to a device node, or None for all
+            :type device: str or NoneType
+
+            All results are forgotten if the device node no longer exists.
+        """
+        devno = None
+        if device is not None:
+            devno = getDeviceNumber(device)
+
+        with self._lock:
+            if devno is None:
+                self._results.clear()
+                self._volatile.clear()
+                return
+
+            for key in self._results.keys():
+                if devno in key[0]:
+                    del self._results[key]
+                    self._volatile.discard(key)
+
+_cache = ProbeCache()
+
+def captureOutput(argv, device, capture=None, persistent=True):
+    """ Return the output of a read-only probe, from the cache if possible.
+
+        See :meth:`ProbeCache.captureOutput`.
+    """
+    return _cache.captureOutput(argv, device, capture=capture,
+                                persistent=persistent)
+
+def captureReport(argv, devnos, capture=None):
+    """ Return the output of a read-only probe of several devices, from the
+        cache if possible.
+
+        See :meth:`ProbeCache.captureReport`.
+    """
+    return _cache.captureReport(argv, devnos, capture=capture)
+
+def save(path):
+    """ Write the cached probe results to a file, see :meth:`ProbeCache.save`. """
+    _cache.save(path)
+
+def load(path):
+    """ Add probe results from a file, see :meth:`ProbeCache.load`. """
+    _cache.load(path)
+
+def invalidate(device=None):
+    """ Forget cached probe results for a device, or for all devices.
+
+        Anything that changes a device's contents should call this.
+    """
+    _cache.invalidate(device)
@@ -0,0 +1,175 @@
+# snapshot.py
+# Copy-on-write snapshots of a Blivet instance's devices.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import copy
+import threading
+
+import parted
+
+from .util import ObjectID
+
+import logging
+log = logging.getLogger("blivet")
+
+# snapshots that are saving the state of objects as they change
+_snapshots = []
+
+# objects can change in several threads at once while actions execute
+_lock = threading.RLock()
+
+def preserve(obj):
+    """ Save an object's state in all active snapshots before it changes.
+
+        Devices and formats call this before changing any of their
+        attributes. Code that changes a list or set held by a device or
+        format in place, or a disklabel's parted.Disk, must call it first.
+    """
+    with _lock:
+        for snapshot in _snapshots:
+            snapshot.preserve(obj)
+
+def record(tree, entry):
+    """ Add an entry to the journals of the active snapshots of a tree.
+
+        :param tree: the device tree that changed
+        :type tree: :class:`~.devicetree.DeviceTree`
+        :param entry: a description of the change
+        :type entry: tuple
+
+        See :meth:`~.devicetree.DeviceTree._undoJournal` for the entries.
+    """
+    with _lock:
+        for snapshot in _snapshots:
+            if snapshot.storage.devicetree is tree:
+                snapshot._journal.append(entry)
+
+def _saveState(obj):
+    """ Return a copy of an object's attributes.
+
+        Lists, sets and dicts are copied so they can be changed in place.
+        parted.Disk instances are duplicated. Everything else, including
+        other devices and formats, is shared with the object.
+    """
+    state = {}
+    for (attr, value) in obj.__dict__.items():
+        if isinstance(value, (list, set, dict)):
+            value = copy.copy(value)
+        elif isinstance(value, parted.Disk):
+            value = value.duplicate()
+
+        state[attr] = value
+
+    return state
+
+class Snapshot(object):
+    """ The state of a Blivet instance at some point in time.
+
+        Nothing is copied when a snapshot is taken. Changes to the device
+        tree's lists of devices, names and actions are recorded in a
+        journal, and the state of each device or format that existed when
+        the snapshot was taken is saved the first time it changes. Both
+        taking a snapshot and restoring it cost time proportional to what
+        changed rather than to the size of the device tree.
+
+        A snapshot saves state until it is restored or released. It sees
+        changes to all devices and formats, so it should only be kept while
+        working with a single Blivet instance.
+    """
+    def __init__(self, storage):
+        """
+            :param storage: the Blivet instance
+            :type storage: :class:`~.Blivet`
+        """
+        self.storage = storage
+        self._roots = storage.roots[:]
+        self._journal = []
+
+        # objects created after this have nothing to restore
+        self._firstID = ObjectID.nextID()
+        self._states = {}       # id(obj) -> (obj, saved state)
+
+        _snapshots.append(self)
+
+    @property
+    def active(self):
+        """ Whether this snapshot is still saving changes. """
+        return self in _snapshots
+
+    def preserve(self, obj):
+        """ Save an object's state unless it has already been saved. """
+        obj_id = obj.__dict__.get("id")
+        if obj_id is None or obj_id >= self._firstID or \
+           id(obj) in self._states:
+            return
+
+        self._states[id(obj)] = (obj, _saveState(obj))
+
+    def release(self):
+        """ Stop saving changes and forget the saved state. """
+        if self.active:
+            _snapshots.remove(self)
+
+        self._states = {}
+        self._journal = []
+
+    def restore(self):
+        """ Return the Blivet instance to the state of this snapshot. """
+        if not self.active:
+            raise RuntimeError("snapshot is no longer active")
+
+        _snapshots.remove(self)
+        log.debug("restoring snapshot: %d objects changed, %d tree changes"
+                  % (len(self._states), len(self._journal)))
+
+        devices = []
+        disklabels = []
+        for (obj, state) in self._states.values():
+            # bypass __setattr__ so the lookup indexes aren't updated for a
+            # device that is only partly restored
+            obj.__dict__.clear()
+            obj.__dict__.update(state)
+            if "_partedDisk" in state:
+                disklabels.append(obj)
+
+            # a format's attributes are lookup keys of the device using it
+            if state.get("_owner") is not None:
+                obj = state["_owner"]()
+
+            if obj is not None:
+                devices.append(obj)
+
+        tree = self.storage.devicetree
+        tree._undoJournal(self._journal)
+        tree._reindexDevices(devices)
+        self.storage.roots = self._roots
+        self._states = {}
+        self._journal = []
+
+        # the partitions on a restored disklabel need the parted.Partition
+        # instances from its restored parted.Disk
+        for disklabel in disklabels:
+            disk = disklabel._owner() if disklabel._owner else None
+            if disk is None or disk.format is not disklabel:
+                continue
+
+            for device in disk.children:
+                if getattr(device, "_partedPartition", None):
+                    p = disklabel.partedDisk.getPartitionByPath(device.path)
+                    device.partedPartition = p
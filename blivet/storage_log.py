@@ -1,23 +1,49 @@
-import inspect
 import logging
+import pprint
+import sys
 
 log = logging.getLogger("blivet")
 log.addHandler(logging.NullHandler())
 
+IGNORED_FUNCS = frozenset(["function_name_and_depth",
+                           "log_method_call",
+                           "log_method_return"])
+
 def function_name_and_depth():
-    IGNORED_FUNCS = ["function_name_and_depth",
-                     "log_method_call",
-                     "log_method_return"]
-    stack = inspect.stack()
+    """ Return the name and stack depth of the function doing the logging.
+
+        This walks the frames directly instead of using inspect.stack(),
+        which would also read the source of every frame from disk.
+    """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_name in IGNORED_FUNCS:
+        frame = frame.f_back
+
+    if frame is None:
+        return ("unknown function?", 0)
+
+    methodname = frame.f_code.co_name
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+
+    return (methodname, depth)
 
-    for i, frame in enumerate(stack):
-        methodname = frame[3]
-        if methodname not in IGNORED_FUNCS:
-            return (methodname, len(stack) - i)
+class LazyPFormat(object):
+    """ An object that is pretty-printed only if it gets logged. """
+    __slots__ = ["obj"]
 
-    return ("unknown function?", 0)
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return pprint.pformat(self.obj)
 
 def log_method_call(d, *args, **kwargs):
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+
     classname = d.__class__.__name__
     (methodname, depth) = function_name_and_depth()
     spaces = depth * ' '
@@ -34,13 +60,14 @@ def log_method_call(d, *args, **kwargs):
             v = "Skipped"
         fmt_args.extend([k, v])
 
-    logging.getLogger("blivet").debug(fmt % tuple(fmt_args))
+    log.debug(fmt, *fmt_args)
 
 def log_method_return(d, retval):
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+
     classname = d.__class__.__name__
     (methodname, depth) = function_name_and_depth()
     spaces = depth * ' '
     fmt = "%s%s.%s returned %s"
-    fmt_args = (spaces, classname, methodname, retval)
-    logging.getLogger("blivet").debug(fmt % fmt_args)
-
+    log.debug(fmt, spaces, classname, methodname, retval)
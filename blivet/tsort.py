@@ -20,44 +20,121 @@
 # Red Hat Author(s): Dave Lehman <dlehman@redhat.com>
 #
 
+import heapq
+from collections import deque
+
 class CyclicGraphError(Exception):
-    pass
+    def __init__(self, msg, cycle=None):
+        """
+            :param msg: the error message
+            :type msg: str
+            :keyword cycle: the items that make up a cycle in the graph
+            :type cycle: list
+        """
+        if cycle:
+            msg = "%s: %s" % (msg,
+                              " -> ".join(str(i) for i in cycle + cycle[:1]))
+
+        Exception.__init__(self, msg)
+        self.cycle = cycle or []
+
+def _find_cycle(graph, remaining):
+    """ Return a list of items that form a cycle.
+
+        Arguments:
+
+            graph       -   the graph, as returned by create_graph
+            remaining   -   the items tsort could not place
+
+        Every remaining item has at least one remaining parent, so walking
+        from parent to parent must eventually revisit an item.
+    """
+    parents = {}
+    for (parent, child) in graph['edges']:
+        if parent in remaining and child in remaining:
+            parents.setdefault(child, parent)
+
+    path = []
+    position = {}
+    item = next(i for i in graph['items'] if i in remaining)
+    while item not in position:
+        position[item] = len(path)
+        path.append(item)
+        item = parents[item]
+
+    cycle = path[position[item]:]
+    cycle.reverse()
+    return cycle
+
+def tsort(graph, stable=False):
+    """ Sort the items in a graph so parents come before their children.
+
+        Arguments:
+
+            graph   -   the graph, as returned by create_graph
+
+        Keyword Arguments:
+
+            stable  -   if True, break ties using the items' order in
+                        graph['items'] instead of the default, historic
+                        last-in-first-out order
+
+        Return Value:
+
+            A list of the graph's items. The graph is not modified.
 
-def tsort(graph):
+        Raises CyclicGraphError, with the members of a cycle, if the graph
+        contains cycles.
+    """
     order = []  # sorted list of items
 
     if not graph or not graph['items']:
         return order
 
-    # determine which nodes have no incoming edges
-    roots = [n for n in graph['items'] if graph['incoming'][n] == 0]
-    if not roots:
-        raise CyclicGraphError("no root nodes")
+    outgoing = graph.get('outgoing')
+    if outgoing is None:
+        outgoing = _outgoing_edges(graph['items'], graph['edges'])
 
-    visited = []    # list of nodes visited, for cycle detection
-    while roots:
-        # remove a root, add it to the order
-        root = roots.pop()
-        if root in visited:
-            raise CyclicGraphError("graph contains cycles")
+    incoming = graph['incoming'].copy()
 
-        visited.append(root)
-        i = graph['items'].index(root)
+    # determine which nodes have no incoming edges
+    roots = [n for n in graph['items'] if incoming[n] == 0]
+    if stable:
+        index = dict((item, i) for (i, item) in enumerate(graph['items']))
+        ready = [(index[n], n) for n in roots]
+        pop = lambda: heapq.heappop(ready)[1]
+        push = lambda n: heapq.heappush(ready, (index[n], n))
+    else:
+        ready = deque(roots)
+        pop = ready.pop
+        push = ready.append
+
+    while ready:
+        # remove a root, add it to the order
+        root = pop()
         order.append(root)
         # remove each edge from the root to another node
-        for (parent, child) in [e for e in graph['edges'] if e[0] == root]:
-            graph['incoming'][child] -= 1
-            graph['edges'].remove((parent, child))
+        for child in outgoing[root]:
+            incoming[child] -= 1
             # if destination node is now a root, add it to roots
-            if graph['incoming'][child] == 0:
-                roots.append(child)
-
-    if len(graph['items']) != len(visited):
-        raise CyclicGraphError("graph contains cycles")
+            if incoming[child] == 0:
+                push(child)
 
+    if len(order) != len(graph['items']):
+        remaining = set(n for n in graph['items'] if incoming[n])
+        raise CyclicGraphError("graph contains cycles",
+                               cycle=_find_cycle(graph, remaining))
 
     return order
 
+def _outgoing_edges(items, edges):
+    """ Return a dict of child lists, in edge order, hashed by item. """
+    outgoing = dict((item, []) for item in items)
+    for (parent, child) in edges:
+        outgoing[parent].append(child)
+
+    return outgoing
+
 def create_graph(items, edges):
     """ Create a graph based on a list of items and a list of edges.
 
@@ -69,16 +146,18 @@ def create_graph(items, edges):
         Return Value:
 
             The return value is a dictionary representing the directed graph.
-            It has three keys:
+            It has four keys:
 
                 items is the same as the input argument of the same name
                 edges is the same as the input argument of the same name
                 incoming is a dict of incoming edge count hashed by item
+                outgoing is a dict of child lists hashed by item
 
     """
     graph = {'items': [],       # the items to sort
              'edges': [],       # partial order info: (parent, child) pairs
-             'incoming': {}}    # incoming edge count for each item
+             'incoming': {},    # incoming edge count for each item
+             'outgoing': {}}    # children of each item
 
     graph['items'] = items
     graph['edges'] = edges
@@ -88,6 +167,8 @@ def create_graph(items, edges):
     for (parent, child) in edges:
         graph['incoming'][child] += 1
 
+    graph['outgoing'] = _outgoing_edges(items, edges)
+
     return graph 
 
 
@@ -193,6 +193,42 @@ def udev_get_block_device(sysfs_path):
     else:
         return dev
 
+def udev_enumerate_dependents(sysfs_path):
+    """ Return the sysfs paths of the block devices stacked on a device.
+
+        :param sysfs_path: the device's sysfs path, without the leading /sys
+        :type sysfs_path: str
+        :returns: the sysfs paths of the device's partitions and holders and
+                  of theirs, each before any device stacked on it
+        :rtype: list of str
+
+        Only sysfs is read, so this is cheap even with many devices present.
+    """
+    dependents = []
+    queue = [sysfs_path]
+    while queue:
+        path = queue.pop(0)
+        sysfs_dir = os.path.normpath("/sys%s" % path)
+        found = []
+        try:
+            for entry in sorted(os.listdir(sysfs_dir)):
+                if os.path.exists("%s/%s/partition" % (sysfs_dir, entry)):
+                    found.append("%s/%s" % (path, entry))
+
+            holders_dir = "%s/holders" % sysfs_dir
+            if os.path.isdir(holders_dir):
+                for entry in sorted(os.listdir(holders_dir)):
+                    holder = os.path.realpath("%s/%s" % (holders_dir, entry))
+                    found.append(holder[len("/sys"):])
+        except OSError as e:
+            log.debug("failed to list the dependents of %s: %s" % (path, e))
+
+        for dependent in found:
+            if dependent not in dependents:
+                dependents.append(dependent)
+                queue.append(dependent)
+
+    return dependents
 
 # These are functions for retrieving specific pieces of information from
 # udev database entries.
@@ -541,6 +577,10 @@ def udev_device_is_multipath_member(info):
     """ Return True if the device is part of a multipath. """
     return info.get("ID_FS_TYPE") == "multipath_member"
 
+def udev_device_is_multipath_path(info):
+    """ Return True if udev's multipath rules claimed the device as a path. """
+    return info.get("DM_MULTIPATH_DEVICE_PATH") == "1"
+
 def udev_device_get_multipath_name(info):
     """ Return the name of the multipath that the device is a member of. """
     if udev_device_is_multipath_member(info):
@@ -1,9 +1,14 @@
 import itertools
+import copy
 import os
 import shutil
 import selinux
 import subprocess
 import re
+import sys
+import time
+import Queue
+from collections import namedtuple
 from decimal import Decimal
 
 from udev import udev_settle
@@ -13,11 +18,29 @@ import logging
 log = logging.getLogger("blivet")
 program_log = logging.getLogger("program")
 
-from threading import Lock
+from threading import Lock, Thread
 # this will get set to anaconda's program_log_lock in enable_installer_mode
 program_log_lock = Lock()
 
+class ProgramResult(namedtuple("ProgramResult", ["rc", "out", "elapsed"])):
+    """ The outcome of running an external program.
+
+        rc is the exit status, out the combined stdout and stderr output and
+        elapsed the time the program took to run, in seconds.
+    """
+    __slots__ = ()
+
 def _run_program(argv, root='/', stdin=None, env_prune=None):
+    """ Run an external program.
+
+        The program's output is collected and written to the program log in
+        one block once the program has finished, so programs run by several
+        threads at once do not get their output mixed up. program_log_lock is
+        only held while writing to the log, not while the program runs.
+
+        :returns: the exit status, output and run time of the program
+        :rtype: :class:`ProgramResult`
+    """
     if env_prune is None:
         env_prune = []
 
@@ -25,45 +48,102 @@ def _run_program(argv, root='/', stdin=None, env_prune=None):
         if root and root != '/':
             os.chroot(root)
 
-    with program_log_lock:
-        program_log.info("Running... %s" % " ".join(argv))
-
-        env = os.environ.copy()
-        env.update({"LC_ALL": "C",
-                    "INSTALL_PATH": root})
-        for var in env_prune:
-            env.pop(var, None)
+    env = os.environ.copy()
+    env.update({"LC_ALL": "C",
+                "INSTALL_PATH": root})
+    for var in env_prune:
+        env.pop(var, None)
 
-        try:
-            proc = subprocess.Popen(argv,
-                                    stdin=stdin,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT,
-                                    close_fds=True,
-                                    preexec_fn=chroot, cwd=root, env=env)
-
-            out = proc.communicate()[0]
-            if out:
-                for line in out.splitlines():
-                    program_log.info(line)
-
-        except OSError as e:
+    start = time.time()
+    try:
+        proc = subprocess.Popen(argv,
+                                stdin=stdin,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT,
+                                close_fds=True,
+                                preexec_fn=chroot, cwd=root, env=env)
+
+        out = proc.communicate()[0]
+    except OSError as e:
+        with program_log_lock:
+            program_log.info("Running... %s" % " ".join(argv))
             program_log.error("Error running %s: %s" % (argv[0], e.strerror))
-            raise
+        raise
+
+    elapsed = time.time() - start
+    with program_log_lock:
+        program_log.info("Running... %s" % " ".join(argv))
+        if out:
+            for line in out.splitlines():
+                program_log.info(line)
 
-        program_log.debug("Return code: %d" % proc.returncode)
+        program_log.debug("Return code: %d (%.3f seconds)" % (proc.returncode,
+                                                               elapsed))
 
-    return (proc.returncode, out)
+    return ProgramResult(proc.returncode, out, elapsed)
 
 def run_program(*args, **kwargs):
-    return _run_program(*args, **kwargs)[0]
+    return _run_program(*args, **kwargs).rc
 
 def capture_output(*args, **kwargs):
-    return _run_program(*args, **kwargs)[1]
+    return _run_program(*args, **kwargs).out
 
 def run_program_and_capture_output(*args, **kwargs):
+    return _run_program(*args, **kwargs)[:2]
+
+def run_program_timed(*args, **kwargs):
+    """ Run an external program and return a :class:`ProgramResult`.
+
+        Takes the same arguments as :func:`run_program`.
+    """
     return _run_program(*args, **kwargs)
 
+def run_programs(argvs, workers=4, **kwargs):
+    """ Run several external programs at the same time.
+
+        :param argvs: the argument lists of the programs to run
+        :type argvs: list of lists of str
+        :keyword workers: the most programs to run at once
+        :type workers: int
+        :returns: the results, in the same order as argvs
+        :rtype: list of :class:`ProgramResult`
+
+        Other keyword arguments are passed on to :func:`run_program`. If any
+        program cannot be run the first such error is raised once the other
+        programs have finished.
+    """
+    argvs = list(argvs)
+    results = [None] * len(argvs)
+    errors = []
+    todo = Queue.Queue()
+    for (i, argv) in enumerate(argvs):
+        todo.put((i, argv))
+
+    def worker():
+        while True:
+            try:
+                (i, argv) = todo.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                results[i] = _run_program(argv, **kwargs)
+            except Exception:
+                errors.append((i, sys.exc_info()))
+
+    threads = [Thread(target=worker)
+               for i in range(max(1, min(workers, len(argvs))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        error = min(errors)[1]
+        raise error[0], error[1], error[2]
+
+    return results
+
 def mount(device, mountpoint, fstype, options=None):
     if options is None:
         options = "defaults"
@@ -349,9 +429,15 @@ class ObjectID(object):
        which is unique for the object type. Subclasses can use self.id during
        __init__.
     """
-    _newid_gen = itertools.count().next
+    _ids = itertools.count()
+    _newid_gen = _ids.next
 
     def __new__(cls, *args, **kwargs):
         self = super(ObjectID, cls).__new__(cls, *args, **kwargs)
         self.id = self._newid_gen()
         return self
+
+    @classmethod
+    def nextID(cls):
+        """ Return the id the next new object will get, without using it. """
+        return copy.copy(cls._ids).next()
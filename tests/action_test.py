@@ -1,8 +1,11 @@
 #!/usr/bin/python
 
+import random
 import unittest
 from mock import Mock
 
+import parted
+
 from storagetestcase import StorageTestCase
 import blivet
 from blivet.formats import getFormat
@@ -25,6 +28,12 @@ from blivet.deviceaction import ActionDestroyDevice
 from blivet.deviceaction import ActionCreateFormat
 from blivet.deviceaction import ActionResizeFormat
 from blivet.deviceaction import ActionDestroyFormat
+from blivet.deviceaction import ActionList
+from blivet.deviceaction import RESIZE_GROW, RESIZE_SHRINK
+from blivet.deviceaction import ACTION_TYPE_CREATE, ACTION_TYPE_DESTROY
+from blivet.deviceaction import ACTION_TYPE_RESIZE
+from blivet.deviceaction import ACTION_OBJECT_DEVICE, ACTION_OBJECT_FORMAT
+from blivet import tsort
 
 """ DeviceActionTestSuite """
 @unittest.skip("broken")
@@ -508,7 +517,7 @@ class DeviceActionTestCase(StorageTestCase):
         sdb1_actions = self.storage.devicetree.findActions(devid=sdb1.id)
         self.assertEqual(len(sdb1_actions), 0)
 
-        sda3_actions = self.storage.devicetree.findActions(sda3.id)
+        sda3_actions = self.storage.devicetree.findActions(devid=sda3.id)
         self.assertEqual(len(sda3_actions), 0)
 
     def testActionDependencies(self, *args, **kwargs):
@@ -885,9 +894,194 @@ class DeviceActionTestCase(StorageTestCase):
         """ Verify correct functioning of action sorting. """
         pass
 
+class ActionSortingTestCase(StorageTestCase):
+    """ Compare DeviceTree.sortActions to a sort based on pairwise requires
+        checks of all actions.
+    """
+    def newAction(self, action_class, device, direction=None):
+        """ Return an action without the checks and side effects of the
+            action class's constructor.
+        """
+        action = action_class.__new__(action_class)
+        blivet.util.ObjectID.__init__(action)
+        action.device = device
+        action.origFormat = device.format
+        if direction is not None:
+            action.dir = direction
+        return action
+
+    def pairwiseSort(self, actions):
+        edges = []
+        for (i, action) in enumerate(actions):
+            for (j, other) in enumerate(actions):
+                if other is action:
+                    continue
+
+                if action.type > other.type or other.requires(action):
+                    edges.append((i, j))
+
+        graph = tsort.create_graph(range(len(actions)), edges)
+        return [actions[i] for i in tsort.tsort(graph)]
+
+    def newDevices(self, rng):
+        devices = []
+        for d in range(rng.randint(1, 3)):
+            disk = self.newDevice(device_class=DiskDevice,
+                                  name="sd%s" % chr(ord("a") + d),
+                                  size=100000)
+            disk.format = self.newFormat("disklabel", path=disk.path,
+                                         exists=True)
+            devices.append(disk)
+
+            count = rng.randint(1, 7)
+            extended = count >= 5 and rng.random() < 0.5
+            for num in range(1, count + 1):
+                part_type = parted.PARTITION_NORMAL
+                if extended and num == 4:
+                    part_type = parted.PARTITION_EXTENDED
+                elif extended and num > 4:
+                    part_type = parted.PARTITION_LOGICAL
+
+                part = PartitionDevice("%s%d" % (disk.name, num),
+                                       parents=[disk], size=1000)
+                part.parents = [disk]
+                part._partedPartition = Mock(number=num, type=part_type)
+                part._partedPartition.getLength.return_value = 1024**3
+                part.exists = rng.random() < 0.5
+                devices.append(part)
+
+        pvs = [d for d in devices if isinstance(d, PartitionDevice) and
+               not d.isExtended and rng.random() < 0.5]
+        for pv in pvs:
+            pv.format = self.newFormat("lvmpv", device=pv.path)
+
+        if pvs:
+            vg = self.newDevice(device_class=LVMVolumeGroupDevice,
+                                name="vg", parents=pvs)
+            devices.append(vg)
+            for i in range(rng.randint(1, 5)):
+                lv = self.newDevice(device_class=LVMLogicalVolumeDevice,
+                                    name="lv%d" % i, parents=[vg], size=10)
+                lv.singlePV = rng.random() < 0.3
+                devices.append(lv)
+                if rng.random() < 0.3:
+                    luks = self.newDevice(device_class=LUKSDevice,
+                                          name="luks-lv%d" % i,
+                                          parents=[lv])
+                    devices.append(luks)
+
+        return devices
+
+    def newActions(self, rng, devices):
+        actions = []
+        for device in devices:
+            if rng.random() < 0.5:
+                actions.append(self.newAction(ActionDestroyFormat, device))
+            if rng.random() < 0.3:
+                actions.append(self.newAction(ActionDestroyDevice, device))
+            if rng.random() < 0.3:
+                actions.append(self.newAction(ActionCreateDevice, device))
+            if rng.random() < 0.5:
+                actions.append(self.newAction(ActionCreateFormat, device))
+            if rng.random() < 0.2:
+                direction = rng.choice([RESIZE_GROW, RESIZE_SHRINK])
+                actions.append(self.newAction(ActionResizeDevice, device,
+                                              direction))
+            if rng.random() < 0.2:
+                direction = rng.choice([RESIZE_GROW, RESIZE_SHRINK])
+                actions.append(self.newAction(ActionResizeFormat, device,
+                                              direction))
+
+        rng.shuffle(actions)
+        return actions
+
+    def testSortActions(self):
+        rng = random.Random(42)
+        devicetree = self.storage.devicetree
+        for i in range(50):
+            actions = self.newActions(rng, self.newDevices(rng))
+            try:
+                expected = self.pairwiseSort(actions)
+            except tsort.CyclicGraphError:
+                expected = None
+
+            devicetree._actions = ActionList(actions)
+            if expected is None:
+                self.assertRaises(tsort.CyclicGraphError,
+                                  devicetree.sortActions)
+            else:
+                devicetree.sortActions()
+                self.assertEqual(devicetree._actions, expected)
+
+class ActionListTestCase(unittest.TestCase):
+    def newAction(self, devid, type, obj):
+        action = Mock(type=type, obj=obj)
+        action.id = self.nextId
+        action.device.id = devid
+        self.nextId += 1
+        return action
+
+    def testActionList(self):
+        self.nextId = 0
+        a = self.newAction(1, ACTION_TYPE_CREATE, ACTION_OBJECT_DEVICE)
+        b = self.newAction(2, ACTION_TYPE_DESTROY, ACTION_OBJECT_FORMAT)
+        c = self.newAction(1, ACTION_TYPE_CREATE, ACTION_OBJECT_FORMAT)
+        d = self.newAction(2, ACTION_TYPE_DESTROY, ACTION_OBJECT_DEVICE)
+        actions = ActionList([a, b, c])
+        actions.append(d)
+
+        self.assertEqual(list(actions), [a, b, c, d])
+        self.assertEqual(actions[:], [a, b, c, d])
+        self.assertEqual(list(reversed(actions)), [d, c, b, a])
+        self.assertEqual(len(actions), 4)
+        self.assertRaises(ValueError, actions.append, a)
+
+        self.assertEqual(actions.find(devid=1), [a, c])
+        self.assertEqual(actions.find(devid=2, obj=ACTION_OBJECT_DEVICE), [d])
+        self.assertEqual(actions.find(type=ACTION_TYPE_CREATE), [a, c])
+        self.assertEqual(actions.find(obj=ACTION_OBJECT_FORMAT), [b, c])
+        self.assertEqual(actions.find(type=ACTION_TYPE_RESIZE), [])
+
+        actions.remove(c)
+        self.assertNotIn(c, actions)
+        self.assertRaises(ValueError, actions.remove, c)
+        self.assertEqual(actions.find(devid=1), [a])
+        self.assertEqual(actions.find(obj=ACTION_OBJECT_FORMAT), [b])
+
+        self.assertEqual(actions.pop(0), a)
+        self.assertEqual(actions.pop(), d)
+        self.assertEqual(actions, [b])
+        self.assertEqual(actions.find(devid=1), [])
+
+    def testInsert(self):
+        self.nextId = 0
+        a = self.newAction(1, ACTION_TYPE_CREATE, ACTION_OBJECT_DEVICE)
+        b = self.newAction(2, ACTION_TYPE_DESTROY, ACTION_OBJECT_FORMAT)
+        c = self.newAction(1, ACTION_TYPE_CREATE, ACTION_OBJECT_FORMAT)
+        actions = ActionList([a, b, c])
+
+        # a removed action goes back where it was
+        position = actions.position(a)
+        actions.remove(a)
+        self.assertRaises(ValueError, actions.position, a)
+        actions.insert(a, position)
+        self.assertEqual(actions, [a, b, c])
+        self.assertEqual(actions[0], a)
+        self.assertEqual(actions.find(devid=1), [a, c])
+        self.assertEqual(actions.find(type=ACTION_TYPE_CREATE), [a, c])
+
+        d = self.newAction(2, ACTION_TYPE_DESTROY, ACTION_OBJECT_DEVICE)
+        self.assertRaises(ValueError, actions.insert, d, position)
+        self.assertRaises(ValueError, actions.insert, d, 3)
+        actions.append(d)
+        self.assertEqual(actions.pop(1), b)
+        self.assertEqual(list(reversed(actions)), [d, c, a])
 
 def suite():
-    return unittest.TestLoader().loadTestsFromTestCase(DeviceActionTestCase)
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(DeviceActionTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(ActionSortingTestCase)
+    suite3 = unittest.TestLoader().loadTestsFromTestCase(ActionListTestCase)
+    return unittest.TestSuite([suite1, suite2, suite3])
 
 
 if __name__ == "__main__":
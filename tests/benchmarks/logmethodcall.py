@@ -0,0 +1,96 @@
+#!/usr/bin/python
+#
+# Time the method call logging done while building a device tree.
+#
+# Many disks with partitions, formats and an lvm stack on top get created
+# and put in a device tree, which goes through log_method_call in nearly
+# every step, the way populate does. This is timed with debug logging
+# disabled and enabled, and with the inspect.stack() based caller lookup
+# blivet used to have.
+#
+# Usage: PYTHONPATH=. python tests/benchmarks/logmethodcall.py [disks]
+#
+
+import inspect
+import logging
+import sys
+import time
+
+from mock import Mock
+
+import blivet
+import blivet.storage_log
+from blivet.flags import flags
+from blivet.formats import getFormat
+
+from blivet.devices import DiskDevice
+from blivet.devices import PartitionDevice
+from blivet.devices import LVMVolumeGroupDevice
+from blivet.devices import LVMLogicalVolumeDevice
+
+def inspect_function_name_and_depth():
+    """ The caller lookup log_method_call used to do. """
+    stack = inspect.stack()
+
+    for i, frame in enumerate(stack):
+        methodname = frame[3]
+        if methodname not in blivet.storage_log.IGNORED_FUNCS and \
+           methodname != "inspect_function_name_and_depth":
+            return (methodname, len(stack) - i)
+
+    return ("unknown function?", 0)
+
+def buildTree(disks):
+    devicetree = blivet.Blivet().devicetree
+    pvs = []
+    for i in range(disks):
+        disk = DiskDevice("disk%d" % i, exists=True)
+        disk.format = getFormat("disklabel", device=disk.path, exists=True)
+        devicetree._addDevice(disk)
+        for num in range(1, 5):
+            part = PartitionDevice("%s%d" % (disk.name, num), parents=[disk],
+                                   exists=True)
+            part._partedPartition = Mock(number=num, type=0,
+                                         **{"getLength.return_value": 1 << 21})
+            part.format = getFormat("lvmpv", device=part.path, exists=True)
+            devicetree._addDevice(part)
+            pvs.append(part)
+
+    vg = LVMVolumeGroupDevice("vg", parents=pvs, exists=True,
+                              pvCount=len(pvs))
+    devicetree._addDevice(vg)
+    for i in range(disks):
+        lv = LVMLogicalVolumeDevice("lv%d" % i, parents=[vg], exists=True)
+        lv.format = getFormat("ext4", device=lv.path, exists=True)
+        devicetree._addDevice(lv)
+
+    return devicetree
+
+def timeBuild(disks):
+    start = time.time()
+    buildTree(disks)
+    return time.time() - start
+
+def main():
+    disks = 200
+    if len(sys.argv) > 1:
+        disks = int(sys.argv[1])
+
+    flags.testing = True
+    blivet.util.execWithRedirect = Mock()
+    blivet.util.execWithCapture = Mock()
+
+    log = logging.getLogger("blivet")
+    log.propagate = False
+
+    log.setLevel(logging.INFO)
+    print "debug disabled:           %.3f seconds" % timeBuild(disks)
+
+    log.setLevel(logging.DEBUG)
+    print "debug enabled:            %.3f seconds" % timeBuild(disks)
+
+    blivet.storage_log.function_name_and_depth = inspect_function_name_and_depth
+    print "debug with inspect.stack: %.3f seconds" % timeBuild(disks)
+
+if __name__ == "__main__":
+    main()
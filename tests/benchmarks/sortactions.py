@@ -0,0 +1,117 @@
+#!/usr/bin/python
+#
+# Time DeviceTree.sortActions on a large synthetic action list.
+#
+# The actions look like a clearpart of many partitioned disks followed by
+# autopart with encrypted lvs: the old partitions and their formats are
+# destroyed, the disks get new disklabels and partitions, and a vg with
+# many lvs is created on the new partitions.
+#
+# Usage: PYTHONPATH=. python tests/benchmarks/sortactions.py [actions]
+#
+
+import sys
+import time
+
+from mock import Mock
+
+import blivet
+from blivet.flags import flags
+from blivet.formats import getFormat
+from blivet.util import ObjectID
+
+from blivet.devices import DiskDevice
+from blivet.devices import PartitionDevice
+from blivet.devices import LUKSDevice
+from blivet.devices import LVMVolumeGroupDevice
+from blivet.devices import LVMLogicalVolumeDevice
+
+from blivet.deviceaction import ActionCreateDevice
+from blivet.deviceaction import ActionDestroyDevice
+from blivet.deviceaction import ActionCreateFormat
+from blivet.deviceaction import ActionDestroyFormat
+from blivet.deviceaction import ActionList
+
+def newAction(action_class, device):
+    """ Return an action without the checks and side effects of the action
+        class's constructor.
+    """
+    action = action_class.__new__(action_class)
+    ObjectID.__init__(action)
+    action.device = device
+    action.origFormat = device.format
+    return action
+
+def newPartition(disk, num, exists):
+    part = PartitionDevice("%s%d" % (disk.name, num), parents=[disk])
+    part.parents = [disk]
+    part._partedPartition = Mock(number=num, type=0)
+    part._partedPartition.getLength.return_value = 1024**3
+    part.exists = exists
+    return part
+
+def newActions(count):
+    """ Return a list of about count actions. """
+    # each disk contributes 26 actions, each lv 4 actions
+    disks = max(1, count / 60)
+    lvs = max(1, (count - disks * 26) / 4)
+
+    actions = []
+    pvs = []
+    for i in range(disks):
+        disk = DiskDevice("disk%d" % i, exists=True)
+        disk.format = getFormat("disklabel", device=disk.path, exists=True)
+
+        for num in range(1, 9):
+            old = newPartition(disk, num, True)
+            old.format = getFormat("ext4", device=old.path, exists=True)
+            actions.append(newAction(ActionDestroyFormat, old))
+            actions.append(newAction(ActionDestroyDevice, old))
+
+        actions.append(newAction(ActionDestroyFormat, disk))
+        actions.append(newAction(ActionCreateFormat, disk))
+
+        for num in range(1, 5):
+            new = newPartition(disk, num, False)
+            new.format = getFormat("lvmpv", device=new.path)
+            actions.append(newAction(ActionCreateDevice, new))
+            actions.append(newAction(ActionCreateFormat, new))
+            pvs.append(new)
+
+    # a growable vg skips the free space check as each lv is added
+    vg = LVMVolumeGroupDevice("vg", parents=pvs)
+    vg.req_grow = True
+    actions.append(newAction(ActionCreateDevice, vg))
+    for i in range(lvs):
+        lv = LVMLogicalVolumeDevice("lv%d" % i, parents=[vg])
+        luks = LUKSDevice("luks-lv%d" % i, parents=[lv])
+        actions.append(newAction(ActionCreateDevice, lv))
+        actions.append(newAction(ActionCreateFormat, lv))
+        actions.append(newAction(ActionCreateDevice, luks))
+        actions.append(newAction(ActionCreateFormat, luks))
+
+    # actions get registered in no particular order
+    actions.reverse()
+    return actions
+
+def main():
+    count = 10000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+
+    flags.testing = True
+    blivet.util.execWithRedirect = Mock()
+    blivet.util.execWithCapture = Mock()
+
+    devicetree = blivet.Blivet().devicetree
+    devicetree._actions = ActionList(newActions(count))
+
+    start = time.time()
+    devicetree.sortActions()
+    elapsed = time.time() - start
+
+    print "sorted %d actions in %.3f seconds" % (len(devicetree._actions),
+                                                 elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+import importlib
+import unittest
+from mock import Mock, patch
+
+# storagetestcase replaces blivet.devicelibs.dm with a mock, so get the
+# module itself rather than the package's attribute
+dm = importlib.import_module("blivet.devicelibs.dm")
+mpath = importlib.import_module("blivet.devicelibs.mpath")
+devices = importlib.import_module("blivet.devices")
+
+def _map(name, live_table=True, suspended=False):
+    map = Mock(live_table=live_table, suspended=suspended)
+    map.name = name
+    return map
+
+class DMMapSnapshotTestCase(unittest.TestCase):
+    @patch.object(dm.block.dm, "maps")
+    def testSnapshot(self, maps):
+        maps.return_value = [_map("vg-root"),
+                             _map("vg-suspended", suspended=True),
+                             _map("vg-notable", live_table=False)]
+        snapshot = dm.DMMapSnapshot()
+        self.assertTrue(snapshot.status("vg-root"))
+        self.assertFalse(snapshot.status("vg-suspended"))
+        self.assertFalse(snapshot.status("vg-notable"))
+        self.assertFalse(snapshot.status("vg-missing"))
+
+        # the maps only get walked again after an invalidation
+        self.assertEqual(maps.call_count, 1)
+        maps.return_value = [_map("vg-missing")]
+        self.assertFalse(snapshot.status("vg-missing"))
+        dm.invalidate()
+        self.assertTrue(snapshot.status("vg-missing"))
+        self.assertFalse(snapshot.status("vg-root"))
+        self.assertEqual(maps.call_count, 2)
+
+    @patch.object(dm, "_sysfs_map_status", return_value=True)
+    @patch.object(dm, "_snapshot")
+    def testSysfsFirst(self, snapshot, sysfs_status):
+        self.assertTrue(dm.dm_map_status("vg-root"))
+        self.assertFalse(snapshot.status.called)
+
+        sysfs_status.return_value = None
+        snapshot.status.return_value = False
+        self.assertFalse(dm.dm_map_status("vg-root"))
+        snapshot.status.assert_called_with("vg-root")
+
+        snapshot.status.reset_mock()
+        sysfs_status.reset_mock()
+        dm.dm_map_status("vg-root", use_sysfs=False)
+        self.assertFalse(sysfs_status.called)
+        self.assertTrue(snapshot.status.called)
+
+    def testInvalidateAfterChange(self):
+        # a snapshot taken while multipath is still flushing maps must not
+        # be used once it is done
+        generations = []
+        def run_program(argv):
+            generations.append(dm._generation)
+            return 0
+
+        with patch.object(mpath.util, "run_program", side_effect=run_program), \
+             patch.object(mpath.util, "capture_output", return_value=""):
+            mpath.flush_mpaths()
+
+        self.assertGreater(dm._generation, generations[0])
+
+    def testMultipathSetup(self):
+        calls = []
+        device = devices.MultipathDevice("mpatha",
+                                         parents=[devices.DiskDevice("sda")])
+        with patch.object(devices, "udev_settle"), \
+             patch.object(devices.util, "run_program",
+                          side_effect=lambda argv: calls.append(argv) or 0), \
+             patch.object(devices.dm, "invalidate",
+                          side_effect=lambda: calls.append("invalidate")):
+            device._setup()
+
+        self.assertEqual(calls, [["multipath", "mpatha"], "invalidate"])
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(DMMapSnapshotTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+# storagetestcase replaces blivet.devicelibs.loop with a mock, so get the
+# module itself rather than the package's attribute
+loop = importlib.import_module("blivet.devicelibs.loop")
+
+from blivet.devices import FileDevice, LoopDevice
+from blivet.errors import LoopError
+
+class LoopIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        # the backing files sysfs reports for the loop devices
+        self.files = {"loop0": "/var/lib/a.img", "loop1": "/var/lib/b.img"}
+        patchers = [patch.object(loop.os, "listdir",
+                                 side_effect=lambda d: sorted(self.files) + ["sda"]),
+                    patch.object(loop, "get_backing_file",
+                                 side_effect=lambda name: self.files.get(name, "")),
+                    patch.object(loop, "losetup", return_value=0)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.index = loop.LoopIndex()
+
+    def testIndex(self):
+        self.assertEqual(self.index.backing_file("loop0"), "/var/lib/a.img")
+        self.assertEqual(self.index.backing_file("sda"), "")
+        self.assertEqual(self.index.loop_names("/var/lib/b.img"), ["loop1"])
+        self.assertEqual(self.index.loop_names("/var/lib/c.img"), [])
+        self.assertEqual(loop.os.listdir.call_count, 1)
+
+        # setting up and tearing down loop devices rebuilds the index
+        self.files["loop2"] = "/var/lib/c.img"
+        self.assertEqual(self.index.loop_names("/var/lib/c.img"), [])
+        loop.loop_setup("/var/lib/c.img")
+        self.assertEqual(self.index.loop_names("/var/lib/c.img"), ["loop2"])
+        self.assertEqual(loop.os.listdir.call_count, 2)
+
+        del self.files["loop0"]
+        loop.loop_teardown("/dev/loop0")
+        self.assertEqual(self.index.backing_file("loop0"), "")
+        self.assertEqual(loop.os.listdir.call_count, 3)
+
+    def testLoopName(self):
+        with patch.object(loop, "_index", self.index):
+            self.assertEqual(loop.get_loop_name("/var/lib/a.img"), "loop0")
+            self.assertEqual(loop.get_loop_name("/var/lib/c.img"), "")
+
+            self.files["loop2"] = "/var/lib/a.img"
+            loop.invalidate()
+            self.assertRaises(LoopError, loop.get_loop_name, "/var/lib/a.img")
+
+class LoopStatusTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        self.image = os.path.join(self.tmpdir, "disk.img")
+        open(self.image, "w").close()
+        self.link = os.path.join(self.tmpdir, "link.img")
+        os.symlink(self.image, self.link)
+
+        # sysfs shows the resolved path of the backing file
+        self.files = {"loop0": self.image}
+        # storagetestcase sets the status of file devices to False for good
+        patchers = [patch.object(loop, "get_backing_file",
+                                 side_effect=lambda name: self.files.get(name, "")),
+                    patch.object(FileDevice, "status", True)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def testStatus(self):
+        self.assertTrue(loop.is_loop_backed_by("loop0", self.image))
+        self.assertTrue(loop.is_loop_backed_by("loop0", self.link))
+        self.assertFalse(loop.is_loop_backed_by("loop1", self.image))
+
+        device = LoopDevice("loop0", parents=[FileDevice(self.link,
+                                                         exists=True)])
+        self.assertTrue(device.status)
+
+        # another file now backs the loop device
+        self.files["loop0"] = os.path.join(self.tmpdir, "other.img")
+        self.assertFalse(device.status)
+
+        # the loop device has not been set up yet
+        device = LoopDevice(parents=[FileDevice(self.link, exists=True)])
+        self.assertFalse(device.status)
+
+def suite():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(LoopIndexTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(LoopStatusTestCase)
+    return unittest.TestSuite([suite1, suite2])
+
+
+if __name__ == "__main__":
+    unittest.main()
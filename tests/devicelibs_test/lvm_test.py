@@ -1,11 +1,39 @@
 #!/usr/bin/python
 import baseclass
 import os
+import shutil
+import sys
+import tempfile
 import unittest
+from mock import patch
 
 import blivet.devicelibs.lvm as lvm
+from blivet import probecache
+from blivet.flags import flags
 from blivet.size import Size
 
+# an lvm that only knows lvs and dies when asked about the crash vg
+FAKE_LVM = """#!%s
+import sys
+if len(sys.argv) > 1:
+    print("per-call %%s" %% sys.argv[-1])
+    sys.exit(0)
+
+while True:
+    sys.stdout.write("lvm> ")
+    sys.stdout.flush()
+    args = sys.stdin.readline().split()
+    if not args:
+        break
+    elif args[-1].startswith("crash"):
+        sys.exit(1)
+    elif args[0] == "lvs":
+        print("  LVM2_LV_NAME=%%s LVM2_ARGS=%%d" %% (args[-1], len(args)))
+    else:
+        print("  No such command '%%s'.  Try 'help'." %% args[0])
+    sys.stdout.flush()
+"""
+
 class LVMTestCase(unittest.TestCase):
 
     def testGetPossiblePhysicalExtents(self):
@@ -31,6 +59,116 @@ class LVMTestCase(unittest.TestCase):
         pass
 
 
+class LVMShellTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, "lvm")
+        with open(path, "w") as f:
+            f.write(FAKE_LVM % sys.executable)
+        os.chmod(path, 0755)
+
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = "%s:%s" % (self.tmpdir, self.path)
+        flags.lvm_shell = True
+        lvm._shell = lvm.LVMShell()
+
+    def tearDown(self):
+        lvm._shell.stop()
+        lvm.lvm_cc_resetFilter()
+        flags.lvm_shell = False
+        os.environ["PATH"] = self.path
+        shutil.rmtree(self.tmpdir)
+
+    def testShell(self):
+        self.assertEqual(lvm.lvs("vg")["LVM2_LV_NAME"], ["vg"])
+        pid = lvm._shell.pid
+        self.assertIsNotNone(pid)
+
+        # the config string is passed as a single argument
+        lvm.lvm_cc_addFilterRejectRegexp("sda")
+        info = lvm.lvs("other")
+        self.assertEqual(info["LVM2_LV_NAME"], ["other"])
+        self.assertEqual(info["LVM2_ARGS"], ["13"])
+        self.assertEqual(lvm._shell.pid, pid)
+
+    def testShellRestart(self):
+        lvm.lvs("vg")
+        pid = lvm._shell.pid
+
+        # commands fall back to running lvm when the shell dies
+        self.assertEqual(lvm.lvorigin("crash", "lv"), "per-call crash/lv")
+        self.assertIsNone(lvm._shell.pid)
+
+        self.assertEqual(lvm.lvs("vg")["LVM2_LV_NAME"], ["vg"])
+        self.assertNotEqual(lvm._shell.pid, pid)
+
+PVS_REPORT = """\
+  LVM2_PV_NAME=/dev/sda1 LVM2_PV_UUID=pv1 LVM2_PE_START=1024.00 LVM2_VG_NAME=vg LVM2_VG_UUID=vg1 LVM2_VG_SIZE=8192.00 LVM2_VG_FREE=0 LVM2_VG_EXTENT_SIZE=4096.00 LVM2_VG_EXTENT_COUNT=2 LVM2_VG_FREE_COUNT=0 LVM2_PV_COUNT=1
+"""
+
+LVS_REPORT = """\
+  LVM2_VG_NAME=vg LVM2_LV_NAME=pool LVM2_LV_UUID=lv1 LVM2_LV_SIZE=4096.00 LVM2_LV_ATTR=twi-a-tz-- LVM2_SEGTYPE=thin-pool LVM2_ORIGIN= LVM2_POOL_LV=
+  LVM2_VG_NAME=vg LVM2_LV_NAME=thin LVM2_LV_UUID=lv2 LVM2_LV_SIZE=8192.00 LVM2_LV_ATTR=Vwi-a-tz-- LVM2_SEGTYPE=thin LVM2_ORIGIN= LVM2_POOL_LV=pool
+  LVM2_VG_NAME=vg LVM2_LV_NAME=snap LVM2_LV_UUID=lv3 LVM2_LV_SIZE=8192.00 LVM2_LV_ATTR=Vwi---tz-k LVM2_SEGTYPE=thin LVM2_ORIGIN=thin LVM2_POOL_LV=pool
+"""
+
+class LVMReportTestCase(unittest.TestCase):
+    def setUp(self):
+        # every block device has a generation, and none of them change
+        patchers = [patch.object(probecache, "_cache",
+                                 probecache.ProbeCache()),
+                    patch.object(probecache, "getBlockDeviceNumbers",
+                                 return_value=[2048, 2064]),
+                    patch.object(probecache, "getGeneration",
+                                 return_value=(1, 0.0))]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _capture(self, args):
+        return {"pvs": PVS_REPORT, "lvs": LVS_REPORT}[args[0]]
+
+    def testReport(self):
+        with patch("blivet.devicelibs.lvm._capture_output",
+                   side_effect=self._capture) as capture:
+            report = lvm.LVMReport()
+            info = report.pvinfo("/dev/sda1")
+            self.assertEqual(info["LVM2_VG_NAME"], "vg")
+            self.assertEqual(info["LVM2_PV_COUNT"], "1")
+            self.assertNotIn("LVM2_PV_NAME", info)
+
+            info = report.lvs("vg")
+            self.assertEqual(info["LVM2_LV_NAME"], ["pool", "thin", "snap"])
+            self.assertEqual(info["LVM2_SEGTYPE"], ["thin-pool", "thin", "thin"])
+            self.assertEqual(sorted(info.keys()), sorted(report.lvs_fields))
+            self.assertEqual(report.lvs("other"), {})
+
+            self.assertEqual(report.lvorigin("vg", "snap"), "thin")
+            self.assertEqual(report.lvorigin("vg", "thin"), "")
+            self.assertEqual(report.thinlvpoolname("vg", "thin"), "pool")
+
+            # one report for the pvs and one for the lvs
+            self.assertEqual(capture.call_count, 2)
+
+            # every lvm command that can change the metadata bumps this, and
+            # drops the cached output
+            lvm._generation += 1
+            probecache.invalidate()
+            report.lvs("vg")
+            self.assertEqual(capture.call_count, 4)
+
+            # a new report gets the output from the probe cache
+            report.invalidate()
+            report.lvs("vg")
+            lvm.LVMReport().lvs("vg")
+            self.assertEqual(capture.call_count, 4)
+
+            # until a device changes
+            probecache.getBlockDeviceNumbers.return_value = [2048]
+            report.invalidate()
+            report.lvs("vg")
+            self.assertEqual(capture.call_count, 6)
+
 class LVMAsRootTestCase(baseclass.DevicelibsTestCase):
 
     @unittest.skipUnless(os.geteuid() == 0, "requires root privileges")
@@ -231,7 +369,9 @@ class LVMAsRootTestCase(baseclass.DevicelibsTestCase):
 def suite():
     suite1 = unittest.TestLoader().loadTestsFromTestCase(LVMTestCase)
     suite2 = unittest.TestLoader().loadTestsFromTestCase(LVMAsRootTestCase)
-    return unittest.TestSuite([suite1, suite2])
+    suite3 = unittest.TestLoader().loadTestsFromTestCase(LVMShellTestCase)
+    suite4 = unittest.TestLoader().loadTestsFromTestCase(LVMReportTestCase)
+    return unittest.TestSuite([suite1, suite2, suite3, suite4])
 
 
 if __name__ == "__main__":
@@ -3,6 +3,7 @@ import baseclass
 import os
 import unittest
 import time
+from mock import patch
 
 import blivet.devicelibs.mdraid as mdraid
 import blivet.errors as errors
@@ -48,6 +49,40 @@ class MDRaidTestCase(unittest.TestCase):
                          mdraid.MD_SUPERBLOCK_SIZE)
 
 
+SCAN_OUTPUT = """\
+ARRAY /dev/md/0  level=raid1 metadata=1.2 num-devices=2 UUID=1a2b3c4d:1a2b3c4d:1a2b3c4d:1a2b3c4d name=host:0
+   devices=/dev/sda1,/dev/sdb1
+ARRAY /dev/md127 level=raid5 num-devices=3 UUID=5e6f7a8b:5e6f7a8b:5e6f7a8b:5e6f7a8b
+   devices=/dev/sdc1
+ARRAY metadata=imsm UUID=9c0d1e2f:9c0d1e2f:9c0d1e2f:9c0d1e2f
+   devices=/dev/sdd,/dev/sde
+"""
+
+class MDExamineScanTestCase(unittest.TestCase):
+
+    @patch("blivet.devicelibs.mdraid.util.capture_output",
+           return_value=SCAN_OUTPUT)
+    def testScan(self, capture_output):
+        devices = ["/dev/sda1", "/dev/sdb1", "/dev/sdc1", "/dev/sdd", "/dev/sde"]
+        info = mdraid.mdexamine_scan(devices)
+        self.assertEqual(capture_output.call_count, 1)
+        self.assertEqual(capture_output.call_args[0][0][-5:], devices)
+
+        self.assertEqual(sorted(info.keys()), devices[:3])
+        self.assertEqual(info["/dev/sda1"], info["/dev/sdb1"])
+        self.assertEqual(info["/dev/sda1"],
+                         {"DEVICE": "/dev/md/0",
+                          "MD_LEVEL": "raid1",
+                          "MD_METADATA": "1.2",
+                          "MD_DEVICES": "2",
+                          "MD_UUID": "1a2b3c4d:1a2b3c4d:1a2b3c4d:1a2b3c4d",
+                          "MD_NAME": "host:0"})
+        self.assertEqual(info["/dev/sdc1"]["DEVICE"], "/dev/md127")
+        self.assertNotIn("MD_METADATA", info["/dev/sdc1"])
+
+        self.assertEqual(mdraid.mdexamine_scan([]), {})
+        self.assertEqual(capture_output.call_count, 1)
+
 class MDRaidAsRootTestCase(baseclass.DevicelibsTestCase):
 
     @unittest.skipUnless(os.geteuid() == 0, "requires root privileges")
@@ -109,7 +144,8 @@ class MDRaidAsRootTestCase(baseclass.DevicelibsTestCase):
 def suite():
     suite1 = unittest.TestLoader().loadTestsFromTestCase(MDRaidTestCase)
     suite2 = unittest.TestLoader().loadTestsFromTestCase(MDRaidAsRootTestCase)
-    return unittest.TestSuite([suite1, suite2])
+    suite3 = unittest.TestLoader().loadTestsFromTestCase(MDExamineScanTestCase)
+    return unittest.TestSuite([suite1, suite2, suite3])
 
 
 if __name__ == "__main__":
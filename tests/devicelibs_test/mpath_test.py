@@ -0,0 +1,65 @@
+#!/usr/bin/python
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+import blivet.devicelibs.mpath as mpath
+
+MULTIPATH_LL = """\
+mpatha (3600508b400105e210000900000490000) dm-0 HP,HSV210
+size=10G features='1 queue_if_no_path' hwhandler='0' wp=rw
+|-+- policy='service-time 0' prio=50 status=active
+| |- 1:0:0:1 sda 8:0   active ready running
+| `- 2:0:0:1 sdc 8:32  active ready running
+`-+- policy='service-time 0' prio=10 status=enabled
+  `- 1:0:1:1 sdb 8:16  active ready running
+"""
+
+WWIDS = """\
+# Multipath wwids, Version : 1.0
+# NOTE: This file is automatically maintained by multipath and multipathd.
+/3600508b400105e210000900000490000/
+/36001405a8c3f2b7b1e14a0c9d2e1f3a4/
+"""
+
+class MultipathMembersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.wwids_file = os.path.join(self.tmpdir, "wwids")
+        with open(self.wwids_file, "w") as f:
+            f.write(WWIDS)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @patch("blivet.devicelibs.mpath.util.capture_output",
+           return_value=MULTIPATH_LL)
+    def testMembers(self, capture_output):
+        members = mpath.MultipathMembers(wwids_file=self.wwids_file)
+        self.assertTrue(members.is_member("sda"))
+        self.assertTrue(members.is_member("sdb"))
+        self.assertTrue(members.is_member("sdc"))
+        self.assertFalse(members.is_member("sdd"))
+        self.assertTrue(members.is_member("sdd",
+                                          wwid="36001405a8c3f2b7b1e14a0c9d2e1f3a4"))
+        self.assertFalse(members.is_member("sde", wwid="SATA_disk_1234"))
+        self.assertFalse(members.is_member("sde", wwid=""))
+
+        # multipath only gets run once until the members are invalidated
+        self.assertEqual(capture_output.call_count, 1)
+        members.invalidate()
+        self.assertTrue(members.is_member("sda"))
+        self.assertEqual(capture_output.call_count, 2)
+
+    def testNoWWIDsFile(self):
+        self.assertEqual(mpath.get_wwids(os.path.join(self.tmpdir, "none")),
+                         set())
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(MultipathMembersTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
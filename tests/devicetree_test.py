@@ -0,0 +1,667 @@
+#!/usr/bin/python
+
+import threading
+import unittest
+from mock import Mock, PropertyMock, patch
+
+import blivet
+from blivet.deviceaction import ActionCreateDevice
+from blivet.deviceaction import ActionCreateFormat
+from blivet.errors import DeviceError
+from blivet.errors import DeviceTreeError
+from blivet.errors import DiskLabelCommitError
+from blivet.flags import flags
+from blivet.formats import getFormat
+from blivet.size import Size
+from blivet.util import ObjectID
+
+from blivet.devices import DiskDevice
+from blivet.devices import PartitionDevice
+from blivet.devices import DMDevice
+from blivet.devices import LVMVolumeGroupDevice
+from blivet.devices import LVMLogicalVolumeDevice
+
+class DeviceTreeLookupTestCase(unittest.TestCase):
+    def setUp(self):
+        flags.testing = True
+        self.tree = blivet.Blivet().devicetree
+
+        self.sda = DiskDevice("sda", size=Size(spec="10 GiB"), exists=True,
+                              serial="abc123", sysfsPath="/devices/sda")
+        self.sda.format = getFormat("lvmpv", device=self.sda.path,
+                                    uuid="pv-uuid", exists=True)
+        self.tree._addDevice(self.sda)
+
+        self.sdb = DiskDevice("sdb", size=Size(spec="10 GiB"), exists=True,
+                              serial="abc123")
+        self.tree._addDevice(self.sdb)
+
+        self.vg = LVMVolumeGroupDevice("my-vg", parents=[self.sda],
+                                       uuid="vg-uuid")
+        self.tree._addDevice(self.vg)
+
+        self.lv = LVMLogicalVolumeDevice("root", parents=[self.vg],
+                                         size=Size(spec="1 GiB"),
+                                         uuid="lv-uuid")
+        self.lv.format = getFormat("ext4", device=self.lv.path,
+                                   uuid="fs-uuid", label="rootfs",
+                                   exists=True)
+        self.tree._addDevice(self.lv)
+
+    def tearDown(self):
+        flags.testing = False
+
+    def testLookups(self):
+        tree = self.tree
+        self.assertEqual(tree.getDeviceByName("sda"), self.sda)
+        self.assertEqual(tree.getDeviceByName("my-vg-root"), self.lv)
+        self.assertEqual(tree.getDeviceByName("my--vg-root"), self.lv)
+        self.assertIsNone(tree.getDeviceByName("sdc"))
+
+        self.assertEqual(tree.getDeviceByPath("/dev/sda"), self.sda)
+        self.assertEqual(tree.getDeviceByPath("/dev/mapper/my--vg-root"),
+                         self.lv)
+
+        self.assertEqual(tree.getDeviceByUuid("vg-uuid"), self.vg)
+        self.assertEqual(tree.getDeviceByUuid("pv-uuid"), self.sda)
+        self.assertEqual(tree.getDeviceByUuid("fs-uuid"), self.lv)
+        self.assertEqual(tree.getDeviceByLabel("rootfs"), self.lv)
+        self.assertEqual(tree.getDeviceBySysfsPath("/devices/sda"), self.sda)
+        self.assertEqual(tree.getDevicesBySerial("abc123"),
+                         [self.sda, self.sdb])
+        self.assertEqual(tree.getDeviceByID(self.lv.id), self.lv)
+
+    def testKeyChanges(self):
+        tree = self.tree
+
+        # renaming a vg also renames its lvs
+        self.vg._name = "other"
+        self.assertIsNone(tree.getDeviceByName("my-vg"))
+        self.assertEqual(tree.getDeviceByName("other"), self.vg)
+        self.assertEqual(tree.getDeviceByName("other-root"), self.lv)
+        self.assertEqual(tree.getDeviceByPath("/dev/mapper/other-root"),
+                         self.lv)
+
+        self.lv.format.label = "newlabel"
+        self.assertIsNone(tree.getDeviceByLabel("rootfs"))
+        self.assertEqual(tree.getDeviceByLabel("newlabel"), self.lv)
+
+        self.lv.format = getFormat("xfs", device=self.lv.path)
+        self.assertIsNone(tree.getDeviceByUuid("fs-uuid"))
+        self.lv.format.uuid = "new-fs-uuid"
+        self.assertEqual(tree.getDeviceByUuid("new-fs-uuid"), self.lv)
+
+        self.sdb.sysfsPath = "/devices/sdb"
+        self.assertEqual(tree.getDeviceBySysfsPath("/devices/sdb"), self.sdb)
+
+    def testReindexDuringLookup(self):
+        # another thread re-indexes a device while the results are filtered
+        def reindex():
+            self.sdb._serial = "def456"
+            return True
+
+        with patch.object(DiskDevice, "complete", create=True,
+                          new_callable=PropertyMock, side_effect=reindex):
+            devices = self.tree.getDevicesBySerial("abc123")
+
+        self.assertEqual(devices, [self.sda, self.sdb])
+        self.assertEqual(self.tree.getDevicesBySerial("def456"), [self.sdb])
+
+    def testHiddenAndRemoved(self):
+        tree = self.tree
+
+        tree.hide(self.sdb)
+        self.assertIsNone(tree.getDeviceByName("sdb"))
+        self.assertIsNone(tree.getDeviceByPath("/dev/sdb"))
+        self.assertEqual(tree.getDeviceByName("sdb", hidden=True), self.sdb)
+        self.assertEqual(tree.getDevicesBySerial("abc123"), [self.sda])
+        self.assertEqual(tree.getDevicesBySerial("abc123", hidden=True),
+                         [self.sda, self.sdb])
+
+        tree.unhide(self.sdb)
+        self.assertEqual(tree.getDeviceByName("sdb"), self.sdb)
+        self.assertEqual(tree.getDevicesBySerial("abc123"),
+                         [self.sda, self.sdb])
+
+        tree._removeDevice(self.lv)
+        self.assertIsNone(tree.getDeviceByName("my-vg-root"))
+        self.assertIsNone(tree.getDeviceByUuid("fs-uuid", hidden=True))
+
+        # changes to devices that are no longer in the tree are ignored
+        self.lv.format.label = "gone"
+        self.assertIsNone(tree.getDeviceByLabel("gone"))
+
+    def testCopy(self):
+        b = blivet.Blivet()
+        b.devicetree = self.tree
+        new = b.copy()
+        lv = new.devicetree.getDeviceByName("my-vg-root")
+        self.assertIsNotNone(lv)
+        self.assertIsNot(lv, self.lv)
+
+        # the copy's indexes track the copied devices
+        lv.format.label = "copy"
+        self.assertEqual(new.devicetree.getDeviceByLabel("copy"), lv)
+        self.assertIsNone(self.tree.getDeviceByLabel("copy"))
+
+    def testChildren(self):
+        tree = self.tree
+        self.assertEqual(self.sda.children, [self.vg])
+        self.assertEqual(self.vg.kids, 1)
+        self.assertFalse(self.sda.isleaf)
+        self.assertTrue(self.sdb.isleaf)
+
+        self.assertEqual(tree.getChildren(self.sda), [self.vg])
+        self.assertEqual(tree.getChildren(self.vg), [self.lv])
+        self.assertEqual(tree.getDependentDevices(self.sda),
+                         [self.vg, self.lv])
+        self.assertEqual(tree.getDependentDevices(self.lv), [])
+        self.assertTrue(self.lv.dependsOn(self.sda))
+        self.assertFalse(self.lv.dependsOn(self.sdb))
+        self.assertFalse(self.sda.dependsOn(self.lv))
+
+        tree._removeDevice(self.lv)
+        self.assertTrue(self.vg.isleaf)
+        self.assertEqual(tree.getDependentDevices(self.sda), [self.vg])
+
+        # re-adding a device restores its parents' children
+        tree._addDevice(self.lv)
+        self.assertEqual(self.vg.children, [self.lv])
+
+        # reassigning parents moves the device between parents' children
+        self.vg.parents = [self.sdb]
+        self.assertTrue(self.sda.isleaf)
+        self.assertEqual(self.sdb.children, [self.vg])
+        self.assertEqual(tree.getDependentDevices(self.sdb),
+                         [self.vg, self.lv])
+
+        self.vg._removePV(self.sdb)
+        self.assertTrue(self.sdb.isleaf)
+        self.vg._addPV(self.sda)
+        self.assertEqual(tree.getChildren(self.sda), [self.vg])
+
+    def testDevicesCache(self):
+        tree = self.tree
+        devices = tree.devices
+        self.assertEqual(devices, [self.sda, self.sdb, self.vg, self.lv])
+
+        # callers get their own copy of the list
+        devices.remove(self.lv)
+        self.assertEqual(tree.devices, [self.sda, self.sdb, self.vg, self.lv])
+
+        generation = tree.generation
+        self.assertEqual(tree.generation, generation)
+        tree._removeDevice(self.lv)
+        self.assertNotEqual(tree.generation, generation)
+        self.assertEqual(tree.devices, [self.sda, self.sdb, self.vg])
+        tree._addDevice(self.lv)
+
+        # changes to a device's completeness are reflected
+        self.vg.pvCount = 2
+        self.vg.exists = True
+        self.assertEqual(tree.devices, [self.sda, self.sdb])
+        self.vg.pvCount = 1
+        self.assertEqual(tree.devices, [self.sda, self.sdb, self.vg, self.lv])
+
+        self.sdb.uuid = "vg-uuid"
+        self.assertRaises(DeviceTreeError, getattr, tree, "devices")
+
+    def testTypeLookups(self):
+        tree = self.tree
+        self.assertEqual(tree.getDevicesByType("disk"), [self.sda, self.sdb])
+        self.assertEqual(tree.getDevicesByType("lvmlv"), [self.lv])
+        self.assertEqual(tree.getDevicesByInstance(DMDevice),
+                         [self.vg, self.lv])
+        self.assertEqual(tree.getDevicesByFormatType("lvmpv"), [self.sda])
+
+        b = blivet.Blivet()
+        b.devicetree = tree
+        self.assertEqual(b.pvs, [self.sda])
+        self.assertEqual(b.swaps, [])
+        self.assertEqual(b.vgs, [self.vg])
+        self.assertEqual(b.lvs, [self.lv])
+        self.assertEqual(b.devices, [self.vg, self.lv, self.sda, self.sdb])
+
+        self.sdb.format = getFormat("swap", device=self.sdb.path)
+        self.assertEqual(b.swaps, [self.sdb])
+
+        tree._removeDevice(self.lv)
+        self.assertEqual(b.lvs, [])
+        self.assertEqual(b.devices, [self.vg, self.sda, self.sdb])
+
+class ParallelActionsTestCase(unittest.TestCase):
+    def setUp(self):
+        flags.testing = True
+        self.tree = blivet.Blivet().devicetree
+
+        self.disks = []
+        for name in ("sda", "sdb"):
+            disk = DiskDevice(name, size=Size(spec="10 GiB"), exists=True)
+            disk.format = getFormat("lvmpv", device=disk.path, exists=True)
+            self.tree._addDevice(disk)
+            self.disks.append(disk)
+
+        self.vg = LVMVolumeGroupDevice("vg", parents=self.disks[:1])
+        self.tree._addDevice(self.vg)
+        self.lvs = []
+        for name in ("a", "b"):
+            lv = LVMLogicalVolumeDevice(name, parents=[self.vg],
+                                        size=Size(spec="1 GiB"))
+            self.tree._addDevice(lv)
+            self.lvs.append(lv)
+
+        self.executed = []
+        self.patcher = patch("blivet.devicetree.udev_settle")
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        flags.testing = False
+
+    def newAction(self, device, execute=None):
+        action = ActionCreateFormat(device, getFormat("ext4",
+                                                      device=device.path))
+        def _execute():
+            if execute:
+                execute()
+            self.executed.append(action)
+
+        action.execute = _execute
+        self.tree.registerAction(action)
+        return action
+
+    def testConcurrent(self):
+        # each action waits for the other, so they only both finish if they
+        # run at the same time
+        events = [threading.Event(), threading.Event()]
+        def wait(i):
+            events[i].set()
+            return events[1 - i].wait(5) or self.fail("not concurrent")
+
+        actions = [self.newAction(self.lvs[0], lambda: wait(0)),
+                   self.newAction(self.disks[1], lambda: wait(1))]
+        self.tree.processActions(workers=2)
+        self.assertEqual(sorted(self.executed), sorted(actions))
+        self.assertEqual(self.tree.findActions(), [])
+        self.assertEqual(sorted(self.tree._completed_actions), sorted(actions))
+
+    def testActionGraph(self):
+        actions = [self.newAction(self.lvs[0]),
+                   self.newAction(self.lvs[1]),
+                   ActionCreateDevice(LVMLogicalVolumeDevice("c",
+                                                             parents=[self.vg],
+                                                             size=Size(spec="1 GiB"))),
+                   self.newAction(self.disks[1])]
+        (successors, incoming) = self.tree._getActionGraph(actions)
+
+        # formats on the two lvs can be created at the same time, but the
+        # new lv changes the vg they both use
+        self.assertEqual(successors, [set([2]), set([2]), set(), set()])
+        self.assertEqual(incoming, [0, 0, 2, 0])
+
+    def testPartitionNames(self):
+        # only the disks a finished action changed get their partitions
+        # renamed, the other disks may be in use by running actions
+        self.newAction(self.disks[1])
+        with patch.object(self.tree, "_updatePartitionNames") as update:
+            self.tree.processActions(workers=2)
+        update.assert_called_once_with([self.disks[1]])
+
+    def testFailure(self):
+        def fail():
+            raise DeviceTreeError("failed")
+
+        first = self.newAction(self.disks[0])
+        failed = self.newAction(self.lvs[0], fail)
+        self.assertRaises(DeviceTreeError, self.tree.processActions, workers=4)
+
+        # the failed action stays queued, unlike the one that ran before it
+        self.assertEqual(self.executed, [first])
+        self.assertEqual(self.tree._completed_actions, [first])
+        self.assertEqual(self.tree.findActions(), [failed])
+
+class BatchedCommitsTestCase(unittest.TestCase):
+    def setUp(self):
+        flags.testing = True
+        self.tree = blivet.Blivet().devicetree
+        self.patchers = [patch("blivet.devicetree.udev_settle"),
+                         patch("blivet.formats.disklabel.udev_settle")]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.disks = []
+        for name in ("sda", "sdb"):
+            disk = DiskDevice(name, size=Size(spec="10 GiB"), exists=True)
+            disk.format = getFormat("disklabel", device=disk.path, exists=True)
+            disk.format._partedDisk = Mock(partitions=[])
+            disk.originalFormat = disk.format
+            self.tree._addDevice(disk)
+            self.disks.append(disk)
+
+        self.executed = []
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        flags.testing = False
+
+    def newAction(self, action_class, disk, num):
+        device = PartitionDevice("%s%d" % (disk.name, num), parents=[disk])
+        device.parents = [disk]
+        action = action_class.__new__(action_class)
+        ObjectID.__init__(action)
+        action.device = device
+
+        def execute():
+            # record whether the disklabel was committed right away
+            self.executed.append((action, disk.format.commitsDeferred))
+            if action.isDevice:
+                disk.format.commit()
+
+        action.execute = execute
+        self.tree._actions.append(action)
+        return action
+
+    def testBatchedCommits(self):
+        sda, sdb = self.disks
+        actions = [self.newAction(ActionCreateDevice, sda, 1),
+                   self.newAction(ActionCreateDevice, sda, 2),
+                   self.newAction(ActionCreateDevice, sdb, 1),
+                   self.newAction(ActionCreateDevice, sda, 3),
+                   self.newAction(ActionCreateFormat, sda, 4),
+                   self.newAction(ActionCreateDevice, sda, 5)]
+
+        self.tree._executeActions(batchCommits=True)
+
+        # the format action uses sda, so the first three partitions on sda
+        # get committed before it
+        self.assertEqual([d for (a, d) in self.executed],
+                         [True, True, True, True, False, True])
+        self.assertEqual(sda.format._partedDisk.commit.call_count, 2)
+        self.assertEqual(sdb.format._partedDisk.commit.call_count, 1)
+        self.assertFalse(sda.format.commitsDeferred)
+        self.assertEqual(sorted(self.tree._completed_actions), sorted(actions))
+        self.assertEqual(len(self.tree._actions), 0)
+
+    def testUnbatchedCommits(self):
+        sda = self.disks[0]
+        for num in range(1, 4):
+            self.newAction(ActionCreateDevice, sda, num)
+
+        self.tree._executeActions()
+        self.assertEqual([d for (a, d) in self.executed], [False] * 3)
+        self.assertEqual(sda.format._partedDisk.commit.call_count, 3)
+
+    def testFailedAction(self):
+        sda = self.disks[0]
+        self.newAction(ActionCreateDevice, sda, 1)
+        failed = self.newAction(ActionCreateDevice, sda, 2)
+        failed.execute = Mock(side_effect=DeviceError("create failed"))
+
+        # the batch left over fails to commit as well, which is only logged
+        with patch.object(self.tree, "_commitPartitions",
+                          side_effect=DiskLabelCommitError("commit failed")) \
+             as commit:
+            self.assertRaisesRegexp(DeviceError, "create failed",
+                                    self.tree._executeActions,
+                                    batchCommits=True)
+
+        self.assertEqual(commit.call_count, 1)
+
+class UpdateDevicesTestCase(unittest.TestCase):
+    def setUp(self):
+        flags.testing = True
+        self.tree = blivet.Blivet().devicetree
+
+        self.disks = []
+        for name in ("sda", "sdb", "sdc"):
+            disk = DiskDevice(name, size=Size(spec="10 GiB"), exists=True,
+                              sysfsPath="/devices/%s" % name)
+            disk.format = getFormat("lvmpv", device=disk.path, exists=True)
+            self.tree._addDevice(disk)
+            self.disks.append(disk)
+
+        self.vg = LVMVolumeGroupDevice("vg", parents=self.disks[:2],
+                                       exists=True, pvCount=2)
+        self.tree._addDevice(self.vg)
+        self.lv = LVMLogicalVolumeDevice("lv", parents=[self.vg],
+                                         size=Size(spec="1 GiB"),
+                                         exists=True,
+                                         sysfsPath="/devices/dm-0")
+        self.tree._addDevice(self.lv)
+
+        dependents = {"/devices/sda": ["/devices/dm-0"],
+                      "/devices/sdc": ["/devices/sdc/sdc1"],
+                      "/devices/sdd": ["/devices/sdd/sdd1"]}
+        self.patchers = [patch("blivet.devicetree.udev_settle"),
+                         patch("blivet.devicetree.udev_enumerate_dependents",
+                               side_effect=lambda p: dependents.get(p, [])),
+                         patch("blivet.devicetree.udev_get_block_device",
+                               side_effect=lambda p: {"name": p.split("/")[-1],
+                                                      "sysfs_path": p}),
+                         patch.object(self.tree, "_resetProbeState"),
+                         patch.object(self.tree, "addUdevDevice")]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        flags.testing = False
+
+    def scanned(self):
+        return [info["name"] for ((info,), kwargs)
+                    in self.tree.addUdevDevice.call_args_list]
+
+    def testRemoved(self):
+        self.tree.updateDevices(removed=["/devices/sda", "/devices/sdx"])
+
+        # the disk goes away with everything on top of it
+        for device in (self.disks[0], self.vg, self.lv):
+            self.assertNotIn(device, self.tree.devices)
+        self.assertIn(self.disks[1], self.tree.devices)
+        self.assertEqual(self.scanned(), [])
+
+    def testChanged(self):
+        self.tree.updateDevices(added=["/devices/sdd"],
+                                changed=["/devices/sdc", "/devices/sde"])
+
+        # the changed disk gets scanned again from scratch
+        self.assertNotIn(self.disks[2], self.tree.devices)
+        self.assertEqual(self.scanned(),
+                         ["sdd", "sdc", "sde", "sdd1", "sdc1"])
+
+    def testPendingActions(self):
+        action = ActionCreateFormat(self.lv, getFormat("ext4",
+                                                       device=self.lv.path))
+        self.tree.registerAction(action)
+
+        self.tree.updateDevices(changed=["/devices/sda"],
+                                removed=["/devices/sdb"])
+
+        # devices under an action are left alone, and so is the action
+        self.assertEqual(self.tree.findActions(), [action])
+        self.assertIn(self.lv, self.tree.devices)
+        self.assertEqual(self.disks[0].format.type, "lvmpv")
+        self.assertEqual(self.scanned(), [])
+
+    def testChangedMember(self):
+        self.tree.updateDevices(changed=["/devices/sda", "/devices/sdb"])
+
+        # both pvs are scanned again, and only once each
+        for device in self.disks[:2] + [self.vg, self.lv]:
+            self.assertNotIn(device, self.tree.devices)
+        self.assertEqual(self.scanned(), ["sda", "sdb", "dm-0"])
+
+class RescanDevicesTestCase(unittest.TestCase):
+    def setUp(self):
+        flags.testing = True
+        self.tree = blivet.Blivet().devicetree
+
+        self.disks = []
+        for name in ("sda", "sdb"):
+            disk = DiskDevice(name, size=Size(spec="10 GiB"), exists=True,
+                              sysfsPath="/devices/%s" % name)
+            disk.format = getFormat("lvmpv", device=disk.path, exists=True,
+                                    vgName="vg", vgUuid="vg-uuid")
+            self.tree._addDevice(disk)
+            self.disks.append(disk)
+
+        self.vg = LVMVolumeGroupDevice("vg", parents=self.disks, exists=True,
+                                       uuid="vg-uuid", pvCount=2)
+        self.tree._addDevice(self.vg)
+        self.lv = LVMLogicalVolumeDevice("lv", parents=[self.vg],
+                                         size=Size(spec="1 GiB"),
+                                         uuid="lv-uuid", exists=True,
+                                         sysfsPath="/devices/virtual/dm-0")
+        self.tree._addDevice(self.lv)
+
+        # what udev and lvm report once sda has grown
+        self.info = {}
+        for disk in self.disks:
+            self.info[disk.sysfsPath] = {"name": disk.name,
+                                         "sysfs_path": disk.sysfsPath,
+                                         "DEVTYPE": "disk", "MAJOR": "8",
+                                         "MINOR": "0",
+                                         "ID_FS_TYPE": "LVM2_member"}
+        self.info[self.lv.sysfsPath] = {"name": "dm-0", "DM_NAME": "vg-lv",
+                                        "sysfs_path": self.lv.sysfsPath,
+                                        "ID_FS_TYPE": "ext4"}
+        pvinfo = {"LVM2_VG_NAME": "vg", "LVM2_VG_UUID": "vg-uuid",
+                  "LVM2_PE_START": "1024", "LVM2_VG_SIZE": "20963328",
+                  "LVM2_VG_FREE": "19914752", "LVM2_VG_EXTENT_SIZE": "4096",
+                  "LVM2_VG_EXTENT_COUNT": "5118",
+                  "LVM2_VG_FREE_COUNT": "4862", "LVM2_PV_COUNT": "2"}
+        lvs = {"LVM2_LV_NAME": ["lv"], "LVM2_LV_UUID": ["lv-uuid"],
+               "LVM2_LV_SIZE": ["1048576"], "LVM2_LV_ATTR": ["-wi-a-----"],
+               "LVM2_SEGTYPE": ["linear"]}
+        dependents = {"/devices/sda": [self.lv.sysfsPath],
+                      "/devices/sdb": [self.lv.sysfsPath]}
+        partedDevice = Mock(getLength=Mock(return_value=20 * 1024**3))
+        self.patchers = [patch("blivet.devicetree.udev_settle"),
+                         patch("blivet.devicetree.udev_enumerate_dependents",
+                               side_effect=lambda p: dependents.get(p, [])),
+                         patch("blivet.devicetree.udev_get_block_device",
+                               side_effect=lambda p: dict(self.info[p])),
+                         patch.object(self.tree, "_resetProbeState"),
+                         patch.object(self.tree, "_isMultipathMember",
+                                      return_value=False),
+                         patch.object(self.tree, "_lvmReport",
+                                      pvinfo=Mock(return_value=pvinfo),
+                                      lvs=Mock(return_value=lvs)),
+                         patch("blivet.devices.parted.Device",
+                               return_value=partedDevice),
+                         # storagetestcase sets the status of devices to False
+                         # for good
+                         patch.object(DiskDevice, "status", True),
+                         patch.object(LVMLogicalVolumeDevice, "status", False)]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        flags.testing = False
+
+    def testChanged(self):
+        self.tree.updateDevices(changed=["/devices/sda"])
+
+        # the disk is added again with its new size
+        sda = self.tree.getDeviceByName("sda")
+        self.assertIsNot(sda, self.disks[0])
+        self.assertEqual(sda.size, Size(spec="20 GiB"))
+        self.assertEqual(sda.format.type, "lvmpv")
+
+        # and the vg is put back together from both pvs
+        vg = self.tree.getDeviceByName("vg")
+        self.assertIsNot(vg, self.vg)
+        self.assertEqual(vg.parents, [sda, self.disks[1]])
+        self.assertTrue(vg.complete)
+        lv = self.tree.getDeviceByName("vg-lv")
+        self.assertEqual(lv.parents, [vg])
+        self.assertEqual(lv.format.type, "ext4")
+        self.assertEqual(len(self.tree.devices), 4)
+
+    def testPopulateScope(self):
+        sdc = DiskDevice("sdc", size=Size(spec="10 GiB"), exists=True,
+                         sysfsPath="/devices/sdc")
+        self.tree._addDevice(sdc)
+        actions = [ActionCreateFormat(device, getFormat("ext4",
+                                                        device=device.path))
+                   for device in (self.lv, sdc)]
+        for action in actions:
+            self.tree.registerAction(action)
+
+        self.tree.populated = True
+        self.tree._populateScope(["sda"])
+
+        # only the actions on the rescanned devices are canceled
+        self.assertEqual(self.tree.findActions(), actions[1:])
+
+        # sdb is scanned again along with sda, so the vg is back with both
+        # of its pvs and the lv
+        sda = self.tree.getDeviceByName("sda")
+        vg = self.tree.getDeviceByName("vg")
+        self.assertEqual(vg.parents, [sda, self.disks[1]])
+        self.assertEqual(self.disks[1].format.type, "lvmpv")
+        self.assertEqual(self.tree.getDeviceByName("vg-lv").parents, [vg])
+        self.assertIn(sdc, self.tree.devices)
+
+class ExcludedDisksTestCase(unittest.TestCase):
+    def setUp(self):
+        flags.testing = True
+        self.tree = blivet.Blivet().devicetree
+        self.tree.exclusiveDisks = ["sda"]
+
+        dependents = {"/devices/sdb": ["/devices/sdb/sdb1"],
+                      "/devices/sdc": ["/devices/sdc/sdc1"],
+                      "/devices/sdd": ["/devices/virtual/dm-0"]}
+        self.patchers = [patch("blivet.devicetree.udev_enumerate_dependents",
+                               side_effect=lambda p: dependents.get(p, [])),
+                         patch.object(self.tree, "_isMultipathMember",
+                                      return_value=False)]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        flags.testing = False
+
+    def info(self, name, devtype="disk", fstype=None, parent=None):
+        info = {"name": name, "DEVTYPE": devtype,
+                "sysfs_path": "/devices/%s%s" % (parent + "/" if parent else "",
+                                                 name)}
+        if fstype:
+            info["ID_FS_TYPE"] = fstype
+        return info
+
+    def testExcludedDisks(self):
+        devices = [self.info("sda"),
+                   self.info("sdb"),
+                   self.info("sdb1", "partition", "ext4", parent="sdb"),
+                   self.info("sdc"),
+                   self.info("sdc1", "partition", "LVM2_member", parent="sdc"),
+                   self.info("sdd"),
+                   self.info("sde", fstype="isw_raid_member")]
+
+        # only sdb can not be part of something on sda
+        self.assertEqual(self.tree._getExcludedDisks(devices),
+                         set(["/devices/sdb"]))
+
+        # nothing is excluded without disk filtering
+        self.tree.exclusiveDisks = []
+        self.assertEqual(self.tree._getExcludedDisks(devices), set())
+
+def suite():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(DeviceTreeLookupTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(ParallelActionsTestCase)
+    suite3 = unittest.TestLoader().loadTestsFromTestCase(BatchedCommitsTestCase)
+    suite4 = unittest.TestLoader().loadTestsFromTestCase(UpdateDevicesTestCase)
+    suite5 = unittest.TestLoader().loadTestsFromTestCase(RescanDevicesTestCase)
+    suite6 = unittest.TestLoader().loadTestsFromTestCase(ExcludedDisksTestCase)
+    return unittest.TestSuite([suite1, suite2, suite3, suite4, suite5, suite6])
+
+
+if __name__ == "__main__":
+    unittest.main()
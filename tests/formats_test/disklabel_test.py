@@ -0,0 +1,63 @@
+#!/usr/bin/python
+import unittest
+from mock import Mock, patch
+
+import parted
+
+import blivet.formats as formats
+from blivet.errors import DiskLabelCommitError
+
+class DiskLabelCommitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.patcher = patch("blivet.formats.disklabel.udev_settle")
+        self.patcher.start()
+
+        self.label = formats.getFormat("disklabel")
+        self.label._partedDisk = Mock(partitions=[])
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def testImmediateCommit(self):
+        after = Mock()
+        self.label.commit()
+        self.label.afterCommit(after)
+        self.assertEqual(self.label._partedDisk.commit.call_count, 1)
+        self.assertEqual(after.call_count, 1)
+
+    def testDeferredCommit(self):
+        after = Mock()
+        self.label.deferCommits()
+        self.assertTrue(self.label.commitsDeferred)
+        for i in range(3):
+            self.label.commit()
+            self.label.afterCommit(after)
+
+        self.assertEqual(self.label._partedDisk.commit.call_count, 0)
+        self.assertEqual(after.call_count, 0)
+
+        self.label.flushCommits()
+        self.assertFalse(self.label.commitsDeferred)
+        self.assertEqual(self.label._partedDisk.commit.call_count, 1)
+        self.assertEqual(after.call_count, 3)
+
+        # nothing left to commit
+        self.label.flushCommits()
+        self.assertEqual(self.label._partedDisk.commit.call_count, 1)
+
+    def testFailedDeferredCommit(self):
+        undone = []
+        after = Mock()
+        self.label._partedDisk.commit.side_effect = parted.DiskException()
+        self.label.deferCommits()
+        for i in range(3):
+            self.label.commit(undo=lambda i=i: undone.append(i))
+            self.label.afterCommit(after)
+
+        self.assertRaises(DiskLabelCommitError, self.label.flushCommits)
+        self.assertEqual(undone, [2, 1, 0])
+        self.assertEqual(after.call_count, 0)
+        self.assertFalse(self.label.commitsDeferred)
+
+if __name__ == "__main__":
+    unittest.main()
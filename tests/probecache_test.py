@@ -0,0 +1,213 @@
+#!/usr/bin/python
+
+import json
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from mock import Mock, patch
+
+from blivet import probecache
+
+DEVICES = {"/dev/sda1": 2049, "/dev/sdb1": 2065, "/dev/disk/by-label/b": 2065}
+
+class ProbeCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.generations = dict((devno, (1, 0.0)) for devno in DEVICES.values())
+        patchers = [patch("blivet.probecache.getDeviceNumber",
+                          side_effect=DEVICES.get),
+                    patch("blivet.probecache.getGeneration",
+                          side_effect=self.generations.get)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.cache = probecache.ProbeCache()
+        self.capture = Mock(side_effect=lambda argv: " ".join(argv))
+
+    def _probe(self, device, tool="dumpe2fs"):
+        return self.cache.captureOutput([tool, device], device,
+                                        capture=self.capture)
+
+    def testCache(self):
+        self.assertEqual(self._probe("/dev/sda1"), "dumpe2fs /dev/sda1")
+        self.assertEqual(self._probe("/dev/sda1"), "dumpe2fs /dev/sda1")
+        self.assertEqual(self.capture.call_count, 1)
+
+        # different tools and devices have their own results
+        self._probe("/dev/sda1", tool="resize2fs")
+        self._probe("/dev/sdb1")
+        self.assertEqual(self.capture.call_count, 3)
+
+        # udev saw a change to the device
+        self.generations[2049] = (2, 1.0)
+        self._probe("/dev/sda1")
+        self.assertEqual(self.capture.call_count, 4)
+        self._probe("/dev/sdb1")
+        self.assertEqual(self.capture.call_count, 4)
+
+        # devices without a number or a generation are never cached
+        self._probe("/dev/nonexistent")
+        self._probe("/dev/nonexistent")
+        self.assertEqual(self.capture.call_count, 6)
+
+        del self.generations[2065]
+        self._probe("/dev/sdb1")
+        self.assertEqual(self.capture.call_count, 7)
+
+    def testInvalidate(self):
+        self._probe("/dev/sda1")
+        self._probe("/dev/sdb1")
+
+        self.cache.invalidate("/dev/sda1")
+        self._probe("/dev/sda1")
+        self._probe("/dev/sdb1")
+        self.assertEqual(self.capture.call_count, 3)
+
+        self.cache.invalidate()
+        self._probe("/dev/sda1")
+        self._probe("/dev/sdb1")
+        self.assertEqual(self.capture.call_count, 5)
+
+        # a device that is gone may have had its number taken by another
+        self.cache.invalidate("/dev/nonexistent")
+        self._probe("/dev/sdb1")
+        self.assertEqual(self.capture.call_count, 6)
+
+    def testAliases(self):
+        # any path to a device's node gets the same result
+        self._probe("/dev/sdb1")
+        self.assertEqual(self._probe("/dev/disk/by-label/b"), "dumpe2fs /dev/sdb1")
+        self.assertEqual(self.capture.call_count, 1)
+
+    def testSaveLoad(self):
+        (fd, path) = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+
+        self._probe("/dev/sda1")
+        self._probe("/dev/sdb1")
+        self.cache.save(path)
+
+        # only results for devices that have not changed since are used
+        self.generations[2065] = (2, 1.0)
+        cache = probecache.ProbeCache()
+        cache.load(path)
+        self.assertEqual(cache.captureOutput(["dumpe2fs", "/dev/sda1"],
+                                             "/dev/sda1", capture=self.capture),
+                         "dumpe2fs /dev/sda1")
+        self.assertEqual(self.capture.call_count, 2)
+        cache.captureOutput(["dumpe2fs", "/dev/sdb1"], "/dev/sdb1",
+                            capture=self.capture)
+        self.assertEqual(self.capture.call_count, 3)
+
+        # a missing or broken file is not an error, and neither are entries
+        # written by an older version
+        with open(path, "w") as f:
+            f.write("[")
+        cache.load(path)
+        cache.load(path + ".missing")
+        with open(path, "w") as f:
+            json.dump([[2049, [1, 0.0], ["tune2fs", None], "old"]], f)
+        cache.load(path)
+        cache.captureOutput(["tune2fs", "/dev/sda1"], "/dev/sda1",
+                            capture=self.capture)
+        self.assertEqual(self.capture.call_count, 4)
+
+    def testSaveFile(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "probes")
+
+        # a file planted where the results are written is left alone
+        target = os.path.join(tmpdir, "target")
+        open(target, "w").close()
+        os.symlink(target, path + ".tmp")
+
+        self._probe("/dev/sda1")
+        self.cache.save(path)
+        self.assertEqual(os.path.getsize(target), 0)
+        self.assertEqual(sorted(os.listdir(tmpdir)),
+                         ["probes", "probes.tmp", "target"])
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0600)
+
+        # a file that cannot be written is not an error
+        self.cache.save(os.path.join(tmpdir, "missing", "probes"))
+        self.assertEqual(sorted(os.listdir(tmpdir)),
+                         ["probes", "probes.tmp", "target"])
+
+    def testReport(self):
+        devnos = sorted(set(DEVICES.values()))
+        def report(devnos=devnos):
+            return self.cache.captureReport(["pvs"], devnos,
+                                            capture=self.capture)
+
+        self.assertEqual(report(), "pvs")
+        self.assertEqual(report(), "pvs")
+        self.assertEqual(self.capture.call_count, 1)
+
+        # udev saw a change to one of the devices
+        self.generations[2065] = (2, 1.0)
+        report()
+        self.assertEqual(self.capture.call_count, 2)
+
+        # a device came along
+        self.generations[2081] = (1, 0.0)
+        report(devnos + [2081])
+        self.assertEqual(self.capture.call_count, 3)
+
+        # without all the devices' numbers the report is never cached
+        report(None)
+        report(None)
+        self.assertEqual(self.capture.call_count, 5)
+
+        # the report goes away with any of its devices' results
+        report()
+        self.cache.invalidate("/dev/sda1")
+        report()
+        self.assertEqual(self.capture.call_count, 6)
+
+        (fd, path) = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        self.cache.save(path)
+
+        cache = probecache.ProbeCache()
+        cache.load(path)
+        cache.captureReport(["pvs"], devnos, capture=self.capture)
+        self.assertEqual(self.capture.call_count, 6)
+
+    def testVolatile(self):
+        (fd, path) = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+
+        # output that can change without udev noticing is cached but not saved
+        self._probe("/dev/sda1")
+        self.cache.captureOutput(["resize2fs", "-P", "/dev/sda1"], "/dev/sda1",
+                                 capture=self.capture, persistent=False)
+        self.cache.captureOutput(["ntfsresize", "-m", "/dev/sdb1"], "/dev/sdb1",
+                                 capture=self.capture, persistent=False)
+        self.cache.captureOutput(["resize2fs", "-P", "/dev/sda1"], "/dev/sda1",
+                                 capture=self.capture, persistent=False)
+        self.assertEqual(self.capture.call_count, 3)
+        self.cache.save(path)
+
+        cache = probecache.ProbeCache()
+        cache.load(path)
+        cache.captureOutput(["dumpe2fs", "/dev/sda1"], "/dev/sda1",
+                            capture=self.capture)
+        self.assertEqual(self.capture.call_count, 3)
+        cache.captureOutput(["resize2fs", "-P", "/dev/sda1"], "/dev/sda1",
+                            capture=self.capture, persistent=False)
+        cache.captureOutput(["ntfsresize", "-m", "/dev/sdb1"], "/dev/sdb1",
+                            capture=self.capture, persistent=False)
+        self.assertEqual(self.capture.call_count, 5)
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(ProbeCacheTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
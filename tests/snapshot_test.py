@@ -0,0 +1,173 @@
+#!/usr/bin/python
+
+import unittest
+from mock import Mock, patch
+
+import parted
+
+import blivet
+from blivet import devicefactory
+from blivet import partitioning
+from blivet.deviceaction import ActionCreateFormat
+from blivet.flags import flags
+from blivet.formats import getFormat
+from blivet.size import Size
+from blivet.util import ObjectID
+
+from blivet.devices import DiskDevice
+from blivet.devices import LVMVolumeGroupDevice
+from blivet.devices import LVMLogicalVolumeDevice
+from blivet.devices import PartitionDevice
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        flags.testing = True
+        self.storage = blivet.Blivet()
+        self.tree = self.storage.devicetree
+
+        self.sda = DiskDevice("sda", size=Size(spec="10 GiB"), exists=True)
+        self.sda.format = getFormat("lvmpv", device=self.sda.path,
+                                    exists=True)
+        self.tree._addDevice(self.sda)
+
+        self.vg = LVMVolumeGroupDevice("vg", parents=[self.sda], exists=True,
+                                       pvCount=1)
+        self.tree._addDevice(self.vg)
+
+        self.lv = LVMLogicalVolumeDevice("root", parents=[self.vg],
+                                         size=Size(spec="1 GiB"),
+                                         exists=True)
+        self.lv.format = getFormat("ext4", device=self.lv.path, exists=True)
+        self.tree._addDevice(self.lv)
+
+    def tearDown(self):
+        flags.testing = False
+
+    def testRestore(self):
+        snapshot = self.storage.takeSnapshot()
+        root_format = self.lv.format
+
+        self.tree._removeDevice(self.lv)
+        self.lv._name = "home"
+        self.lv.format = getFormat("xfs", device=self.lv.path)
+        swap = LVMLogicalVolumeDevice("swap", parents=[self.vg],
+                                      size=Size(spec="1 GiB"), exists=True)
+        self.tree._addDevice(swap)
+        self.assertEqual(self.vg.lvs, [swap])
+
+        snapshot.restore()
+        self.assertFalse(snapshot.active)
+        self.assertEqual(self.tree.devices, [self.sda, self.vg, self.lv])
+        self.assertEqual(self.vg.lvs, [self.lv])
+        self.assertEqual(self.vg.children, [self.lv])
+        self.assertEqual(self.lv.name, "vg-root")
+        self.assertIs(self.lv.format, root_format)
+        self.assertEqual(self.tree.getDeviceByName("vg-root"), self.lv)
+        self.assertIsNone(self.tree.getDeviceByName("vg-swap"))
+        self.assertIsNone(self.tree.getDeviceByName("vg-home"))
+        self.assertRaises(RuntimeError, snapshot.restore)
+
+    def testActions(self):
+        root_format = self.lv.format
+        canceled = ActionCreateFormat(self.lv,
+                                      getFormat("xfs", device=self.lv.path))
+        self.tree.registerAction(canceled)
+        xfs = self.lv.format
+        home = LVMLogicalVolumeDevice("home", parents=[self.vg],
+                                      size=Size(spec="1 GiB"), exists=True)
+        self.tree._addDevice(home)
+        xfs_home = ActionCreateFormat(home,
+                                      getFormat("xfs", device=home.path))
+        self.tree.registerAction(xfs_home)
+
+        snapshot = self.storage.takeSnapshot()
+        self.tree.cancelAction(canceled)
+        self.assertIs(self.lv.format, root_format)
+        self.assertEqual(self.tree.getDevicesByFormatType("ext4"), [self.lv])
+        registered = ActionCreateFormat(self.lv,
+                                        getFormat("swap", device=self.lv.path))
+        self.tree.registerAction(registered)
+        self.assertEqual(list(self.tree._actions), [xfs_home, registered])
+
+        snapshot.restore()
+        self.assertEqual(list(self.tree._actions), [canceled, xfs_home])
+        self.assertIs(self.lv.format, xfs)
+        self.assertEqual(self.tree.getDevicesByFormatType("xfs"),
+                         [self.lv, home])
+        self.assertEqual(self.tree.getDevicesByFormatType("ext4"), [])
+        self.assertEqual(self.tree.getDevicesByFormatType("swap"), [])
+
+    def testPartitions(self):
+        sdb = DiskDevice("sdb", size=Size(spec="10 GiB"), exists=True)
+        sdb.format = getFormat("disklabel", device=sdb.path, exists=True)
+        partition_attrs = {"path": "/dev/sdb1",
+                           "getLength.return_value": 1 << 30,
+                           "getDeviceNodeName.return_value": "sdb1"}
+        saved_partition = Mock(spec=parted.Partition, **partition_attrs)
+        saved_disk = Mock(spec=parted.Disk)
+        saved_disk.getPartitionByPath.return_value = saved_partition
+        sdb.format._partedDisk = Mock(spec=parted.Disk, maxPartitionLength=0,
+                                      **{"duplicate.return_value": saved_disk})
+        sdb.format._partedDevice = Mock(sectorSize=512)
+        self.tree._addDevice(sdb)
+
+        part = PartitionDevice("sdb1", parents=[sdb], size=Size(spec="1 GiB"))
+        part._partedPartition = Mock(spec=parted.Partition, **partition_attrs)
+        part.disk = sdb
+        self.tree._addDevice(part)
+
+        # allocating another partition changes the parted.Disk
+        snapshot = self.storage.takeSnapshot()
+        with patch.object(partitioning.parted, "Geometry"), \
+             patch.object(partitioning.parted, "Partition"), \
+             patch.object(partitioning.parted, "Constraint"):
+            partitioning.addPartition(sdb.format, None,
+                                      parted.PARTITION_NORMAL,
+                                      Size(spec="1 GiB"),
+                                      start=2099200, end=4196351)
+        self.assertTrue(sdb.format._partedDisk.addPartition.called)
+
+        snapshot.restore()
+        self.assertIs(sdb.format.partedDisk, saved_disk)
+        self.assertIs(part.partedPartition, saved_partition)
+
+    def testFactoryInterrupted(self):
+        factory = devicefactory.get_device_factory(self.storage,
+                                                   devicefactory.DEVICE_TYPE_LVM,
+                                                   Size(spec="1 GiB"),
+                                                   disks=[self.sda])
+        with patch.object(factory, "_configure", side_effect=KeyboardInterrupt):
+            self.assertRaises(KeyboardInterrupt, factory.configure)
+
+        self.assertEqual(blivet.snapshot._snapshots, [])
+
+    def testNextID(self):
+        next_id = ObjectID.nextID()
+        self.assertEqual(ObjectID.nextID(), next_id)
+        self.assertEqual(ObjectID().id, next_id)
+
+    def testRelease(self):
+        snapshot = self.storage.takeSnapshot()
+        self.lv.format = getFormat("xfs", device=self.lv.path)
+        snapshot.release()
+        self.assertFalse(snapshot.active)
+        self.assertEqual(self.lv.format.type, "xfs")
+
+    def testOnlyChangedObjectsSaved(self):
+        snapshot = self.storage.takeSnapshot()
+        self.lv.format.mountpoint = "/"
+        swap = LVMLogicalVolumeDevice("swap", parents=[self.vg],
+                                      size=Size(spec="1 GiB"), exists=True)
+        swap._name = "swap2"
+
+        saved = [obj for (obj, state) in snapshot._states.values()]
+        self.assertEqual(snapshot._journal, [])
+        self.assertIn(self.lv.format, saved)
+        self.assertIn(self.vg, saved)
+        self.assertNotIn(self.lv, saved)
+        self.assertNotIn(self.sda, saved)
+        self.assertNotIn(swap, saved)
+        snapshot.release()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -52,9 +52,46 @@ class TopologicalSortTestCase(unittest.TestCase):
         self.failUnless(check_order(order, graph),
                         "ordering constraints not satisfied")
 
+class TopologicalSortOrderTestCase(unittest.TestCase):
+    def testGraphUnchanged(self):
+        items = [1, 2, 3]
+        edges = [(1, 2), (2, 3)]
+        graph = blivet.tsort.create_graph(items, edges)
+        self.assertEqual(blivet.tsort.tsort(graph), [1, 2, 3])
+        self.assertEqual(graph['edges'], [(1, 2), (2, 3)])
+        self.assertEqual(graph['incoming'], {1: 0, 2: 1, 3: 1})
+
+        # sorting the same graph again gives the same result
+        self.assertEqual(blivet.tsort.tsort(graph), [1, 2, 3])
+
+    def testStable(self):
+        items = ['a', 'b', 'c', 'd', 'e']
+        edges = [('d', 'b')]
+        graph = blivet.tsort.create_graph(items, edges)
+        self.assertEqual(blivet.tsort.tsort(graph),
+                         ['e', 'd', 'b', 'c', 'a'])
+        self.assertEqual(blivet.tsort.tsort(graph, stable=True),
+                         ['a', 'c', 'd', 'b', 'e'])
+
+    def testCycleMembers(self):
+        items = [1, 2, 3, 4, 5, 6]
+        edges = [(1, 2), (2, 3), (3, 4), (4, 2), (4, 5), (6, 1)]
+        graph = blivet.tsort.create_graph(items, edges)
+        try:
+            blivet.tsort.tsort(graph)
+        except blivet.tsort.CyclicGraphError as e:
+            self.assertEqual(sorted(e.cycle), [2, 3, 4])
+            for (i, item) in enumerate(e.cycle):
+                child = e.cycle[(i + 1) % len(e.cycle)]
+                self.assertIn((item, child), edges)
+        else:
+            self.fail("cycle not detected")
 
 def suite():
-    return unittest.TestLoader().loadTestsFromTestCase(TopologicalSortTestCase)
+    loader = unittest.TestLoader()
+    suite1 = loader.loadTestsFromTestCase(TopologicalSortTestCase)
+    suite2 = loader.loadTestsFromTestCase(TopologicalSortOrderTestCase)
+    return unittest.TestSuite([suite1, suite2])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+import logging
+import time
+import unittest
+
+from blivet import util
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class RunProgramTestCase(unittest.TestCase):
+    def setUp(self):
+        self.handler = ListHandler()
+        self.level = util.program_log.level
+        util.program_log.setLevel(logging.DEBUG)
+        util.program_log.addHandler(self.handler)
+
+    def tearDown(self):
+        util.program_log.removeHandler(self.handler)
+        util.program_log.setLevel(self.level)
+
+    def testRunProgram(self):
+        self.assertEqual(util.run_program(["sh", "-c", "exit 3"]), 3)
+        self.assertEqual(util.capture_output(["echo", "hello"]), "hello\n")
+        self.assertEqual(util.run_program_and_capture_output(["echo", "hi"]),
+                         (0, "hi\n"))
+
+        result = util.run_program_timed(["sleep", "0.1"])
+        self.assertEqual(result.rc, 0)
+        self.assertGreaterEqual(result.elapsed, 0.1)
+
+        self.assertRaises(OSError, util.run_program, ["/nonexistent/program"])
+
+    def testRunPrograms(self):
+        argvs = [["sh", "-c", "echo %d; sleep 0.5; echo %d" % (i, i)]
+                 for i in range(4)]
+        start = time.time()
+        results = util.run_programs(argvs, workers=4)
+        self.assertLess(time.time() - start, 1.5)
+
+        self.assertEqual([r.out for r in results],
+                         ["%d\n%d\n" % (i, i) for i in range(4)])
+
+        # each program's output is logged in one block
+        for i in range(4):
+            start = self.handler.messages.index("Running... %s"
+                                                % " ".join(argvs[i]))
+            self.assertEqual(self.handler.messages[start + 1:start + 3],
+                             [str(i), str(i)])
+            self.assertTrue(self.handler.messages[start + 3].startswith("Return code: 0"))
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(RunProgramTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()